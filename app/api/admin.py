@@ -5,13 +5,31 @@ from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_
-from app.core.database import get_db
+from sqlalchemy import select, func, case
+from app.core.database import get_db, ahora_utc
 from app.core.config import settings
 from app.models.user import User
 from app.models.transaction import Transaction, EstadoTransaccion
-from app.models.generation import Generation, EstadoGeneracion
-from app.models.music_generation import MusicGeneration, EstadoMusicGeneration
+from app.models.music_generation import MusicGeneration
+from app.models.estadistica import EstadisticaDiaria
+from app.services.http_clients import clientes_upstream
+from app.services.openai_cache import cache_openai
+from app.services.resilience import estado_circuitos
+from app.services.music_scheduler import planificador_musica
+from app.services.eventos import bus_eventos
+from app.services.music_jobs import tareas_musica
+from app.services.escrituras import cola_escrituras
+from app.services.admission import limitador
+from app.services.paginacion import paginar, recortar_pagina, contar, CursorInvalido
+from app.services.estadisticas import (
+    USUARIOS,
+    PAGOS,
+    CREDITOS_VENDIDOS,
+    GENERACIONES_COMPLETADAS,
+    GENERACIONES_FALLIDAS,
+    MUSICA_COMPLETADAS,
+    MUSICA_FALLIDAS
+)
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
@@ -36,151 +54,104 @@ async def obtener_estadisticas(
 ):
     """Obtiene estadísticas generales del sistema"""
 
-    # Fechas para cálculos
-    ahora = datetime.utcnow()
-    hace_7_dias = ahora - timedelta(days=7)
-    hace_30_dias = ahora - timedelta(days=30)
-    inicio_hoy = ahora.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Fechas para cálculos (las estadísticas diarias van por día UTC)
+    ahora = ahora_utc()
+    hoy = ahora.date()
+    hace_7_dias = hoy - timedelta(days=7)
+    hace_30_dias = hoy - timedelta(days=30)
 
-    # ========== USUARIOS ==========
-    # Total usuarios
-    total_usuarios = await db.scalar(select(func.count(User.id)))
+    # ========== ESTADÍSTICAS DIARIAS ==========
+    # Un solo agregado sobre estadisticas_diarias (una fila por día, métrica
+    # y estilo/género), en vez de COUNT/SUM sobre las tablas completas
+    def desde(columna, fecha):
+        return func.sum(case((EstadisticaDiaria.fecha >= fecha, columna), else_=0))
 
-    # Usuarios últimos 7 días
-    usuarios_7_dias = await db.scalar(
-        select(func.count(User.id)).where(User.created_at >= hace_7_dias)
-    )
-
-    # Usuarios hoy
-    usuarios_hoy = await db.scalar(
-        select(func.count(User.id)).where(User.created_at >= inicio_hoy)
-    )
-
-    # ========== TRANSACCIONES ==========
-    # Total transacciones completadas
-    total_transacciones = await db.scalar(
-        select(func.count(Transaction.id)).where(
-            Transaction.estado == EstadoTransaccion.COMPLETADA.value
-        )
-    )
-
-    # Ingresos totales MXN
-    ingresos_totales = await db.scalar(
-        select(func.sum(Transaction.monto_mxn)).where(
-            Transaction.estado == EstadoTransaccion.COMPLETADA.value
-        )
-    ) or 0
-
-    # Ingresos últimos 30 días
-    ingresos_30_dias = await db.scalar(
-        select(func.sum(Transaction.monto_mxn)).where(
-            and_(
-                Transaction.estado == EstadoTransaccion.COMPLETADA.value,
-                Transaction.created_at >= hace_30_dias
-            )
-        )
-    ) or 0
-
-    # Ingresos últimos 7 días
-    ingresos_7_dias = await db.scalar(
-        select(func.sum(Transaction.monto_mxn)).where(
-            and_(
-                Transaction.estado == EstadoTransaccion.COMPLETADA.value,
-                Transaction.created_at >= hace_7_dias
-            )
-        )
-    ) or 0
-
-    # Ingresos hoy
-    ingresos_hoy = await db.scalar(
-        select(func.sum(Transaction.monto_mxn)).where(
-            and_(
-                Transaction.estado == EstadoTransaccion.COMPLETADA.value,
-                Transaction.created_at >= inicio_hoy
-            )
-        )
-    ) or 0
-
-    # Total créditos vendidos
-    creditos_vendidos = await db.scalar(
-        select(func.sum(Transaction.creditos)).where(
-            Transaction.estado == EstadoTransaccion.COMPLETADA.value
-        )
-    ) or 0
-
-    # ========== GENERACIONES ==========
-    # Total generaciones
-    total_generaciones = await db.scalar(select(func.count(Generation.id)))
-
-    # Generaciones completadas
-    generaciones_completadas = await db.scalar(
-        select(func.count(Generation.id)).where(
-            Generation.estado == EstadoGeneracion.COMPLETADA.value
-        )
-    )
-
-    # Generaciones últimos 7 días
-    generaciones_7_dias = await db.scalar(
-        select(func.count(Generation.id)).where(Generation.created_at >= hace_7_dias)
-    )
-
-    # Generaciones hoy
-    generaciones_hoy = await db.scalar(
-        select(func.count(Generation.id)).where(Generation.created_at >= inicio_hoy)
-    )
-
-    # ========== MÚSICA (SOUNDAI) ==========
-    # Total canciones generadas
-    total_musica = await db.scalar(select(func.count(MusicGeneration.id)))
-
-    # Canciones completadas
-    musica_completadas = await db.scalar(
-        select(func.count(MusicGeneration.id)).where(
-            MusicGeneration.estado == EstadoMusicGeneration.COMPLETADA.value
+    resultado = await db.execute(
+        select(
+            EstadisticaDiaria.metrica,
+            EstadisticaDiaria.dimension,
+            func.sum(EstadisticaDiaria.cantidad).label("total"),
+            desde(EstadisticaDiaria.cantidad, hace_7_dias).label("ultimos_7_dias"),
+            desde(EstadisticaDiaria.cantidad, hoy).label("hoy"),
+            func.sum(EstadisticaDiaria.suma).label("suma"),
+            desde(EstadisticaDiaria.suma, hace_30_dias).label("suma_30_dias"),
+            desde(EstadisticaDiaria.suma, hace_7_dias).label("suma_7_dias"),
+            desde(EstadisticaDiaria.suma, hoy).label("suma_hoy")
         )
+        .group_by(EstadisticaDiaria.metrica, EstadisticaDiaria.dimension)
     )
+    filas = resultado.all()
+
+    def totales(*metricas) -> dict:
+        """Suma las filas de las métricas indicadas (todas sus dimensiones)"""
+        campos = ("total", "ultimos_7_dias", "hoy", "suma", "suma_30_dias", "suma_7_dias", "suma_hoy")
+        acumulado = dict.fromkeys(campos, 0)
+        for fila in filas:
+            if fila.metrica in metricas:
+                for campo in campos:
+                    acumulado[campo] += getattr(fila, campo) or 0
+        return acumulado
+
+    def por_dimension(metrica: str) -> dict:
+        """dimension -> total de la métrica"""
+        return {fila.dimension: fila.total or 0 for fila in filas if fila.metrica == metrica}
+
+    usuarios = totales(USUARIOS)
+    pagos = totales(PAGOS)
+    creditos_vendidos = totales(CREDITOS_VENDIDOS)["total"]
+
+    # Generaciones y canciones se cuentan al terminar (completadas + fallidas)
+    generaciones = totales(GENERACIONES_COMPLETADAS, GENERACIONES_FALLIDAS)
+    generaciones_completadas = totales(GENERACIONES_COMPLETADAS)["total"]
+    musica = totales(MUSICA_COMPLETADAS, MUSICA_FALLIDAS)
+    musica_completadas = totales(MUSICA_COMPLETADAS)["total"]
 
-    # Canciones últimos 7 días
-    musica_7_dias = await db.scalar(
-        select(func.count(MusicGeneration.id)).where(MusicGeneration.created_at >= hace_7_dias)
-    )
-
-    # Canciones hoy
-    musica_hoy = await db.scalar(
-        select(func.count(MusicGeneration.id)).where(MusicGeneration.created_at >= inicio_hoy)
-    )
+    # ========== ESTILOS POPULARES ==========
+    completadas_por_estilo = por_dimension(GENERACIONES_COMPLETADAS)
+    fallidas_por_estilo = por_dimension(GENERACIONES_FALLIDAS)
+    estilos_populares = []
+    for estilo in set(completadas_por_estilo) | set(fallidas_por_estilo):
+        completadas = completadas_por_estilo.get(estilo, 0)
+        total = completadas + fallidas_por_estilo.get(estilo, 0)
+        estilos_populares.append({
+            "estilo": estilo,
+            "count": total,
+            "tasa_exito": round(completadas / max(total, 1) * 100, 1)
+        })
+    estilos_populares.sort(key=lambda e: e["count"], reverse=True)
 
     # Estilos de música populares
-    estilos_musica_query = await db.execute(
-        select(
-            MusicGeneration.genero,
-            func.count(MusicGeneration.id).label('count')
-        )
-        .where(MusicGeneration.genero.isnot(None))
-        .group_by(MusicGeneration.genero)
-        .order_by(func.count(MusicGeneration.id).desc())
-        .limit(10)
-    )
+    musica_por_genero = por_dimension(MUSICA_COMPLETADAS)
+    for genero, total in por_dimension(MUSICA_FALLIDAS).items():
+        musica_por_genero[genero] = musica_por_genero.get(genero, 0) + total
     estilos_musica = [
-        {"estilo": e.genero or "Sin género", "count": e.count}
-        for e in estilos_musica_query.all()
-    ]
+        {"estilo": genero, "count": total}
+        for genero, total in sorted(musica_por_genero.items(), key=lambda e: e[1], reverse=True)
+        if genero
+    ][:10]
 
     # Canciones recientes
     musica_reciente_query = await db.execute(
-        select(MusicGeneration, User.email)
+        select(
+            MusicGeneration.id,
+            MusicGeneration.titulo,
+            MusicGeneration.genero,
+            MusicGeneration.estado,
+            MusicGeneration.created_at,
+            User.email
+        )
         .join(User, MusicGeneration.user_id == User.id)
         .order_by(MusicGeneration.created_at.desc())
         .limit(10)
     )
     musica_reciente = [
         {
-            "id": m.MusicGeneration.id,
+            "id": m.id,
             "email": m.email,
-            "titulo": m.MusicGeneration.titulo,
-            "genero": m.MusicGeneration.genero or "Auto",
-            "estado": m.MusicGeneration.estado,
-            "fecha": m.MusicGeneration.created_at.isoformat() if m.MusicGeneration.created_at else None
+            "titulo": m.titulo,
+            "genero": m.genero or "Auto",
+            "estado": m.estado,
+            "fecha": m.created_at.isoformat() if m.created_at else None
         }
         for m in musica_reciente_query.all()
     ]
@@ -202,23 +173,15 @@ async def obtener_estadisticas(
         for u in top_usuarios_query.all()
     ]
 
-    # ========== ESTILOS POPULARES ==========
-    estilos_query = await db.execute(
-        select(
-            Generation.estilo,
-            func.count(Generation.id).label('count')
-        )
-        .group_by(Generation.estilo)
-        .order_by(func.count(Generation.id).desc())
-    )
-    estilos_populares = [
-        {"estilo": e.estilo, "count": e.count}
-        for e in estilos_query.all()
-    ]
-
     # ========== TRANSACCIONES RECIENTES ==========
     transacciones_recientes_query = await db.execute(
-        select(Transaction, User.email)
+        select(
+            Transaction.id,
+            Transaction.creditos,
+            Transaction.monto_mxn,
+            Transaction.created_at,
+            User.email
+        )
         .join(User, Transaction.user_id == User.id)
         .where(Transaction.estado == EstadoTransaccion.COMPLETADA.value)
         .order_by(Transaction.created_at.desc())
@@ -226,42 +189,42 @@ async def obtener_estadisticas(
     )
     transacciones_recientes = [
         {
-            "id": t.Transaction.id,
+            "id": t.id,
             "email": t.email,
-            "creditos": t.Transaction.creditos,
-            "monto_mxn": t.Transaction.monto_mxn,
-            "fecha": t.Transaction.created_at.isoformat() if t.Transaction.created_at else None
+            "creditos": t.creditos,
+            "monto_mxn": t.monto_mxn,
+            "fecha": t.created_at.isoformat() if t.created_at else None
         }
         for t in transacciones_recientes_query.all()
     ]
 
     return {
         "usuarios": {
-            "total": total_usuarios or 0,
-            "ultimos_7_dias": usuarios_7_dias or 0,
-            "hoy": usuarios_hoy or 0
+            "total": usuarios["total"],
+            "ultimos_7_dias": usuarios["ultimos_7_dias"],
+            "hoy": usuarios["hoy"]
         },
         "ingresos": {
-            "total_mxn": round(ingresos_totales, 2),
-            "ultimos_30_dias_mxn": round(ingresos_30_dias, 2),
-            "ultimos_7_dias_mxn": round(ingresos_7_dias, 2),
-            "hoy_mxn": round(ingresos_hoy, 2),
-            "total_transacciones": total_transacciones or 0,
-            "creditos_vendidos": creditos_vendidos or 0
+            "total_mxn": round(pagos["suma"], 2),
+            "ultimos_30_dias_mxn": round(pagos["suma_30_dias"], 2),
+            "ultimos_7_dias_mxn": round(pagos["suma_7_dias"], 2),
+            "hoy_mxn": round(pagos["suma_hoy"], 2),
+            "total_transacciones": pagos["total"],
+            "creditos_vendidos": creditos_vendidos
         },
         "generaciones": {
-            "total": total_generaciones or 0,
-            "completadas": generaciones_completadas or 0,
-            "ultimos_7_dias": generaciones_7_dias or 0,
-            "hoy": generaciones_hoy or 0,
-            "tasa_exito": round((generaciones_completadas or 0) / max(total_generaciones or 1, 1) * 100, 1)
+            "total": generaciones["total"],
+            "completadas": generaciones_completadas,
+            "ultimos_7_dias": generaciones["ultimos_7_dias"],
+            "hoy": generaciones["hoy"],
+            "tasa_exito": round(generaciones_completadas / max(generaciones["total"], 1) * 100, 1)
         },
         "musica": {
-            "total": total_musica or 0,
-            "completadas": musica_completadas or 0,
-            "ultimos_7_dias": musica_7_dias or 0,
-            "hoy": musica_hoy or 0,
-            "tasa_exito": round((musica_completadas or 0) / max(total_musica or 1, 1) * 100, 1)
+            "total": musica["total"],
+            "completadas": musica_completadas,
+            "ultimos_7_dias": musica["ultimos_7_dias"],
+            "hoy": musica["hoy"],
+            "tasa_exito": round(musica_completadas / max(musica["total"], 1) * 100, 1)
         },
         "top_usuarios": top_usuarios,
         "estilos_populares": estilos_populares,
@@ -276,29 +239,38 @@ async def obtener_estadisticas(
 async def listar_usuarios(
     _: bool = Depends(verificar_admin),
     db: AsyncSession = Depends(get_db),
-    pagina: int = Query(1, ge=1),
-    por_pagina: int = Query(20, ge=1, le=100)
+    cursor: Optional[str] = None,
+    por_pagina: int = Query(20, ge=1, le=100),
+    incluir_total: bool = True
 ):
-    """Lista todos los usuarios con paginación"""
-
-    offset = (pagina - 1) * por_pagina
-
-    # Total
-    total = await db.scalar(select(func.count(User.id)))
+    """Lista todos los usuarios (más recientes primero) con paginación por cursor"""
+
+    try:
+        usuarios_query = await db.execute(
+            paginar(
+                select(
+                    User.id,
+                    User.email,
+                    User.nombre,
+                    User.creditos,
+                    User.creditos_usados,
+                    User.google_id,
+                    User.is_active,
+                    User.created_at
+                ),
+                User, cursor, por_pagina
+            )
+        )
+    except CursorInvalido as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    usuarios, next_cursor = recortar_pagina(usuarios_query.all(), por_pagina)
 
-    # Usuarios
-    usuarios_query = await db.execute(
-        select(User)
-        .order_by(User.created_at.desc())
-        .offset(offset)
-        .limit(por_pagina)
-    )
-    usuarios = usuarios_query.scalars().all()
+    total = await contar(db, User) if incluir_total else None
 
     return {
         "total": total,
-        "pagina": pagina,
         "por_pagina": por_pagina,
+        "next_cursor": next_cursor,
         "usuarios": [
             {
                 "id": u.id,
@@ -313,3 +285,21 @@ async def listar_usuarios(
             for u in usuarios
         ]
     }
+
+
+@router.get("/upstreams")
+async def estado_upstreams(
+    _: bool = Depends(verificar_admin)
+):
+    """Pool de conexiones HTTP, circuitos y caché de OpenAI (por worker)"""
+    return {
+        "pool_http": clientes_upstream.metricas(),
+        "circuitos": estado_circuitos(),
+        "admision": await limitador.estadisticas(),
+        "planificador_musica": planificador_musica.estadisticas(),
+        "eventos": bus_eventos.estadisticas(),
+        "tareas_musica": tareas_musica.metricas(),
+        "cola_escrituras": cola_escrituras.metricas(),
+        "cache_openai": cache_openai.estadisticas(),
+        "generado_en": datetime.utcnow().isoformat()
+    }
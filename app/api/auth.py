@@ -15,6 +15,7 @@ from app.core.security import (
 )
 from app.core.config import settings
 from app.models.user import User
+from app.services.estadisticas import sumar_estadistica, USUARIOS
 from app.api.schemas import (
     RegistroRequest,
     LoginRequest,
@@ -68,6 +69,7 @@ async def registrar_usuario(
     )
 
     db.add(usuario)
+    await sumar_estadistica(db, USUARIOS)
     await db.commit()
     await db.refresh(usuario)
 
@@ -213,6 +215,7 @@ async def google_callback(request: Request, db: AsyncSession = Depends(get_db)):
                 is_verified=True  # Google ya verificó el email
             )
             db.add(usuario)
+            await sumar_estadistica(db, USUARIOS)
             await db.commit()
             await db.refresh(usuario)
 
@@ -0,0 +1,122 @@
+"""
+API de eventos en tiempo real (Server-Sent Events)
+
+Reemplaza el polling de estado: el cliente abre una sola conexión y recibe
+las transiciones de sus generaciones de imagen y música.
+"""
+import asyncio
+import json
+
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.core.security import verificar_token
+from app.models.user import User
+from app.services.eventos import bus_eventos, MARGEN_IDS
+
+router = APIRouter(prefix="/eventos", tags=["Eventos"])
+
+
+async def _usuario_del_token(token: str) -> User:
+    """
+    Valida el token una sola vez al abrir la conexión. EventSource no
+    permite headers, por eso el JWT llega como query param.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="No se pudo validar las credenciales"
+    )
+
+    payload = verificar_token(token) if token else None
+    if payload is None:
+        raise credentials_exception
+
+    try:
+        user_id = int(payload.get("sub"))
+    except (ValueError, TypeError):
+        raise credentials_exception
+
+    # Sesión corta: la conexión SSE no retiene una conexión a la DB
+    async with async_session_maker() as db:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+
+    if user is None or not user.is_active:
+        raise credentials_exception
+    return user
+
+
+def _formatear(evento: dict) -> str:
+    return f"id: {evento['id']}\nevent: estado\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+
+@router.get("")
+async def stream_eventos(
+    request: Request,
+    token: str = Query("")
+):
+    """
+    Stream SSE con los cambios de estado de las generaciones del usuario.
+
+    Cada evento: {"id", "tipo": "imagen"|"musica", "objeto_id", "estado", ...}.
+    Al reconectar, el navegador envía Last-Event-ID y se reenvían los
+    eventos perdidos.
+    """
+    usuario = await _usuario_del_token(token)
+
+    try:
+        ultimo_id = int(request.headers.get("last-event-id", "0"))
+    except ValueError:
+        ultimo_id = 0
+
+    async def generar():
+        cola = bus_eventos.suscribir(usuario.id)
+        # Ids enviados en esta conexión: el reenvío y la cola pueden traer el
+        # mismo evento, y en PostgreSQL un id menor puede llegar después
+        # (ver app.services.eventos)
+        enviados = set()
+        mayor = ultimo_id
+
+        def pendiente(evento: dict) -> bool:
+            nonlocal enviados, mayor
+            if evento["id"] in enviados or evento["id"] <= mayor - MARGEN_IDS:
+                return False
+            mayor = max(mayor, evento["id"])
+            enviados = {i for i in enviados if i > mayor - MARGEN_IDS}
+            enviados.add(evento["id"])
+            return True
+
+        try:
+            yield "retry: 3000\n\n"
+
+            if ultimo_id:
+                for evento in await bus_eventos.desde(usuario.id, ultimo_id):
+                    if pendiente(evento):
+                        yield _formatear(evento)
+
+            while True:
+                try:
+                    evento = await asyncio.wait_for(
+                        cola.get(), timeout=settings.EVENTOS_KEEPALIVE_SEGUNDOS
+                    )
+                except asyncio.TimeoutError:
+                    # Mantiene viva la conexión a través de nginx
+                    yield ": keepalive\n\n"
+                    continue
+
+                if pendiente(evento):
+                    yield _formatear(evento)
+        finally:
+            bus_eventos.cancelar(usuario.id, cola)
+
+    return StreamingResponse(
+        generar(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
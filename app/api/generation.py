@@ -2,27 +2,41 @@
 Rutas de generación de imágenes
 """
 import os
-import base64
 import uuid
-from datetime import datetime
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, status, UploadFile, File, Form
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
+from sqlalchemy.exc import IntegrityError
 from app.core.database import get_db
 from app.core.security import obtener_usuario_actual
 from app.core.config import settings
 from app.models.user import User
 from app.models.generation import Generation, EstadoGeneracion
+from app.models.job import GenerationJob, EstadoTrabajo
 from app.services.viral_styles import obtener_todos_estilos, obtener_estilo, obtener_categorias
-from app.services.generation import generation_service, guardar_imagen
+from app.services.generation import guardar_upload, huella_upload, extension_para_mime
+from app.services.jobs import encolar_generacion, contar_trabajos_pendientes
+from app.services.admission import limitador
+from app.services.paginacion import paginar, recortar_pagina, contar, CursorInvalido
+from app.services.creditos import reservar_creditos, CreditosInsuficientesError
+from app.services.singleflight import (
+    TIPO_IMAGEN,
+    clave_solicitud,
+    buscar_en_vuelo,
+    registrar_en_vuelo,
+    purgar_en_vuelo
+)
 from app.api.schemas import (
     CategoriaResponse,
     EstiloResponse,
     ImagenesEstilosResponse,
     GeneracionCompletaResponse,
     GeneracionResponse,
-    HistorialResponse
+    HistorialResponse,
+    TrabajoResponse,
+    LoteResponse,
+    EstadoLoteResponse
 )
 from pathlib import Path
 
@@ -192,29 +206,25 @@ async def crear_generacion(
     precio: Optional[str] = Form(None),
     imagen_producto: UploadFile = File(...),
     logo: Optional[UploadFile] = File(None),
+    sin_cache: bool = Form(False),
     usuario: User = Depends(obtener_usuario_actual),
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Genera una imagen viral y copy para redes sociales.
+    Encola la generación de una imagen viral y copy para redes sociales.
 
     Requiere:
     - 1 crédito
     - Imagen del producto (obligatoria)
     - Logo (opcional)
+    - sin_cache: fuerza un análisis/copy nuevo aunque el producto ya se haya generado
 
-    Retorna:
-    - Imagen generada en base64
-    - Copy para Facebook e Instagram
-    - Hashtags sugeridos
-    """
-    # Verificar créditos
-    if not usuario.tiene_creditos(1):
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail="No tienes suficientes créditos. Compra más para continuar."
-        )
+    Retorna inmediatamente el ID del trabajo; el resultado (imagen,
+    copy y hashtags) se consulta en GET /generacion/trabajo/{trabajo_id}.
 
+    Una solicitud idéntica (doble clic, reintento) mientras la original
+    sigue en curso recibe esa misma generación sin cobrar otro crédito.
+    """
     # Validar estilo
     estilo = obtener_estilo(estilo_id)
     if not estilo:
@@ -230,153 +240,391 @@ async def crear_generacion(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Tipo de imagen no permitido. Usa JPG, PNG o WebP."
         )
+    if logo and logo.content_type not in tipos_permitidos:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Tipo de logo no permitido. Usa JPG, PNG o WebP."
+        )
 
-    try:
-        # Leer imagen del producto
-        imagen_bytes = await imagen_producto.read()
-        imagen_b64 = base64.b64encode(imagen_bytes).decode("ascii")
-        imagen_mime = imagen_producto.content_type
-
-        # Leer logo si existe
-        logo_b64 = None
-        logo_mime = "image/png"
-        if logo:
-            if logo.content_type not in tipos_permitidos:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Tipo de logo no permitido. Usa JPG, PNG o WebP."
-                )
-            logo_bytes = await logo.read()
-            logo_b64 = base64.b64encode(logo_bytes).decode("ascii")
-            logo_mime = logo.content_type
+    # Singleflight: reutilizar una generación idéntica en curso
+    clave = clave_solicitud(usuario.id, TIPO_IMAGEN, {
+        "estilo": estilo_id,
+        "nombre_producto": nombre_producto,
+        "descripcion_producto": descripcion_producto,
+        "marca": marca,
+        "precio": precio,
+        "sin_cache": sin_cache,
+        "imagen": await huella_upload(imagen_producto),
+        "logo": await huella_upload(logo) if logo else None
+    })
+    existente = await buscar_en_vuelo(db, clave)
+    if existente:
+        return await _respuesta_en_vuelo(db, existente, usuario)
+
+    # Verificar créditos
+    if not usuario.tiene_creditos(1):
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail="No tienes suficientes créditos. Compra más para continuar."
+        )
 
-        # Crear registro de generación
+    await _verificar_backlog(db)
+
+    # Los uploads se escriben antes de abrir la transacción: en SQLite el
+    # lock de escritura se toma con el primer INSERT y no debe esperar al disco
+    ruta_imagen_original, ruta_logo = await _guardar_uploads(usuario.id, imagen_producto, logo)
+
+    try:
+        # Una sola transacción: generación, reserva del crédito, singleflight y trabajo
         generacion = Generation(
             user_id=usuario.id,
             nombre_producto=nombre_producto,
             descripcion_producto=descripcion_producto,
             marca=marca,
             estilo=estilo_id,
-            estado=EstadoGeneracion.PROCESANDO.value
+            imagen_producto_path=ruta_imagen_original,
+            logo_path=ruta_logo,
+            estado=EstadoGeneracion.PENDIENTE.value
         )
         db.add(generacion)
+        await db.flush()
+
+        # Reservar el crédito (UPDATE condicional); se confirma o libera al terminar
+        await reservar_creditos(db, usuario, TIPO_IMAGEN, [generacion.id])
+        await purgar_en_vuelo(db, usuario.id, clave, TIPO_IMAGEN)
+        registrar_en_vuelo(db, clave, usuario.id, TIPO_IMAGEN, generacion.id)
+
+        trabajo = encolar_generacion(db, generacion, {
+            "imagen_path": ruta_imagen_original,
+            "imagen_mime": imagen_producto.content_type,
+            "logo_path": ruta_logo,
+            "logo_mime": logo.content_type if logo else "image/png",
+            "precio": precio or "",
+            "sin_cache": sin_cache
+        })
         await db.commit()
-        await db.refresh(generacion)
 
-        # Guardar imagen original del producto
-        nombre_archivo_original = f"{generacion.id}_original_{uuid.uuid4().hex[:8]}.png"
-        ruta_imagen_original = guardar_imagen(imagen_b64, nombre_archivo_original)
-        generacion.imagen_producto_path = ruta_imagen_original
-        await db.commit()
+        return GeneracionCompletaResponse(
+            exito=True,
+            mensaje="Generación en cola. Consulta el estado con el ID del trabajo.",
+            generacion_id=generacion.id,
+            trabajo_id=trabajo.id,
+            estado=generacion.estado,
+            creditos_restantes=usuario.creditos
+        )
 
-        # Usar crédito
-        usuario.usar_credito()
-        await db.commit()
+    except CreditosInsuficientesError:
+        # Otra solicitud del mismo usuario gastó el saldo mientras tanto
+        await db.rollback()
+        _eliminar_archivos(ruta_imagen_original, ruta_logo)
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail="No tienes suficientes créditos. Compra más para continuar."
+        )
+    except IntegrityError:
+        # Otro worker registró la misma solicitud primero: nada se cobró aquí
+        await db.rollback()
+        _eliminar_archivos(ruta_imagen_original, ruta_logo)
+        await db.refresh(usuario)
+        existente = await buscar_en_vuelo(db, clave)
+        if existente:
+            return await _respuesta_en_vuelo(db, existente, usuario)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Ya hay una solicitud idéntica en proceso. Intenta de nuevo."
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        # Nada se confirmó: el crédito no se consumió
+        await db.rollback()
+        _eliminar_archivos(ruta_imagen_original, ruta_logo)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error inesperado: {str(e)}"
+        )
 
-        # Generar contenido
-        resultado = await generation_service.generar_contenido_completo(
-            estilo_id=estilo_id,
-            nombre_producto=nombre_producto,
-            descripcion_producto=descripcion_producto or "",
-            marca=marca or "",
-            precio=precio or "",
-            imagen_producto_b64=imagen_b64,
-            logo_b64=logo_b64,
-            imagen_mime=imagen_mime,
-            logo_mime=logo_mime
+
+@router.post("/crear-lote", response_model=LoteResponse)
+async def crear_lote(
+    estilos: List[str] = Form(..., description="IDs de estilo (campo repetido o separados por coma)"),
+    nombre_producto: str = Form(...),
+    descripcion_producto: Optional[str] = Form(None),
+    marca: Optional[str] = Form(None),
+    precio: Optional[str] = Form(None),
+    imagen_producto: UploadFile = File(...),
+    logo: Optional[UploadFile] = File(None),
+    sin_cache: bool = Form(False),
+    usuario: User = Depends(obtener_usuario_actual),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Encola el mismo producto en varios estilos con un solo upload.
+
+    Requiere:
+    - 1 crédito por estilo (si un estilo falla se devuelve su crédito)
+    - Imagen del producto (obligatoria)
+    - Logo (opcional)
+
+    El worker genera los prompts de todos los estilos y el copy con una sola
+    llamada a OpenAI. Cada estilo queda disponible en cuanto termina:
+    consultar GET /generacion/lote/{lote_id}.
+    """
+    # Normalizar lista de estilos (sin duplicados, en orden)
+    estilo_ids = list(dict.fromkeys(
+        e.strip() for valor in estilos for e in valor.split(",") if e.strip()
+    ))
+
+    if not estilo_ids or len(estilo_ids) > settings.LOTE_MAX_ESTILOS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Selecciona entre 1 y {settings.LOTE_MAX_ESTILOS} estilos"
         )
 
-        if resultado.get("exito"):
-            # Guardar imagen generada
-            nombre_archivo = f"{generacion.id}_{uuid.uuid4().hex[:8]}.png"
-            ruta_imagen = guardar_imagen(resultado["imagen_b64"], nombre_archivo)
-
-            # Actualizar generación
-            generacion.estado = EstadoGeneracion.COMPLETADA.value
-            generacion.imagen_generada_path = ruta_imagen
-            generacion.prompt_generado = resultado.get("prompt_usado")
-            generacion.copy_facebook = resultado.get("copy_facebook")
-            generacion.hashtags_facebook = resultado.get("hashtags_facebook")
-            generacion.copy_instagram = resultado.get("copy_instagram")
-            generacion.hashtags_instagram = resultado.get("hashtags_instagram")
-            generacion.tiempo_procesamiento_ms = resultado.get("tiempo_ms")
-            generacion.completed_at = datetime.utcnow()
-
-            await db.commit()
-
-            return GeneracionCompletaResponse(
-                exito=True,
-                mensaje="¡Imagen generada exitosamente!",
-                generacion_id=generacion.id,
-                imagen_base64=resultado["imagen_b64"],
-                copy_facebook=resultado.get("copy_facebook"),
-                hashtags_facebook=resultado.get("hashtags_facebook"),
-                copy_instagram=resultado.get("copy_instagram"),
-                hashtags_instagram=resultado.get("hashtags_instagram"),
-                creditos_restantes=usuario.creditos,
-                tiempo_ms=resultado.get("tiempo_ms")
-            )
-        else:
-            # Error en generación - devolver crédito
-            usuario.creditos += 1
-            usuario.creditos_usados -= 1
-            generacion.estado = EstadoGeneracion.ERROR.value
-            generacion.error_mensaje = resultado.get("error", "Error desconocido")
-            await db.commit()
-
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Error al generar: {resultado.get('error')}"
+    from app.services.viral_styles import VIRAL_STYLES
+    invalidos = [e for e in estilo_ids if e not in VIRAL_STYLES]
+    if invalidos:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Estilos no válidos: {', '.join(invalidos)}"
+        )
+
+    # Verificar créditos (uno por estilo)
+    if not usuario.tiene_creditos(len(estilo_ids)):
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Necesitas {len(estilo_ids)} créditos para generar {len(estilo_ids)} estilos."
+        )
+
+    # Validar tipo de archivo
+    tipos_permitidos = ["image/jpeg", "image/png", "image/webp"]
+    if imagen_producto.content_type not in tipos_permitidos:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Tipo de imagen no permitido. Usa JPG, PNG o WebP."
+        )
+    if logo and logo.content_type not in tipos_permitidos:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Tipo de logo no permitido. Usa JPG, PNG o WebP."
+        )
+
+    await _verificar_backlog(db)
+
+    # Un solo upload compartido por todas las generaciones del lote,
+    # escrito antes de abrir la transacción
+    ruta_imagen_original, ruta_logo = await _guardar_uploads(usuario.id, imagen_producto, logo)
+
+    try:
+        # Una generación por estilo
+        generaciones = [
+            Generation(
+                user_id=usuario.id,
+                nombre_producto=nombre_producto,
+                descripcion_producto=descripcion_producto,
+                marca=marca,
+                estilo=estilo_id,
+                imagen_producto_path=ruta_imagen_original,
+                logo_path=ruta_logo,
+                estado=EstadoGeneracion.PENDIENTE.value
             )
+            for estilo_id in estilo_ids
+        ]
+        db.add_all(generaciones)
+        await db.flush()
+
+        # Un crédito reservado por estilo, en un solo UPDATE condicional
+        await reservar_creditos(db, usuario, TIPO_IMAGEN, [g.id for g in generaciones])
+
+        payload = {
+            "imagen_path": ruta_imagen_original,
+            "imagen_mime": imagen_producto.content_type,
+            "logo_path": ruta_logo,
+            "logo_mime": logo.content_type if logo else "image/png",
+            "precio": precio or "",
+            "sin_cache": sin_cache
+        }
+
+        # Encolar todo en la misma transacción que la reserva
+        trabajos = [encolar_generacion(db, generacion, payload) for generacion in generaciones]
+        await db.flush()
+
+        # Cada trabajo conoce a sus hermanos para que un worker los tome juntos
+        trabajo_ids = [t.id for t in trabajos]
+        for trabajo in trabajos:
+            trabajo.payload = {**payload, "lote": trabajo_ids}
+        await db.commit()
+
+        return LoteResponse(
+            exito=True,
+            mensaje=f"{len(trabajos)} estilos en cola. Consulta el estado con el ID del lote.",
+            lote_id=trabajo_ids[0],
+            trabajo_ids=trabajo_ids,
+            creditos_restantes=usuario.creditos
+        )
 
+    except CreditosInsuficientesError:
+        await db.rollback()
+        _eliminar_archivos(ruta_imagen_original, ruta_logo)
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Necesitas {len(estilo_ids)} créditos para generar {len(estilo_ids)} estilos."
+        )
     except HTTPException:
         raise
     except Exception as e:
-        # Error inesperado - devolver crédito
-        usuario.creditos += 1
-        usuario.creditos_usados -= 1
-        generacion.estado = EstadoGeneracion.ERROR.value
-        generacion.error_mensaje = str(e)
-        await db.commit()
-
+        # Nada se confirmó: los créditos no se consumieron
+        await db.rollback()
+        _eliminar_archivos(ruta_imagen_original, ruta_logo)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error inesperado: {str(e)}"
         )
 
 
-@router.get("/historial", response_model=HistorialResponse)
-async def obtener_historial(
-    pagina: int = 1,
-    por_pagina: int = 10,
+@router.get("/lote/{lote_id}", response_model=EstadoLoteResponse)
+async def obtener_lote(
+    lote_id: int,
     usuario: User = Depends(obtener_usuario_actual),
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Obtiene el historial de generaciones del usuario.
+    Obtiene el estado de todos los estilos de un lote.
+    Los estilos terminados incluyen imagen, copy y hashtags aunque el resto
+    siga en proceso.
     """
-    offset = (pagina - 1) * por_pagina
+    principal = await db.get(GenerationJob, lote_id)
+    if not principal or principal.user_id != usuario.id or "lote" not in (principal.payload or {}):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Lote no encontrado"
+        )
+
+    result = await db.execute(
+        select(GenerationJob)
+        .where(
+            GenerationJob.id.in_(principal.payload["lote"]),
+            GenerationJob.user_id == usuario.id
+        )
+        .order_by(GenerationJob.id)
+    )
+    trabajos = result.scalars().all()
+
+    result = await db.execute(
+        select(Generation).where(Generation.id.in_([t.generation_id for t in trabajos]))
+    )
+    generaciones = {g.id: g for g in result.scalars().all()}
+
+    respuestas = []
+    for trabajo in trabajos:
+        generacion = generaciones.get(trabajo.generation_id)
+        respuestas.append(TrabajoResponse(
+            trabajo_id=trabajo.id,
+            generacion_id=trabajo.generation_id,
+            estado=trabajo.estado,
+            intentos=trabajo.intentos,
+            error_mensaje=trabajo.error_mensaje,
+            generacion=_generacion_a_respuesta(generacion) if generacion else None
+        ))
+
+    terminados = sum(
+        1 for t in trabajos
+        if t.estado in (EstadoTrabajo.COMPLETADO.value, EstadoTrabajo.ERROR.value)
+    )
 
-    # Contar total
-    count_result = await db.execute(
-        select(Generation).where(Generation.user_id == usuario.id)
+    return EstadoLoteResponse(
+        lote_id=lote_id,
+        total=len(trabajos),
+        terminados=terminados,
+        trabajos=respuestas
     )
-    total = len(count_result.scalars().all())
 
-    # Obtener página
+
+@router.get("/trabajo/{trabajo_id}", response_model=TrabajoResponse)
+async def obtener_trabajo(
+    trabajo_id: int,
+    usuario: User = Depends(obtener_usuario_actual),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Obtiene el estado de un trabajo de generación.
+    Cuando la generación termina incluye la imagen, copy y hashtags.
+    """
     result = await db.execute(
-        select(Generation)
-        .where(Generation.user_id == usuario.id)
-        .order_by(desc(Generation.created_at))
-        .offset(offset)
-        .limit(por_pagina)
+        select(GenerationJob).where(
+            GenerationJob.id == trabajo_id,
+            GenerationJob.user_id == usuario.id
+        )
+    )
+    trabajo = result.scalar_one_or_none()
+
+    if not trabajo:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trabajo no encontrado"
+        )
+
+    generacion = await db.get(Generation, trabajo.generation_id)
+
+    return TrabajoResponse(
+        trabajo_id=trabajo.id,
+        generacion_id=trabajo.generation_id,
+        estado=trabajo.estado,
+        intentos=trabajo.intentos,
+        error_mensaje=trabajo.error_mensaje,
+        generacion=_generacion_a_respuesta(generacion) if generacion else None
     )
-    generaciones = result.scalars().all()
+
+
+# Columnas que usa el historial: sin prompt_generado, descripcion_producto
+# ni rutas de uploads (solo se leen las columnas proyectadas, sin entidades ORM)
+COLUMNAS_HISTORIAL = (
+    Generation.id,
+    Generation.estado,
+    Generation.imagen_generada_path,
+    Generation.copy_facebook,
+    Generation.hashtags_facebook,
+    Generation.copy_instagram,
+    Generation.hashtags_instagram,
+    Generation.estilo,
+    Generation.created_at,
+    Generation.completed_at,
+)
+
+
+@router.get("/historial", response_model=HistorialResponse)
+async def obtener_historial(
+    cursor: Optional[str] = None,
+    por_pagina: int = Query(10, ge=1, le=100),
+    incluir_total: bool = False,
+    usuario: User = Depends(obtener_usuario_actual),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Obtiene el historial de generaciones del usuario (más recientes primero).
+
+    Paginación por cursor: la siguiente página se pide con el next_cursor
+    de la respuesta. total solo se calcula con incluir_total=true.
+    """
+    try:
+        result = await db.execute(
+            paginar(
+                select(*COLUMNAS_HISTORIAL).where(Generation.user_id == usuario.id),
+                Generation, cursor, por_pagina
+            )
+        )
+    except CursorInvalido as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    generaciones, next_cursor = recortar_pagina(result.all(), por_pagina)
+
+    total = None
+    if incluir_total:
+        total = await contar(db, Generation, Generation.user_id == usuario.id)
 
     return HistorialResponse(
         total=total,
-        pagina=pagina,
         por_pagina=por_pagina,
+        next_cursor=next_cursor,
         generaciones=[
             GeneracionResponse(
                 id=g.id,
@@ -418,6 +666,86 @@ async def obtener_generacion(
             detail="Generación no encontrada"
         )
 
+    return _generacion_a_respuesta(generacion)
+
+
+async def _verificar_backlog(db: AsyncSession):
+    """Control de admisión: no aceptar más trabajos de los que Gemini puede atender"""
+    pendientes = await contar_trabajos_pendientes(db)
+    if pendientes >= settings.ADMISION_MAX_TRABAJOS_PENDIENTES:
+        retry_after = await limitador.estimar_espera("gemini", pendientes)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Hay muchas generaciones en cola. Intenta de nuevo en {retry_after} segundos.",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+async def _respuesta_en_vuelo(
+    db: AsyncSession,
+    generacion_id: int,
+    usuario: User
+) -> GeneracionCompletaResponse:
+    """Respuesta para un duplicado: la generación original y su trabajo"""
+    generacion = await db.get(Generation, generacion_id)
+    result = await db.execute(
+        select(GenerationJob.id)
+        .where(GenerationJob.generation_id == generacion_id)
+        .order_by(desc(GenerationJob.id))
+        .limit(1)
+    )
+    detalle = _generacion_a_respuesta(generacion)
+
+    return GeneracionCompletaResponse(
+        exito=True,
+        mensaje="Ya hay una generación idéntica; se reutiliza sin cobrar otro crédito.",
+        generacion_id=generacion.id,
+        trabajo_id=result.scalar_one_or_none(),
+        estado=generacion.estado,
+        imagen_url=detalle.imagen_url,
+        copy_facebook=detalle.copy_facebook,
+        hashtags_facebook=detalle.hashtags_facebook,
+        copy_instagram=detalle.copy_instagram,
+        hashtags_instagram=detalle.hashtags_instagram,
+        creditos_restantes=usuario.creditos
+    )
+
+
+async def _guardar_uploads(
+    user_id: int,
+    imagen_producto: UploadFile,
+    logo: Optional[UploadFile]
+) -> Tuple[str, Optional[str]]:
+    """
+    Guarda imagen del producto (pública, en generated) y logo (privado, en
+    uploads) directo del upload a disco. Retorna (ruta_imagen, ruta_logo).
+    """
+    nombre_original = (
+        f"{user_id}_original_{uuid.uuid4().hex[:8]}"
+        f"{extension_para_mime(imagen_producto.content_type)}"
+    )
+    ruta_imagen = await guardar_upload(imagen_producto, settings.GENERATED_DIR, nombre_original)
+
+    ruta_logo = None
+    if logo:
+        nombre_logo = f"{user_id}_logo_{uuid.uuid4().hex[:8]}{extension_para_mime(logo.content_type)}"
+        try:
+            ruta_logo = await guardar_upload(logo, settings.UPLOAD_DIR, nombre_logo)
+        except Exception:
+            _eliminar_archivos(ruta_imagen)
+            raise
+    return ruta_imagen, ruta_logo
+
+
+def _eliminar_archivos(*rutas: Optional[str]):
+    """Borra los uploads de una solicitud que no se confirmó"""
+    for ruta in rutas:
+        if ruta and os.path.exists(ruta):
+            os.remove(ruta)
+
+
+def _generacion_a_respuesta(generacion: Generation) -> GeneracionResponse:
+    """Convierte una generación en su respuesta de API"""
     return GeneracionResponse(
         id=generacion.id,
         estado=generacion.estado,
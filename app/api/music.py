@@ -1,24 +1,27 @@
 """
 API de generación de música con IA
 """
-import os
-import uuid
-import asyncio
 from datetime import datetime
 from typing import Optional
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query, Request
 from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
-from app.core.database import get_db, async_session_maker
+from app.core.database import get_db
 from app.core.security import obtener_usuario_actual
 from app.models.user import User
-from app.models.music_generation import MusicGeneration, EstadoMusicGeneration
-from app.services.music_service import music_service
-from app.core.config import settings
+from app.models.music_generation import MusicGeneration, EstadoMusicGeneration, MusicAudioVariante
+from app.services.music_service import interpretar_conversion
+from app.services.music_jobs import verificar_firma, lanzar_generacion, lanzar_finalizacion
+from app.services.admission import limitador, ProveedorSaturadoError
+from app.services.eventos import publicar_evento, TIPO_MUSICA
+from app.services.singleflight import clave_solicitud, buscar_en_vuelo, registrar_en_vuelo, purgar_en_vuelo
+from app.services.paginacion import paginar, recortar_pagina, contar, CursorInvalido
+from app.services.creditos import reservar_creditos, CreditosInsuficientesError
 
 router = APIRouter(prefix="/music", tags=["Music"])
 
@@ -126,108 +129,6 @@ MUSIC_STYLES = {
 }
 
 
-# ============ BACKGROUND TASK ============
-
-async def procesar_generacion_musica(
-    generacion_id: int,
-    user_id: int,
-    titulo: str,
-    descripcion: str,
-    duracion: int,
-    genero: Optional[str],
-    mood: Optional[str],
-    es_instrumental: bool
-):
-    """
-    Procesa la generación de música en background.
-    """
-    async with async_session_maker() as db:
-        try:
-            # Obtener la generación
-            result = await db.execute(
-                select(MusicGeneration).where(MusicGeneration.id == generacion_id)
-            )
-            generacion = result.scalar_one_or_none()
-            if not generacion:
-                return
-
-            # Actualizar estado
-            generacion.estado = EstadoMusicGeneration.GENERANDO_MUSICA.value
-            await db.commit()
-
-            # Generar música
-            resultado = await music_service.generar_cancion_completa(
-                titulo=titulo,
-                descripcion=descripcion,
-                duracion=duracion,
-                genero=genero,
-                mood=mood,
-                es_instrumental=es_instrumental
-            )
-
-            if resultado.get("exito"):
-                # Guardar audio localmente
-                audio_url = resultado.get("audio_url")
-                nombre_archivo = f"music_{generacion.id}_{uuid.uuid4().hex[:8]}.mp3"
-                ruta_local = os.path.join(settings.GENERATED_DIR, "music", nombre_archivo)
-
-                # Descargar y guardar
-                descargado = await music_service.descargar_audio(audio_url, ruta_local)
-
-                if descargado:
-                    generacion.audio_path = ruta_local
-                    generacion.audio_url = f"/viralpost/music/{nombre_archivo}"
-                else:
-                    generacion.audio_url = audio_url
-
-                # Actualizar generación
-                generacion.estado = EstadoMusicGeneration.COMPLETADA.value
-                generacion.prompt_musicgpt = resultado.get("prompt_usado")
-                generacion.music_style = resultado.get("music_style")
-                generacion.mood = resultado.get("mood")
-                generacion.genero = resultado.get("genre")
-                generacion.musicgpt_conversion_id = resultado.get("conversion_id")
-                generacion.tiempo_procesamiento_ms = resultado.get("tiempo_ms")
-                generacion.completed_at = datetime.utcnow()
-            else:
-                # Error - devolver crédito
-                result = await db.execute(
-                    select(User).where(User.id == user_id)
-                )
-                usuario = result.scalar_one_or_none()
-                if usuario:
-                    usuario.creditos += 1
-                    usuario.creditos_usados -= 1
-
-                generacion.estado = EstadoMusicGeneration.ERROR.value
-                generacion.error_mensaje = resultado.get("error", "Error desconocido")
-
-            await db.commit()
-
-        except Exception as e:
-            # Error inesperado - devolver crédito
-            try:
-                result = await db.execute(
-                    select(User).where(User.id == user_id)
-                )
-                usuario = result.scalar_one_or_none()
-                if usuario:
-                    usuario.creditos += 1
-                    usuario.creditos_usados -= 1
-
-                result = await db.execute(
-                    select(MusicGeneration).where(MusicGeneration.id == generacion_id)
-                )
-                generacion = result.scalar_one_or_none()
-                if generacion:
-                    generacion.estado = EstadoMusicGeneration.ERROR.value
-                    generacion.error_mensaje = str(e)
-
-                await db.commit()
-            except:
-                pass
-
-
 # ============ ENDPOINTS ============
 
 @router.get("/estilos")
@@ -255,7 +156,16 @@ async def generar_musica(
     Inicia la generación de una canción con IA en background.
     Consume 1 crédito.
     Retorna inmediatamente con el ID de generación para polling.
+
+    Una solicitud idéntica mientras la original sigue en curso recibe esa
+    misma generación sin cobrar otro crédito ni llamar otra vez a MusicGPT.
     """
+    # Singleflight: reutilizar una generación idéntica en curso
+    clave = clave_solicitud(usuario.id, TIPO_MUSICA, request.model_dump())
+    existente = await buscar_en_vuelo(db, clave)
+    if existente:
+        return await _respuesta_en_vuelo(db, existente, usuario)
+
     # Verificar créditos
     if not usuario.tiene_creditos(1):
         raise HTTPException(
@@ -263,6 +173,16 @@ async def generar_musica(
             detail="No tienes suficientes créditos. Compra más para continuar."
         )
 
+    # Control de admisión: rechazar antes de cobrar si MusicGPT está saturado
+    try:
+        await limitador.verificar_capacidad("musicgpt")
+    except ProveedorSaturadoError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
     try:
         # Crear registro de generación
         generacion = MusicGeneration(
@@ -276,24 +196,17 @@ async def generar_musica(
             estado=EstadoMusicGeneration.GENERANDO_PROMPT.value
         )
         db.add(generacion)
-        await db.commit()
-        await db.refresh(generacion)
+        await db.flush()
 
-        # Usar crédito
-        usuario.usar_credito()
+        # Reserva del crédito, singleflight y evento en un solo commit
+        await reservar_creditos(db, usuario, TIPO_MUSICA, [generacion.id])
+        await purgar_en_vuelo(db, usuario.id, clave, TIPO_MUSICA)
+        registrar_en_vuelo(db, clave, usuario.id, TIPO_MUSICA, generacion.id)
+        publicar_evento(db, usuario.id, TIPO_MUSICA, generacion.id, generacion.estado)
         await db.commit()
 
-        # Iniciar generación en background
-        asyncio.create_task(procesar_generacion_musica(
-            generacion_id=generacion.id,
-            user_id=usuario.id,
-            titulo=request.titulo,
-            descripcion=request.descripcion,
-            duracion=request.duracion_segundos,
-            genero=request.genero,
-            mood=request.mood,
-            es_instrumental=request.es_instrumental
-        ))
+        # Iniciar generación en background (supervisor con concurrencia acotada)
+        lanzar_generacion(generacion.id)
 
         # Retornar inmediatamente con el ID para polling
         return MusicGenerationResponse(
@@ -303,6 +216,24 @@ async def generar_musica(
             creditos_restantes=usuario.creditos
         )
 
+    except CreditosInsuficientesError:
+        # Otra solicitud del mismo usuario gastó el saldo mientras tanto
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail="No tienes suficientes créditos. Compra más para continuar."
+        )
+    except IntegrityError:
+        # Otro worker registró la misma solicitud primero: nada se cobró aquí
+        await db.rollback()
+        await db.refresh(usuario)
+        existente = await buscar_en_vuelo(db, clave)
+        if existente:
+            return await _respuesta_en_vuelo(db, existente, usuario)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Ya hay una solicitud idéntica en proceso. Intenta de nuevo."
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -312,22 +243,66 @@ async def generar_musica(
         )
 
 
+async def _respuesta_en_vuelo(
+    db: AsyncSession,
+    generacion_id: int,
+    usuario: User
+) -> MusicGenerationResponse:
+    """Respuesta para un duplicado: la generación original"""
+    generacion = await db.get(MusicGeneration, generacion_id)
+    return MusicGenerationResponse(
+        exito=True,
+        mensaje="Ya hay una generación idéntica; se reutiliza sin cobrar otro crédito.",
+        generacion_id=generacion.id,
+        audio_url=generacion.audio_url,
+        prompt_usado=generacion.prompt_musicgpt,
+        mood=generacion.mood,
+        genre=generacion.genero,
+        creditos_restantes=usuario.creditos
+    )
+
+
+# Columnas del historial: sin prompts ni error_mensaje (solo lo que se responde)
+COLUMNAS_HISTORIAL = (
+    MusicGeneration.id,
+    MusicGeneration.titulo,
+    MusicGeneration.descripcion,
+    MusicGeneration.duracion_segundos,
+    MusicGeneration.es_instrumental,
+    MusicGeneration.genero,
+    MusicGeneration.mood,
+    MusicGeneration.audio_url,
+    MusicGeneration.estado,
+    MusicGeneration.created_at,
+)
+
+
 @router.get("/historial")
 async def obtener_historial(
-    limit: int = 20,
-    offset: int = 0,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    incluir_total: bool = False,
     db: AsyncSession = Depends(get_db),
     usuario: User = Depends(obtener_usuario_actual)
 ):
-    """Obtiene el historial de generaciones de música del usuario"""
-    result = await db.execute(
-        select(MusicGeneration)
-        .where(MusicGeneration.user_id == usuario.id)
-        .order_by(desc(MusicGeneration.created_at))
-        .limit(limit)
-        .offset(offset)
-    )
-    generaciones = result.scalars().all()
+    """
+    Obtiene el historial de generaciones de música del usuario.
+    Paginación por cursor (next_cursor); total solo con incluir_total=true.
+    """
+    try:
+        result = await db.execute(
+            paginar(
+                select(*COLUMNAS_HISTORIAL).where(MusicGeneration.user_id == usuario.id),
+                MusicGeneration, cursor, limit
+            )
+        )
+    except CursorInvalido as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    generaciones, next_cursor = recortar_pagina(result.all(), limit)
+
+    total = None
+    if incluir_total:
+        total = await contar(db, MusicGeneration, MusicGeneration.user_id == usuario.id)
 
     return {
         "generaciones": [
@@ -345,7 +320,8 @@ async def obtener_historial(
             }
             for g in generaciones
         ],
-        "total": len(generaciones)
+        "total": total,
+        "next_cursor": next_cursor
     }
 
 
@@ -371,6 +347,13 @@ async def obtener_generacion(
             detail="Generación no encontrada"
         )
 
+    result = await db.execute(
+        select(MusicAudioVariante)
+        .where(MusicAudioVariante.generacion_id == generacion.id)
+        .order_by(MusicAudioVariante.numero)
+    )
+    variantes = result.scalars().all()
+
     return {
         "id": generacion.id,
         "titulo": generacion.titulo,
@@ -382,9 +365,61 @@ async def obtener_generacion(
         "prompt_musicgpt": generacion.prompt_musicgpt,
         "music_style": generacion.music_style,
         "audio_url": generacion.audio_url,
+        "variantes": [
+            {"numero": v.numero, "audio_url": v.audio_url, "tamano_bytes": v.tamano_bytes}
+            for v in variantes
+        ],
         "estado": generacion.estado,
         "error_mensaje": generacion.error_mensaje,
         "tiempo_procesamiento_ms": generacion.tiempo_procesamiento_ms,
         "created_at": generacion.created_at.isoformat() if generacion.created_at else None,
         "completed_at": generacion.completed_at.isoformat() if generacion.completed_at else None
     }
+
+
+@router.post("/webhook/{generacion_id}")
+async def webhook_musicgpt(
+    generacion_id: int,
+    request: Request,
+    firma: str = Query("")
+):
+    """
+    Callback de MusicGPT al terminar una canción.
+
+    La URL va firmada con HMAC (MUSICGPT_WEBHOOK_SECRET). Se responde de
+    inmediato y la descarga del audio corre en background; callbacks
+    repetidos o intermedios (p. ej. solo letra) se ignoran.
+    """
+    if not verificar_firma(generacion_id, firma):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Firma inválida"
+        )
+
+    try:
+        data = await request.json()
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cuerpo JSON inválido"
+        )
+    if not isinstance(data, dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cuerpo JSON inválido"
+        )
+
+    conversion = data.get("conversion") if isinstance(data.get("conversion"), dict) else data
+    resultado = interpretar_conversion(conversion)
+
+    if resultado["estado"] == "pendiente":
+        return {"recibido": True, "finalizado": False}
+
+    lanzar_finalizacion(
+        generacion_id,
+        audio_url=resultado.get("audio_url"),
+        error=resultado.get("error"),
+        audio_urls=resultado.get("audio_urls")
+    )
+
+    return {"recibido": True, "finalizado": True}
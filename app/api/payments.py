@@ -1,16 +1,17 @@
 """
 Rutas de pagos con Stripe
 """
-from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.core.database import get_db
+from sqlalchemy import select, update
+from app.core.database import get_db, ahora_utc
 from app.core.security import obtener_usuario_actual
 from app.core.config import settings
 from app.models.user import User
 from app.models.transaction import Transaction, EstadoTransaccion
 from app.services.stripe_service import stripe_service
+from app.services.creditos import abonar_creditos
+from app.services.estadisticas import sumar_estadistica, PAGOS, CREDITOS_VENDIDOS
 from app.api.schemas import (
     PaqueteResponse,
     CheckoutRequest,
@@ -171,20 +172,20 @@ async def stripe_webhook(
         transaccion = result.scalar_one_or_none()
 
         if transaccion and transaccion.estado == EstadoTransaccion.PENDIENTE.value:
-            # Buscar usuario
+            # Completar la transacción una sola vez aunque Stripe repita el evento
             result = await db.execute(
-                select(User).where(User.id == datos["user_id"])
+                update(Transaction)
+                .where(
+                    Transaction.id == transaccion.id,
+                    Transaction.estado == EstadoTransaccion.PENDIENTE.value
+                )
+                .values(estado=EstadoTransaccion.COMPLETADA.value, completed_at=ahora_utc())
+                .execution_options(synchronize_session=False)
             )
-            usuario = result.scalar_one_or_none()
-
-            if usuario:
-                # Agregar créditos
-                usuario.agregar_creditos(datos["creditos"])
-
-                # Actualizar transacción
-                transaccion.estado = EstadoTransaccion.COMPLETADA.value
-                transaccion.completed_at = datetime.utcnow()
-
+            if result.rowcount == 1:
+                await abonar_creditos(db, transaccion.user_id, transaccion.creditos, transaccion.id)
+                await sumar_estadistica(db, PAGOS, suma=transaccion.monto_mxn)
+                await sumar_estadistica(db, CREDITOS_VENDIDOS, cantidad=transaccion.creditos)
                 await db.commit()
 
     # checkout.session.async_payment_failed - pago OXXO falló (voucher expiró)
@@ -215,12 +216,19 @@ async def historial_transacciones(
     Obtiene el historial de transacciones del usuario.
     """
     result = await db.execute(
-        select(Transaction)
+        select(
+            Transaction.id,
+            Transaction.creditos,
+            Transaction.monto_mxn,
+            Transaction.estado,
+            Transaction.descripcion,
+            Transaction.created_at
+        )
         .where(Transaction.user_id == usuario.id)
         .order_by(Transaction.created_at.desc())
         .limit(50)
     )
-    transacciones = result.scalars().all()
+    transacciones = result.all()
 
     return [
         TransaccionResponse(
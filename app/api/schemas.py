@@ -101,7 +101,10 @@ class GeneracionCompletaResponse(BaseModel):
     exito: bool
     mensaje: str
     generacion_id: Optional[int] = None
+    trabajo_id: Optional[int] = None
+    estado: Optional[str] = None
     imagen_base64: Optional[str] = None
+    imagen_url: Optional[str] = None
     copy_facebook: Optional[str] = None
     hashtags_facebook: Optional[List[str]] = None
     copy_instagram: Optional[str] = None
@@ -110,6 +113,33 @@ class GeneracionCompletaResponse(BaseModel):
     tiempo_ms: Optional[int] = None
 
 
+class TrabajoResponse(BaseModel):
+    """Estado de un trabajo de generación en la cola"""
+    trabajo_id: int
+    generacion_id: int
+    estado: str
+    intentos: int
+    error_mensaje: Optional[str] = None
+    generacion: Optional[GeneracionResponse] = None
+
+
+class LoteResponse(BaseModel):
+    """Respuesta al encolar varios estilos del mismo producto"""
+    exito: bool
+    mensaje: str
+    lote_id: int
+    trabajo_ids: List[int]
+    creditos_restantes: int = 0
+
+
+class EstadoLoteResponse(BaseModel):
+    """Estado de un lote; cada estilo incluye su resultado en cuanto termina"""
+    lote_id: int
+    total: int
+    terminados: int
+    trabajos: List[TrabajoResponse]
+
+
 # ============ PAGOS ============
 
 class PaqueteResponse(BaseModel):
@@ -156,9 +186,9 @@ class TransaccionResponse(BaseModel):
 
 class HistorialResponse(BaseModel):
     """Respuesta de historial de generaciones"""
-    total: int
-    pagina: int
+    total: Optional[int] = None  # Solo con incluir_total=true
     por_pagina: int
+    next_cursor: Optional[str] = None  # None en la última página
     generaciones: List[GeneracionResponse]
 
 
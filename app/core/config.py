@@ -23,6 +23,23 @@ class Settings(BaseSettings):
     # Base de datos
     DATABASE_URL: str = "sqlite+aiosqlite:///./viralpost.db"
 
+    # Pool de conexiones de PostgreSQL (postgresql+asyncpg://...); SQLite no lo usa
+    DB_POOL_SIZE: int = 10                     # Por proceso: workers x (pool + overflow) <= max_connections
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SEGUNDOS: int = 30
+    DB_POOL_RECYCLE_SEGUNDOS: int = 1800
+    DB_POOL_PRE_PING: bool = True              # Descarta conexiones cortadas (reinicio, failover)
+    DB_CACHE_SENTENCIAS: int = 100             # Sentencias preparadas por conexión (0 con PgBouncer)
+
+    # Perfil de SQLite (se aplica en cada conexión; se ignora con PostgreSQL)
+    SQLITE_JOURNAL_MODE: str = "WAL"           # Lectores no bloquean al escritor
+    SQLITE_SYNCHRONOUS: str = "NORMAL"         # Con WAL: sin fsync por commit, la base no se corrompe
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000         # Espera al lock en vez de fallar con "database is locked"
+    SQLITE_MMAP_BYTES: int = 256 * 1024 * 1024
+    SQLITE_CACHE_KIB: int = 64 * 1024          # Caché de páginas por conexión
+    SQLITE_ESCRITURAS_LOTE: int = 50           # Escrituras de fondo confirmadas en un solo commit
+    SQLITE_ESCRITURAS_ESPERA_MS: int = 5       # Espera para juntar la ráfaga antes de confirmar
+
     # JWT
     JWT_SECRET_KEY: str = "jwt-secret-key-cambiar-en-produccion"
     JWT_ALGORITHM: str = "HS256"
@@ -48,6 +65,83 @@ class Settings(BaseSettings):
     # MusicGPT (para generación de música)
     MUSICGPT_API_KEY: str = ""
     MUSICGPT_API_URL: str = "https://api.musicgpt.com/api/public/v1"
+    MUSICGPT_WEBHOOK_SECRET: str = ""          # Firma la URL del callback (vacío = solo polling)
+    MUSICGPT_TIMEOUT_SEGUNDOS: int = 900       # Sin resultado tras este tiempo = error y reembolso
+
+    # Planificador central de consultas a MusicGPT (un líder por despliegue)
+    MUSICGPT_POLL_CONCURRENCIA: int = 8        # Consultas a /byId simultáneas
+    MUSICGPT_POLL_PRIMERA_SEGUNDOS: float = 30.0   # Edad de la canción antes de la primera consulta
+    MUSICGPT_POLL_INTERVALO_MIN: float = 5.0
+    MUSICGPT_POLL_INTERVALO_MAX: float = 60.0
+    MUSICGPT_GRACIA_SEGUNDOS: int = 120        # Con webhook: primera consulta de respaldo
+    LIDERAZGO_TTL_SEGUNDOS: int = 30           # Sin renovar por este tiempo = otro proceso toma el liderazgo
+
+    # Descarga del audio generado (streaming, reanudable con Range)
+    DESCARGA_BLOQUE_BYTES: int = 64 * 1024     # Memoria máxima por descarga
+    DESCARGA_MAX_REANUDACIONES: int = 3
+    DESCARGA_HEARTBEAT_SEGUNDOS: int = 30      # La descarga en curso renueva su marca cada tanto
+    DESCARGA_TIMEOUT_SEGUNDOS: int = 180       # Sin heartbeat por este tiempo = proceso caído, se reintenta
+
+    # Eventos de estado en tiempo real (SSE)
+    EVENTOS_INTERVALO_SEGUNDOS: float = 0.5    # Cada cuánto cada worker lee eventos nuevos
+    EVENTOS_KEEPALIVE_SEGUNDOS: float = 15.0
+    EVENTOS_RETENCION_SEGUNDOS: int = 600      # Ventana para reenviar eventos al reconectar
+    EVENTOS_MARGEN_IDS: int = 200              # PostgreSQL: ids que se releen por commits fuera de orden
+
+    # Singleflight: una solicitud idéntica se enlaza a la generación en curso
+    SINGLEFLIGHT_VENTANA_SEGUNDOS: int = 60    # Tras completarse, los duplicados reciben el mismo resultado
+
+    # Tareas de fondo del proceso web (inicio y finalización de canciones)
+    TAREAS_MUSICA_CONCURRENCIA: int = 4
+    TAREAS_DRENADO_SEGUNDOS: int = 30          # Al apagar; lo que no termine vuelve a su estado persistente
+
+    # Pool de conexiones HTTP hacia los proveedores de IA
+    HTTP_MAX_CONEXIONES_POR_HOST: int = 20
+    HTTP_MAX_KEEPALIVE: int = 10
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # segundos
+    HTTP2_HABILITADO: bool = True
+
+    # Caché del análisis de OpenAI (prompt de imagen + copy)
+    OPENAI_CACHE_HABILITADO: bool = True
+    OPENAI_CACHE_PATH: str = "./openai_cache.db"
+    OPENAI_CACHE_MAX_ENTRADAS_MEMORIA: int = 256
+    OPENAI_CACHE_TTL_SEGUNDOS: int = 7 * 24 * 3600  # 7 días
+    OPENAI_CACHE_MAX_MB_DISCO: int = 200
+
+    # Normalización de imágenes antes de enviarlas a los proveedores
+    IMAGEN_MAX_LADO_ANALISIS: int = 1024          # OpenAI (visión: análisis y copy)
+    IMAGEN_MAX_LADO_CONDICIONAMIENTO: int = 1536  # Gemini (referencia para la imagen)
+    IMAGEN_CALIDAD_JPEG: int = 88
+    IMAGEN_PROCESOS: int = 2                      # Tamaño del ProcessPoolExecutor
+
+    # Cola de trabajos de generación (python -m app.worker)
+    WORKER_CONCURRENCIA: int = 4               # Generaciones simultáneas por worker
+    WORKER_POLL_INTERVALO: float = 1.0         # Segundos entre consultas a la cola
+    WORKER_DRAIN_SEGUNDOS: int = 90            # Espera máxima al apagar antes de devolver trabajos a la cola
+    TRABAJO_HEARTBEAT_SEGUNDOS: int = 15
+    TRABAJO_TIMEOUT_SEGUNDOS: int = 60         # Sin heartbeat por este tiempo = worker caído
+    TRABAJO_MAX_INTENTOS: int = 3
+
+    # Generación por lote (varios estilos del mismo producto)
+    LOTE_MAX_ESTILOS: int = 8
+    LOTE_CONCURRENCIA_GEMINI: int = 3          # Imágenes simultáneas por lote
+
+    # Reintentos y circuit breaker hacia los proveedores (por proceso)
+    REINTENTOS_MAX: int = 3                        # Reintentos por llamada
+    REINTENTO_BASE_SEGUNDOS: float = 1.0           # Backoff exponencial: base * 2^intento (con jitter)
+    REINTENTO_MAX_ESPERA_SEGUNDOS: float = 30.0    # Tope de una espera (incluye Retry-After)
+    REINTENTOS_PRESUPUESTO_SEGUNDOS: float = 180.0 # Tiempo total por solicitud tras el cual ya no se reintenta
+    CIRCUITO_UMBRAL_FALLOS: int = 5                # Fallos consecutivos para abrir el circuito
+    CIRCUITO_SEGUNDOS_ABIERTO: float = 30.0        # Tiempo abierto antes de dejar pasar una prueba
+
+    # Control de admisión hacia los proveedores (compartido entre procesos)
+    ADMISION_DB_PATH: str = "./admision.db"
+    ADMISION_CONCURRENCIA_GEMINI: int = 6          # Llamadas simultáneas entre todos los procesos
+    ADMISION_CONCURRENCIA_MUSICGPT: int = 3
+    ADMISION_MAX_COLA: int = 20                    # Esperando permiso por proveedor; más = 429
+    ADMISION_ESPERA_MAX_SEGUNDOS: float = 120.0    # Espera máxima por un permiso
+    ADMISION_LEASE_SEGUNDOS: float = 600.0         # Un permiso de un proceso caído expira solo
+    ADMISION_MAX_TRABAJOS_PENDIENTES: int = 100    # Backlog de la cola de imágenes antes de responder 429
 
     # Dominio
     DOMAIN: str = "agathoscreative.com"
@@ -57,6 +151,11 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "/var/www/agathoscreative/viralpost/uploads"
     GENERATED_DIR: str = "/var/www/agathoscreative/viralpost/generated"
 
+    # Entrega de archivos generados: con nginx delante, la app solo responde
+    # X-Accel-Redirect y nginx envía el archivo (ver nginx/viralpost.conf)
+    ARCHIVOS_X_ACCEL: bool = False
+    ARCHIVOS_X_ACCEL_PREFIJO: str = "/viralpost-internal"
+
     # ===========================================
     # SISTEMA DE CRÉDITOS Y PRECIOS
     # ===========================================
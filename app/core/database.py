@@ -1,6 +1,14 @@
 """
 Configuración de base de datos SQLAlchemy async
+
+Soporta SQLite (aiosqlite, un solo escritor) y PostgreSQL (asyncpg) con
+pool configurable. Las fechas se escriben siempre en UTC con zona: asyncpg
+interpreta las fechas sin zona según la zona horaria del servidor.
 """
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
@@ -12,13 +20,55 @@ class Base(DeclarativeBase):
     pass
 
 
+def opciones_motor(url: str) -> dict:
+    """Pool y opciones del driver según el motor de la URL"""
+    if not url.startswith("postgresql"):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SEGUNDOS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SEGUNDOS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "connect_args": {
+            # Caché de sentencias preparadas (SQLAlchemy y asyncpg);
+            # 0 detrás de PgBouncer en modo transaction
+            "prepared_statement_cache_size": settings.DB_CACHE_SENTENCIAS,
+            "statement_cache_size": settings.DB_CACHE_SENTENCIAS,
+            "server_settings": {
+                "timezone": "UTC",
+                "application_name": settings.APP_NAME
+            }
+        }
+    }
+
+
 # Motor async de SQLAlchemy
 engine = create_async_engine(
     settings.DATABASE_URL,
     echo=settings.DEBUG,
-    future=True
+    future=True,
+    **opciones_motor(settings.DATABASE_URL)
 )
 
+ES_SQLITE = engine.dialect.name == "sqlite"
+
+
+if ES_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _perfil_sqlite(dbapi_connection, connection_record):
+        """Pragmas de producción en cada conexión nueva del pool"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_BYTES)}")
+        # Negativo = tamaño en KiB en vez de páginas
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_KIB)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+
 # Session factory async
 async_session_maker = async_sessionmaker(
     engine,
@@ -29,6 +79,18 @@ async_session_maker = async_sessionmaker(
 )
 
 
+def ahora_utc() -> datetime:
+    """Hora actual en UTC con zona, para escribir y comparar columnas de fecha"""
+    return datetime.now(timezone.utc)
+
+
+def como_utc(valor: Optional[datetime]) -> Optional[datetime]:
+    """Fecha leída de la DB en UTC con zona (SQLite las devuelve sin zona)"""
+    if valor is None or valor.tzinfo is not None:
+        return valor
+    return valor.replace(tzinfo=timezone.utc)
+
+
 async def get_db() -> AsyncSession:
     """Dependencia para obtener sesión de DB"""
     async with async_session_maker() as session:
@@ -43,9 +105,13 @@ async def get_db() -> AsyncSession:
 
 
 async def init_db():
-    """Inicializa la base de datos"""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """
+    Inicializa la base de datos aplicando las migraciones pendientes
+    (si el esquema ya está al día no se ejecuta create_all)
+    """
+    from app.core.migrations import migrar
+
+    await migrar(engine)
 
 
 async def close_db():
@@ -0,0 +1,216 @@
+"""
+Migraciones versionadas del esquema
+
+create_all solo crea tablas que no existen: no agrega índices a tablas ya
+creadas ni deja registro de qué se aplicó. Aquí cada cambio de esquema es
+una migración numerada; la versión aplicada se guarda en schema_version y
+al arrancar solo se corre lo pendiente. Si la base ya está al día no se
+ejecuta create_all (ni su inspección de cada tabla).
+
+Cada cambio de esquema nuevo (tabla, índice) debe agregar su migración al
+final de MIGRACIONES.
+
+Uso manual:
+    python -m app.core.migrations            # aplica lo pendiente
+    python -m app.core.migrations --estado   # solo muestra la versión
+"""
+import asyncio
+import sys
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, insert, inspect, literal, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.database import Base
+
+
+# Tabla propia, fuera de Base.metadata para que create_all no la toque
+_metadata = MetaData()
+
+version_esquema = Table(
+    "schema_version",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("descripcion", String(200), nullable=False),
+    Column("aplicada_en", DateTime(timezone=True), server_default=func.now())
+)
+
+# Clave del advisory lock de PostgreSQL (varios workers arrancando a la vez)
+_LOCK_MIGRACIONES = 720_018
+
+
+def _indice(modelo, nombre: str):
+    """Índice declarado en __table_args__ del modelo"""
+    for indice in modelo.__table__.indexes:
+        if indice.name == nombre:
+            return indice
+    raise KeyError(f"{modelo.__tablename__} no declara el índice {nombre}")
+
+
+def _columna(conn: Connection, modelo, nombre: str):
+    """Agrega a una tabla existente una columna declarada en el modelo"""
+    tabla = modelo.__table__
+    if nombre in {c["name"] for c in inspect(conn).get_columns(tabla.name)}:
+        return
+    tipo = tabla.c[nombre].type.compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {tabla.name} ADD COLUMN {nombre} {tipo}"))
+
+
+# ========== MIGRACIONES ==========
+
+def _esquema_inicial(conn: Connection):
+    """Tablas de los modelos (en bases existentes solo crea las que falten)"""
+    Base.metadata.create_all(conn)
+
+
+def _indices_compuestos(conn: Connection):
+    """Índices de historial, galería por estilo y admin"""
+    from app.models import Generation, MusicGeneration, Transaction
+
+    for modelo, nombre in (
+        (Generation, "ix_generations_user_created"),
+        (Generation, "ix_generations_estilo_estado_completed"),
+        (Transaction, "ix_transactions_estado_created"),
+        (MusicGeneration, "ix_music_generations_user_created"),
+    ):
+        _indice(modelo, nombre).create(conn, checkfirst=True)
+
+
+def _indice_usuarios(conn: Connection):
+    """Paginación por cursor del listado de usuarios del admin"""
+    from app.models import User
+
+    _indice(User, "ix_users_created").create(conn, checkfirst=True)
+
+
+def _libro_creditos(conn: Connection):
+    """
+    Tabla movimientos_credito. Las generaciones que ya estaban en curso
+    cobraron con el esquema anterior: se les crea su reserva para que al
+    terminar se confirme o se devuelva el crédito.
+    """
+    from app.models import Generation, MusicGeneration, MovimientoCredito
+
+    tabla = MovimientoCredito.__table__
+    tabla.create(conn, checkfirst=True)
+
+    en_curso = (
+        (Generation, "imagen", ["pendiente", "procesando"]),
+        (MusicGeneration, "musica", ["pendiente", "generando_prompt", "generando_musica", "descargando"]),
+    )
+    for modelo, tipo_objeto, estados in en_curso:
+        conn.execute(
+            insert(tabla).from_select(
+                ["user_id", "tipo", "estado", "cantidad", "tipo_objeto", "objeto_id"],
+                select(
+                    modelo.user_id,
+                    literal("reserva"),
+                    literal("reservado"),
+                    literal(1),
+                    literal(tipo_objeto),
+                    modelo.id
+                ).where(modelo.estado.in_(estados))
+            )
+        )
+
+
+def _estadisticas_diarias(conn: Connection):
+    """
+    Tabla estadisticas_diarias, llenada desde las tablas de origen, e
+    índices del top de usuarios y las canciones recientes del admin
+    """
+    from app.models import EstadisticaDiaria, MusicGeneration, User
+    from app.services.estadisticas import recalcular_estadisticas
+
+    EstadisticaDiaria.__table__.create(conn, checkfirst=True)
+    recalcular_estadisticas(conn)
+
+    _indice(User, "ix_users_creditos_usados").create(conn, checkfirst=True)
+    _indice(MusicGeneration, "ix_music_generations_created").create(conn, checkfirst=True)
+
+
+def _heartbeat_descargas(conn: Connection):
+    """Heartbeat de las descargas de música en curso"""
+    from app.models import MusicGeneration
+
+    _columna(conn, MusicGeneration, "descarga_heartbeat_at")
+
+
+# (versión, descripción, función); nunca reordenar ni editar las ya publicadas
+MIGRACIONES: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Esquema inicial", _esquema_inicial),
+    (2, "Índices compuestos de consultas frecuentes", _indices_compuestos),
+    (3, "Índice de usuarios por fecha de registro", _indice_usuarios),
+    (4, "Libro de créditos con reservas", _libro_creditos),
+    (5, "Estadísticas diarias del panel de admin", _estadisticas_diarias),
+    (6, "Heartbeat de descargas de música", _heartbeat_descargas),
+]
+
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+
+def _version(conn: Connection) -> int:
+    """Versión aplicada (0 si la base nunca pasó por las migraciones)"""
+    if not inspect(conn).has_table(version_esquema.name):
+        return 0
+    return conn.execute(select(func.max(version_esquema.c.version))).scalar() or 0
+
+
+def _aplicar_pendientes(conn: Connection) -> List[int]:
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:clave)"), {"clave": _LOCK_MIGRACIONES})
+
+    _metadata.create_all(conn)
+    # Releer dentro del lock: otro worker pudo migrar mientras tanto
+    actual = _version(conn)
+
+    aplicadas = []
+    for version, descripcion, migracion in MIGRACIONES:
+        if version <= actual:
+            continue
+        migracion(conn)
+        conn.execute(version_esquema.insert().values(version=version, descripcion=descripcion))
+        aplicadas.append(version)
+    return aplicadas
+
+
+async def version_aplicada(engine: AsyncEngine) -> int:
+    async with engine.connect() as conn:
+        return await conn.run_sync(_version)
+
+
+async def migrar(engine: AsyncEngine) -> int:
+    """
+    Aplica las migraciones pendientes (todas en una transacción).
+    Retorna la versión del esquema resultante.
+    """
+    # Camino rápido: una consulta y nada más
+    if await version_aplicada(engine) >= VERSION_ACTUAL:
+        return VERSION_ACTUAL
+
+    # Asegura que todos los modelos estén registrados en Base.metadata
+    import app.models  # noqa: F401
+
+    async with engine.begin() as conn:
+        aplicadas = await conn.run_sync(_aplicar_pendientes)
+
+    if aplicadas:
+        print(f"[MIGRACIONES] Aplicadas: {', '.join(str(v) for v in aplicadas)} (versión {VERSION_ACTUAL})")
+    return VERSION_ACTUAL
+
+
+async def _main(solo_estado: bool):
+    from app.core.database import engine
+
+    try:
+        version = await version_aplicada(engine)
+        print(f"[MIGRACIONES] Versión aplicada: {version} / disponible: {VERSION_ACTUAL}")
+        if not solo_estado and version < VERSION_ACTUAL:
+            await migrar(engine)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main("--estado" in sys.argv[1:]))
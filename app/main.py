@@ -3,6 +3,7 @@ ViralPost AI - Aplicación principal FastAPI
 Generador de imágenes virales para redes sociales
 """
 import os
+import asyncio
 from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI, Request
@@ -10,14 +11,23 @@ from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse
 from app.core.config import settings
-from app.core.database import init_db, close_db
+from app.core.database import init_db, close_db, ES_SQLITE
 from app.api.auth import router as auth_router
 from app.api.generation import router as generation_router
 from app.api.payments import router as payments_router
 from app.api.admin import router as admin_router
 from app.api.music import router as music_router
+from app.api.eventos import router as eventos_router
+from app.services.http_clients import clientes_upstream
+from app.services.generation import generation_service
+from app.services.music_service import music_service
+from app.services.music_scheduler import planificador_musica
+from app.services.archivos import servir_archivo
+from app.services.eventos import bus_eventos
+from app.services.music_jobs import tareas_musica
+from app.services.escrituras import cola_escrituras
 
 
 @asynccontextmanager
@@ -31,9 +41,33 @@ async def lifespan(app: FastAPI):
     os.makedirs(settings.GENERATED_DIR, exist_ok=True)
     os.makedirs(os.path.join(settings.GENERATED_DIR, "music"), exist_ok=True)
 
+    # Pool de clientes HTTP compartido para OpenAI, Gemini y MusicGPT
+    await clientes_upstream.iniciar()
+    generation_service.usar_clientes(clientes_upstream)
+    music_service.usar_clientes(clientes_upstream)
+
+    # Un solo escritor para las escrituras de fondo (SQLite admite uno a la vez)
+    if ES_SQLITE:
+        cola_escrituras.iniciar()
+
+    # Tareas de música con concurrencia acotada (drenadas en el shutdown)
+    tareas_musica.iniciar()
+
+    # Planificador de consultas a MusicGPT (solo el líder consulta)
+    planificador = asyncio.create_task(planificador_musica.ejecutar())
+
+    # Reparte los eventos de estado a las conexiones SSE de este worker
+    eventos = asyncio.create_task(bus_eventos.ejecutar())
+
     yield
 
     # Shutdown
+    planificador.cancel()
+    eventos.cancel()
+    await asyncio.gather(planificador, eventos, return_exceptions=True)
+    await tareas_musica.detener(settings.TAREAS_DRENADO_SEGUNDOS)
+    await cola_escrituras.detener()
+    await clientes_upstream.cerrar()
     await close_db()
 
 
@@ -75,6 +109,7 @@ app.include_router(generation_router, prefix="/viralpost/api")
 app.include_router(payments_router, prefix="/viralpost/api")
 app.include_router(admin_router, prefix="/viralpost/api")
 app.include_router(music_router, prefix="/viralpost/api")
+app.include_router(eventos_router, prefix="/viralpost/api")
 
 
 # ============ RUTAS DE FRONTEND ============
@@ -171,23 +206,24 @@ async def pagina_admin(request: Request):
 # ============ RUTA DE IMÁGENES GENERADAS ============
 
 @app.get("/viralpost/imagenes/{filename}")
-async def servir_imagen_generada(filename: str):
-    """Sirve las imágenes generadas"""
-    ruta = Path(settings.GENERATED_DIR) / filename
-    if ruta.exists():
-        return FileResponse(str(ruta))
-    return {"error": "Imagen no encontrada"}
+async def servir_imagen_generada(filename: str, request: Request):
+    """Sirve las imágenes generadas (nginx envía el archivo vía X-Accel-Redirect)"""
+    return await servir_archivo(
+        request, settings.GENERATED_DIR, "imagenes", filename,
+        mensaje_404="Imagen no encontrada"
+    )
 
 
 # ============ RUTA DE MÚSICA GENERADA ============
 
 @app.get("/viralpost/music/{filename}")
-async def servir_musica_generada(filename: str):
-    """Sirve los archivos de música generados"""
-    ruta = Path(settings.GENERATED_DIR) / "music" / filename
-    if ruta.exists():
-        return FileResponse(str(ruta), media_type="audio/mpeg")
-    return {"error": "Archivo de música no encontrado"}
+async def servir_musica_generada(filename: str, request: Request):
+    """Sirve los archivos de música generados (con Range para adelantar el audio)"""
+    return await servir_archivo(
+        request, os.path.join(settings.GENERATED_DIR, "music"), "music", filename,
+        media_type="audio/mpeg",
+        mensaje_404="Archivo de música no encontrado"
+    )
 
 
 # ============ SOUNDAI - APP DE GENERACIÓN DE MÚSICA ============
@@ -4,7 +4,13 @@ Exportación de modelos
 from app.models.user import User
 from app.models.generation import Generation, EstiloViral, EstadoGeneracion
 from app.models.transaction import Transaction, EstadoTransaccion
-from app.models.music_generation import MusicGeneration, EstadoMusicGeneration
+from app.models.music_generation import MusicGeneration, EstadoMusicGeneration, MusicAudioVariante
+from app.models.job import GenerationJob, EstadoTrabajo
+from app.models.lock import Liderazgo
+from app.models.evento import EventoEstado
+from app.models.singleflight import SolicitudEnVuelo
+from app.models.credito import MovimientoCredito, TipoMovimiento, EstadoMovimiento
+from app.models.estadistica import EstadisticaDiaria
 
 __all__ = [
     "User",
@@ -15,4 +21,14 @@ __all__ = [
     "EstadoTransaccion",
     "MusicGeneration",
     "EstadoMusicGeneration",
+    "MusicAudioVariante",
+    "GenerationJob",
+    "EstadoTrabajo",
+    "Liderazgo",
+    "EventoEstado",
+    "SolicitudEnVuelo",
+    "MovimientoCredito",
+    "TipoMovimiento",
+    "EstadoMovimiento",
+    "EstadisticaDiaria",
 ]
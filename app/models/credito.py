@@ -0,0 +1,46 @@
+"""
+Modelo del Libro de créditos (reservas, consumos, devoluciones y compras)
+"""
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+import enum
+
+
+class TipoMovimiento(str, enum.Enum):
+    """Tipos de movimiento de créditos"""
+    RESERVA = "reserva"  # Crédito apartado para una generación
+    COMPRA = "compra"    # Créditos abonados por un pago
+
+
+class EstadoMovimiento(str, enum.Enum):
+    """Estados de un movimiento"""
+    RESERVADO = "reservado"      # Generación en curso
+    CONFIRMADO = "confirmado"    # Consumido (o abonado, en compras)
+    LIBERADO = "liberado"        # Generación fallida: crédito devuelto
+
+
+class MovimientoCredito(Base):
+    """
+    Movimiento del libro de créditos. El saldo vive en users.creditos y se
+    actualiza en la misma transacción que el movimiento; una reserva pasa a
+    confirmado o liberado una sola vez (UPDATE condicional).
+    """
+    __tablename__ = "movimientos_credito"
+    __table_args__ = (
+        # Resolver la reserva de una generación
+        Index("ix_movimientos_credito_objeto", "tipo_objeto", "objeto_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    tipo = Column(String(20), nullable=False)
+    estado = Column(String(20), nullable=False)
+    cantidad = Column(Integer, nullable=False)
+
+    # A qué corresponde: "imagen"/"musica" + id de la generación, "transaccion" + id
+    tipo_objeto = Column(String(20), nullable=False)
+    objeto_id = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    resuelto_en = Column(DateTime(timezone=True), nullable=True)
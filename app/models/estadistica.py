@@ -0,0 +1,23 @@
+"""
+Modelo de estadísticas diarias (rollups del panel de admin)
+"""
+from sqlalchemy import Column, Date, Float, Integer, String
+from app.core.database import Base
+
+
+class EstadisticaDiaria(Base):
+    """
+    Contador de una métrica en un día (UTC). Se incrementa en la misma
+    transacción que el evento que cuenta (registro, pago, generación
+    terminada); /admin/stats solo suma estas filas.
+
+    dimension distingue estilo o género ("" si la métrica no tiene).
+    """
+    __tablename__ = "estadisticas_diarias"
+
+    fecha = Column(Date, primary_key=True)
+    metrica = Column(String(40), primary_key=True)
+    dimension = Column(String(100), primary_key=True, default="")
+
+    cantidad = Column(Integer, nullable=False, default=0)
+    suma = Column(Float, nullable=False, default=0.0)  # Montos (ingresos MXN)
@@ -0,0 +1,24 @@
+"""
+Modelo de Eventos de estado (transiciones de generaciones para SSE)
+"""
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class EventoEstado(Base):
+    """
+    Transición de estado de una generación (imagen o música).
+    Cada worker web sigue esta tabla y reparte los eventos a sus conexiones
+    SSE; se purga tras EVENTOS_RETENCION_SEGUNDOS.
+    """
+    __tablename__ = "eventos_estado"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    tipo = Column(String(20), nullable=False)  # "imagen" o "musica"
+    objeto_id = Column(Integer, nullable=False)  # id de la generación
+    estado = Column(String(30), nullable=False)
+    datos = Column(JSON, nullable=True)  # audio_url, imagen_url, error...
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
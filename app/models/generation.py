@@ -1,7 +1,7 @@
 """
 Modelo de Generación de Imágenes
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Enum
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -31,6 +31,12 @@ class EstadoGeneracion(str, enum.Enum):
 class Generation(Base):
     """Modelo de generación de imagen"""
     __tablename__ = "generations"
+    __table_args__ = (
+        # Historial del usuario (más recientes primero)
+        Index("ix_generations_user_created", "user_id", "created_at"),
+        # Última completada por estilo (galería y landing)
+        Index("ix_generations_estilo_estado_completed", "estilo", "estado", "completed_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
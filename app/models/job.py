@@ -0,0 +1,44 @@
+"""
+Modelo de Trabajos en cola (generación de imágenes fuera del proceso web)
+"""
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.core.database import Base
+import enum
+
+
+class EstadoTrabajo(str, enum.Enum):
+    """Estados del trabajo en la cola"""
+    PENDIENTE = "pendiente"
+    EN_PROCESO = "en_proceso"
+    COMPLETADO = "completado"
+    ERROR = "error"
+
+
+class GenerationJob(Base):
+    """Trabajo persistente de generación, procesado por app.worker"""
+    __tablename__ = "generation_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    generation_id = Column(Integer, ForeignKey("generations.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    # Datos necesarios para ejecutar la generación (rutas de archivos, mime, precio...)
+    payload = Column(JSON, nullable=False)
+
+    # Estado
+    estado = Column(String(20), default=EstadoTrabajo.PENDIENTE.value, index=True)
+    intentos = Column(Integer, default=0, nullable=False)
+    max_intentos = Column(Integer, default=3, nullable=False)
+    worker_id = Column(String(100), nullable=True)
+    error_mensaje = Column(Text, nullable=True)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Relaciones
+    generation = relationship("Generation")
@@ -0,0 +1,17 @@
+"""
+Modelo de Liderazgo (una sola instancia de una tarea por despliegue)
+"""
+from sqlalchemy import Column, String, DateTime
+from app.core.database import Base
+
+
+class Liderazgo(Base):
+    """
+    Lock con expiración: solo el propietario vigente ejecuta la tarea.
+    Si el proceso muere, otro toma el liderazgo cuando expira_en vence.
+    """
+    __tablename__ = "liderazgos"
+
+    nombre = Column(String(100), primary_key=True)
+    propietario = Column(String(100), nullable=False)
+    expira_en = Column(DateTime, nullable=False)
@@ -1,7 +1,7 @@
 """
 Modelo de Generación de Música con IA
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -13,6 +13,7 @@ class EstadoMusicGeneration(str, enum.Enum):
     PENDIENTE = "pendiente"
     GENERANDO_PROMPT = "generando_prompt"
     GENERANDO_MUSICA = "generando_musica"
+    DESCARGANDO = "descargando"  # Resultado recibido, descargando el audio
     COMPLETADA = "completada"
     ERROR = "error"
 
@@ -20,6 +21,12 @@ class EstadoMusicGeneration(str, enum.Enum):
 class MusicGeneration(Base):
     """Modelo de generación de música"""
     __tablename__ = "music_generations"
+    __table_args__ = (
+        # Historial del usuario (más recientes primero)
+        Index("ix_music_generations_user_created", "user_id", "created_at"),
+        # Canciones recientes del panel de admin
+        Index("ix_music_generations_created", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -58,6 +65,24 @@ class MusicGeneration(Base):
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
+    # Última señal de vida de la descarga (estado DESCARGANDO)
+    descarga_heartbeat_at = Column(DateTime(timezone=True), nullable=True)
 
     # Relaciones
     user = relationship("User", back_populates="music_generaciones")
+
+
+class MusicAudioVariante(Base):
+    """Cada una de las variantes de audio descargadas de una generación"""
+    __tablename__ = "music_audio_variantes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    generacion_id = Column(Integer, ForeignKey("music_generations.id"), nullable=False, index=True)
+    numero = Column(Integer, nullable=False)  # 1, 2... en el orden de MusicGPT
+
+    audio_path = Column(String(500), nullable=True)
+    audio_url = Column(String(500), nullable=True)
+    tamano_bytes = Column(Integer, nullable=True)
+    sha256 = Column(String(64), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,22 @@
+"""
+Modelo de Solicitudes en vuelo (deduplicación de solicitudes idénticas)
+"""
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class SolicitudEnVuelo(Base):
+    """
+    Una solicitud de generación identificada por usuario + contenido
+    normalizado. La clave primaria garantiza que entre todos los workers
+    solo una solicitud idéntica cree la generación (y cobre el crédito).
+    """
+    __tablename__ = "solicitudes_en_vuelo"
+
+    clave = Column(String(64), primary_key=True)  # SHA-256 de usuario + tipo + contenido
+    user_id = Column(Integer, nullable=False, index=True)
+    tipo = Column(String(20), nullable=False)  # "imagen" o "musica"
+    objeto_id = Column(Integer, nullable=False)  # Generación que atiende la solicitud
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
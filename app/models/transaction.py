@@ -1,7 +1,7 @@
 """
 Modelo de Transacciones (pagos de créditos)
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -19,6 +19,10 @@ class EstadoTransaccion(str, enum.Enum):
 class Transaction(Base):
     """Modelo de transacción de pago"""
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Transacciones recientes por estado (admin)
+        Index("ix_transactions_estado_created", "estado", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -1,7 +1,7 @@
 """
 Modelo de Usuario
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -10,6 +10,12 @@ from app.core.database import Base
 class User(Base):
     """Modelo de usuario"""
     __tablename__ = "users"
+    __table_args__ = (
+        # Listado paginado del admin (más recientes primero)
+        Index("ix_users_created", "created_at", "id"),
+        # Top de usuarios del panel de admin
+        Index("ix_users_creditos_usados", "creditos_usados"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String(255), unique=True, index=True, nullable=False)
@@ -41,17 +47,8 @@ class User(Base):
     music_generaciones = relationship("MusicGeneration", back_populates="user")
 
     def tiene_creditos(self, cantidad: int = 1) -> bool:
-        """Verifica si el usuario tiene suficientes créditos"""
+        """
+        Verificación previa del saldo (sin bloqueo). El cobro real lo hace
+        app.services.creditos.reservar_creditos con un UPDATE condicional.
+        """
         return self.creditos >= cantidad
-
-    def usar_credito(self) -> bool:
-        """Usa un crédito si está disponible"""
-        if self.creditos >= 1:
-            self.creditos -= 1
-            self.creditos_usados += 1
-            return True
-        return False
-
-    def agregar_creditos(self, cantidad: int):
-        """Agrega créditos al usuario"""
-        self.creditos += cantidad
@@ -0,0 +1,373 @@
+"""
+Control de admisión hacia los proveedores de IA
+
+Un semáforo por proveedor compartido entre todos los procesos (workers de
+uvicorn y app.worker), respaldado por un archivo SQLite local. Las llamadas
+que exceden la capacidad esperan en una cola acotada (FIFO) con tiempo
+máximo; si la cola está llena se rechazan con un Retry-After estimado en
+lugar de acumularse.
+"""
+import asyncio
+import math
+import sqlite3
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+
+
+# Resultado de un intento de adquirir permiso
+CONCEDIDO = "concedido"
+EN_COLA = "en_cola"
+LLENO = "lleno"
+
+# Cada cuánto revisa su turno quien espera en la cola
+INTERVALO_ESPERA = 0.25
+
+# Una entrada de la cola sin renovar por este tiempo se descarta (proceso caído)
+EXPIRA_COLA_SEGUNDOS = 10.0
+
+# Duración estimada de una llamada mientras no haya mediciones
+DURACION_INICIAL_SEGUNDOS = 30.0
+
+
+class ProveedorSaturadoError(Exception):
+    """No hay capacidad para el proveedor; reintentar en retry_after segundos"""
+
+    def __init__(self, proveedor: str, retry_after: int):
+        self.proveedor = proveedor
+        self.retry_after = retry_after
+        super().__init__(
+            f"Hay demasiadas solicitudes en proceso. Intenta de nuevo en {retry_after} segundos."
+        )
+
+
+class LimitadorProveedores:
+    """Semáforos por proveedor compartidos entre procesos"""
+
+    def __init__(
+        self,
+        ruta: str,
+        capacidades: Dict[str, int],
+        max_cola: int,
+        espera_max: float,
+        lease_segundos: float
+    ):
+        self.ruta = ruta
+        self.capacidades = capacidades
+        self.max_cola = max_cola
+        self.espera_max = espera_max
+        self.lease_segundos = lease_segundos
+        self._inicializada = False
+
+        # Contadores del proceso actual
+        self.concedidos: Dict[str, int] = {p: 0 for p in capacidades}
+        self.rechazados: Dict[str, int] = {p: 0 for p in capacidades}
+
+    # ---------- API pública ----------
+
+    @asynccontextmanager
+    async def permiso(self, proveedor: str, espera_max: Optional[float] = None):
+        """
+        Mantiene un permiso del proveedor durante el bloque:
+
+            async with limitador.permiso("gemini"):
+                await client.post(...)
+
+        Lanza ProveedorSaturadoError si la cola está llena o se agota la espera.
+        """
+        token = await self.adquirir(proveedor, espera_max)
+        inicio = time.monotonic()
+        renovacion = asyncio.create_task(self._mantener(token))
+        try:
+            yield
+        finally:
+            renovacion.cancel()
+            await asyncio.to_thread(self._liberar, proveedor, token, time.monotonic() - inicio)
+
+    def por_intento(self, proveedor: str) -> "PermisoPorIntento":
+        """
+        Permiso para llamar_con_reintentos: se toma en cada intento y se
+        suelta antes de cada espera de backoff.
+
+            async with limitador.por_intento("gemini") as permiso:
+                response = await llamar_con_reintentos("gemini", ..., permiso=permiso)
+        """
+        return PermisoPorIntento(self, proveedor)
+
+    async def adquirir(self, proveedor: str, espera_max: Optional[float] = None) -> str:
+        """Obtiene un permiso (esperando turno si hace falta). Retorna su token."""
+        token = uuid.uuid4().hex
+        limite = time.monotonic() + (self.espera_max if espera_max is None else espera_max)
+
+        estado, retry_after = await asyncio.to_thread(self._intentar, proveedor, token, True)
+        if estado == LLENO:
+            self.rechazados[proveedor] += 1
+            raise ProveedorSaturadoError(proveedor, retry_after)
+
+        try:
+            while estado != CONCEDIDO:
+                if time.monotonic() >= limite:
+                    self.rechazados[proveedor] += 1
+                    raise ProveedorSaturadoError(proveedor, retry_after)
+                await asyncio.sleep(INTERVALO_ESPERA)
+                estado, retry_after = await asyncio.to_thread(self._intentar, proveedor, token, False)
+        except BaseException:
+            await asyncio.to_thread(self._salir_de_cola, token)
+            raise
+
+        self.concedidos[proveedor] += 1
+        return token
+
+    async def _mantener(self, token: str):
+        """Renueva el lease mientras el permiso siga en uso (llamadas largas)"""
+        while True:
+            await asyncio.sleep(self.lease_segundos / 3)
+            await asyncio.to_thread(self._renovar, token)
+
+    async def verificar_capacidad(self, proveedor: str):
+        """
+        Chequeo previo para la API: lanza ProveedorSaturadoError si la cola
+        del proveedor ya está llena (antes de cobrar el crédito).
+        """
+        activos, en_cola, _ = await asyncio.to_thread(self._leer_estado, proveedor)
+        if activos >= self.capacidades[proveedor] and en_cola >= self.max_cola:
+            self.rechazados[proveedor] += 1
+            raise ProveedorSaturadoError(proveedor, await self.estimar_espera(proveedor, en_cola))
+
+    async def estimar_espera(self, proveedor: str, delante: int) -> int:
+        """Segundos estimados hasta que se atienda a quien tiene `delante` solicitudes antes"""
+        _, _, duracion = await asyncio.to_thread(self._leer_estado, proveedor)
+        return _retry_after(delante, self.capacidades[proveedor], duracion)
+
+    async def estadisticas(self) -> dict:
+        """Estado actual de cada proveedor (global) y contadores del proceso"""
+        resultado = {}
+        for proveedor, capacidad in self.capacidades.items():
+            activos, en_cola, duracion = await asyncio.to_thread(self._leer_estado, proveedor)
+            resultado[proveedor] = {
+                "capacidad": capacidad,
+                "activos": activos,
+                "en_cola": en_cola,
+                "max_cola": self.max_cola,
+                "duracion_media_s": round(duracion, 1),
+                "concedidos": self.concedidos[proveedor],
+                "rechazados": self.rechazados[proveedor]
+            }
+        return resultado
+
+    # ---------- SQLite (se ejecuta en un thread) ----------
+
+    def _conectar(self) -> sqlite3.Connection:
+        if not self._inicializada:
+            Path(self.ruta).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.ruta, timeout=10.0, isolation_level=None)
+        if not self._inicializada:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS admision_permisos (
+                    token TEXT PRIMARY KEY,
+                    proveedor TEXT NOT NULL,
+                    expira REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS admision_cola (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    token TEXT UNIQUE NOT NULL,
+                    proveedor TEXT NOT NULL,
+                    expira REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS admision_duracion (
+                    proveedor TEXT PRIMARY KEY,
+                    media REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_admision_permisos_proveedor ON admision_permisos (proveedor);
+                CREATE INDEX IF NOT EXISTS ix_admision_cola_proveedor ON admision_cola (proveedor, id);
+                """
+            )
+            self._inicializada = True
+        return conn
+
+    def _intentar(self, proveedor: str, token: str, primera_vez: bool) -> Tuple[str, int]:
+        """
+        Intenta conceder el permiso en una transacción exclusiva.
+        La primera vez entra a la cola (o se rechaza si está llena); después
+        solo se concede cuando le toca el turno.
+        """
+        capacidad = self.capacidades[proveedor]
+        ahora = time.time()
+        conn = self._conectar()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM admision_permisos WHERE expira < ?", (ahora,))
+            conn.execute("DELETE FROM admision_cola WHERE expira < ?", (ahora,))
+
+            activos = conn.execute(
+                "SELECT COUNT(*) FROM admision_permisos WHERE proveedor = ?", (proveedor,)
+            ).fetchone()[0]
+
+            fila = conn.execute("SELECT id FROM admision_cola WHERE token = ?", (token,)).fetchone()
+            if fila is None:
+                en_cola = conn.execute(
+                    "SELECT COUNT(*) FROM admision_cola WHERE proveedor = ?", (proveedor,)
+                ).fetchone()[0]
+                if primera_vez and activos < capacidad and en_cola == 0:
+                    self._conceder(conn, proveedor, token, ahora)
+                    conn.execute("COMMIT")
+                    return CONCEDIDO, 0
+                if primera_vez and en_cola >= self.max_cola:
+                    duracion = self._duracion(conn, proveedor)
+                    conn.execute("COMMIT")
+                    return LLENO, _retry_after(en_cola, capacidad, duracion)
+                # Nuevo en la cola (o su entrada expiró: vuelve a formarse)
+                cursor = conn.execute(
+                    "INSERT INTO admision_cola (token, proveedor, expira) VALUES (?, ?, ?)",
+                    (token, proveedor, ahora + EXPIRA_COLA_SEGUNDOS)
+                )
+                mi_id = cursor.lastrowid
+            else:
+                mi_id = fila[0]
+
+            delante = conn.execute(
+                "SELECT COUNT(*) FROM admision_cola WHERE proveedor = ? AND id < ?", (proveedor, mi_id)
+            ).fetchone()[0]
+
+            if activos + delante < capacidad:
+                conn.execute("DELETE FROM admision_cola WHERE id = ?", (mi_id,))
+                self._conceder(conn, proveedor, token, ahora)
+                conn.execute("COMMIT")
+                return CONCEDIDO, 0
+
+            conn.execute(
+                "UPDATE admision_cola SET expira = ? WHERE id = ?",
+                (ahora + EXPIRA_COLA_SEGUNDOS, mi_id)
+            )
+            duracion = self._duracion(conn, proveedor)
+            conn.execute("COMMIT")
+            return EN_COLA, _retry_after(delante, capacidad, duracion)
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _conceder(self, conn: sqlite3.Connection, proveedor: str, token: str, ahora: float):
+        conn.execute(
+            "INSERT INTO admision_permisos (token, proveedor, expira) VALUES (?, ?, ?)",
+            (token, proveedor, ahora + self.lease_segundos)
+        )
+
+    def _liberar(self, proveedor: str, token: str, duracion: float):
+        """Libera el permiso y actualiza la duración media (EWMA)"""
+        conn = self._conectar()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM admision_permisos WHERE token = ?", (token,))
+            media = self._duracion(conn, proveedor)
+            conn.execute(
+                "INSERT OR REPLACE INTO admision_duracion (proveedor, media) VALUES (?, ?)",
+                (proveedor, 0.8 * media + 0.2 * duracion)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _renovar(self, token: str):
+        conn = self._conectar()
+        try:
+            conn.execute(
+                "UPDATE admision_permisos SET expira = ? WHERE token = ?",
+                (time.time() + self.lease_segundos, token)
+            )
+        finally:
+            conn.close()
+
+    def _salir_de_cola(self, token: str):
+        conn = self._conectar()
+        try:
+            conn.execute("DELETE FROM admision_cola WHERE token = ?", (token,))
+        finally:
+            conn.close()
+
+    def _duracion(self, conn: sqlite3.Connection, proveedor: str) -> float:
+        fila = conn.execute(
+            "SELECT media FROM admision_duracion WHERE proveedor = ?", (proveedor,)
+        ).fetchone()
+        return fila[0] if fila else DURACION_INICIAL_SEGUNDOS
+
+    def _leer_estado(self, proveedor: str) -> Tuple[int, int, float]:
+        """(activos, en_cola, duracion_media) sin contar entradas expiradas"""
+        ahora = time.time()
+        conn = self._conectar()
+        try:
+            activos = conn.execute(
+                "SELECT COUNT(*) FROM admision_permisos WHERE proveedor = ? AND expira >= ?",
+                (proveedor, ahora)
+            ).fetchone()[0]
+            en_cola = conn.execute(
+                "SELECT COUNT(*) FROM admision_cola WHERE proveedor = ? AND expira >= ?",
+                (proveedor, ahora)
+            ).fetchone()[0]
+            return activos, en_cola, self._duracion(conn, proveedor)
+        finally:
+            conn.close()
+
+
+class PermisoPorIntento:
+    """
+    Permiso que solo se retiene mientras hay un intento en curso: durante
+    una racha de 429/503 los espacios quedan libres para otras solicitudes
+    en vez de quedar ocupados por llamadas que duermen su backoff.
+    El último intento lo conserva hasta salir del bloque (lectura de la
+    respuesta en streaming).
+    """
+
+    def __init__(self, limitador: LimitadorProveedores, proveedor: str):
+        self.limitador = limitador
+        self.proveedor = proveedor
+        self._token: Optional[str] = None
+        self._inicio = 0.0
+        self._renovacion: Optional[asyncio.Task] = None
+
+    async def tomar(self):
+        if self._token is None:
+            self._token = await self.limitador.adquirir(self.proveedor)
+            self._inicio = time.monotonic()
+            self._renovacion = asyncio.create_task(self.limitador._mantener(self._token))
+
+    async def soltar(self):
+        if self._token is None:
+            return
+        token, self._token = self._token, None
+        self._renovacion.cancel()
+        await asyncio.to_thread(
+            self.limitador._liberar, self.proveedor, token, time.monotonic() - self._inicio
+        )
+
+    async def __aenter__(self) -> "PermisoPorIntento":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.soltar()
+
+
+def _retry_after(delante: int, capacidad: int, duracion: float) -> int:
+    """Rondas de `capacidad` llamadas necesarias para atender a los de adelante"""
+    return max(1, math.ceil((delante // max(1, capacidad) + 1) * duracion))
+
+
+# Instancia global del limitador
+limitador = LimitadorProveedores(
+    ruta=settings.ADMISION_DB_PATH,
+    capacidades={
+        "gemini": settings.ADMISION_CONCURRENCIA_GEMINI,
+        "musicgpt": settings.ADMISION_CONCURRENCIA_MUSICGPT,
+    },
+    max_cola=settings.ADMISION_MAX_COLA,
+    espera_max=settings.ADMISION_ESPERA_MAX_SEGUNDOS,
+    lease_segundos=settings.ADMISION_LEASE_SEGUNDOS
+)
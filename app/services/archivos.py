@@ -0,0 +1,161 @@
+"""
+Entrega de archivos generados (imágenes y audio)
+
+En producción la app solo valida la solicitud y responde con
+X-Accel-Redirect: nginx envía los bytes desde una location interna
+(sendfile, Range, ETag y 304 incluidos) y los workers de uvicorn nunca
+mueven el archivo. Sin nginx (desarrollo) se sirven desde Python con ETag
+fuerte, peticiones condicionales y Range para poder adelantar el audio.
+"""
+import asyncio
+import mimetypes
+import os
+import re
+import stat
+from email.utils import formatdate
+from typing import AsyncIterator, Optional, Tuple
+
+import aiofiles
+from fastapi import Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+
+from app.core.config import settings
+
+
+# Nombres generados con un token aleatorio/hash (p. ej. 42_1a2b3c4d.png,
+# music_7_1_9f8e7d6c.mp3): nunca se sobrescriben, se pueden cachear para siempre
+_NOMBRE_INMUTABLE = re.compile(r"_[0-9a-f]{8}\.[A-Za-z0-9]+$")
+
+# Solo nombres simples dentro del directorio (sin rutas ni archivos ocultos)
+_NOMBRE_VALIDO = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+_RANGO = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Bloque de lectura al servir un rango desde Python
+_BLOQUE_LECTURA = 64 * 1024
+
+
+class _RangoNoSatisfacible(Exception):
+    pass
+
+
+def cache_control(filename: str) -> str:
+    """Cache-Control según si el nombre es inmutable"""
+    if _NOMBRE_INMUTABLE.search(filename):
+        return "public, max-age=31536000, immutable"
+    return "public, max-age=3600"
+
+
+def _parsear_rango(valor: Optional[str], tamano: int) -> Optional[Tuple[int, int]]:
+    """
+    (inicio, fin) inclusivo de un header Range de un solo rango.
+    None si no hay Range o no se entiende (se responde el archivo completo).
+    """
+    if not valor:
+        return None
+    coincidencia = _RANGO.match(valor.strip())
+    if not coincidencia:
+        return None
+
+    inicio, fin = coincidencia.groups()
+    if not inicio:
+        # Sufijo: los últimos N bytes
+        if not fin:
+            return None
+        sufijo = int(fin)
+        if sufijo == 0 or tamano == 0:
+            raise _RangoNoSatisfacible()
+        return max(0, tamano - sufijo), tamano - 1
+
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or inicio > fin:
+        raise _RangoNoSatisfacible()
+    return inicio, fin
+
+
+def _coincide_etag(if_none_match: str, etag: str) -> bool:
+    etiquetas = [e.strip() for e in if_none_match.split(",")]
+    return "*" in etiquetas or etag in etiquetas or f"W/{etag}" in etiquetas
+
+
+async def _leer_rango(ruta: str, inicio: int, fin: int) -> AsyncIterator[bytes]:
+    async with aiofiles.open(ruta, "rb") as f:
+        await f.seek(inicio)
+        restante = fin - inicio + 1
+        while restante > 0:
+            bloque = await f.read(min(_BLOQUE_LECTURA, restante))
+            if not bloque:
+                break
+            restante -= len(bloque)
+            yield bloque
+
+
+async def servir_archivo(
+    request: Request,
+    directorio: str,
+    ubicacion_interna: str,
+    filename: str,
+    media_type: Optional[str] = None,
+    mensaje_404: str = "Archivo no encontrado"
+) -> Response:
+    """
+    Responde un archivo de `directorio`.
+
+    Con ARCHIVOS_X_ACCEL delega el envío a nginx
+    (ARCHIVOS_X_ACCEL_PREFIJO/ubicacion_interna/filename) sin tocar el disco.
+    """
+    if not _NOMBRE_VALIDO.match(filename):
+        return JSONResponse({"error": mensaje_404}, status_code=404)
+
+    if settings.ARCHIVOS_X_ACCEL:
+        return Response(headers={
+            "X-Accel-Redirect": f"{settings.ARCHIVOS_X_ACCEL_PREFIJO}/{ubicacion_interna}/{filename}",
+            "Cache-Control": cache_control(filename)
+        })
+
+    ruta = os.path.join(directorio, filename)
+    try:
+        # Un solo stat por solicitud (FileResponse lo reutiliza)
+        info = await asyncio.to_thread(os.stat, ruta)
+    except FileNotFoundError:
+        info = None
+    if info is None or not stat.S_ISREG(info.st_mode):
+        return JSONResponse({"error": mensaje_404}, status_code=404)
+
+    etag = f'"{info.st_size:x}-{info.st_mtime_ns:x}"'
+    media_type = media_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(info.st_mtime, usegmt=True),
+        "Cache-Control": cache_control(filename),
+        "Accept-Ranges": "bytes"
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _coincide_etag(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    rango_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != etag:
+        # El cliente tiene otra versión: se responde completo
+        rango_header = None
+
+    try:
+        rango = _parsear_rango(rango_header, info.st_size)
+    except _RangoNoSatisfacible:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{info.st_size}"})
+
+    if rango is None:
+        return FileResponse(ruta, media_type=media_type, headers=headers, stat_result=info)
+
+    inicio, fin = rango
+    headers["Content-Range"] = f"bytes {inicio}-{fin}/{info.st_size}"
+    headers["Content-Length"] = str(fin - inicio + 1)
+    return StreamingResponse(
+        _leer_rango(ruta, inicio, fin),
+        status_code=206,
+        media_type=media_type,
+        headers=headers
+    )
@@ -0,0 +1,145 @@
+"""
+Libro de créditos: reservar, confirmar y liberar
+
+Antes cada request leía el saldo, lo modificaba en Python y lo escribía
+(User.usar_credito); dos workers con el mismo usuario podían cobrar sobre
+el mismo saldo, y las devoluciones manuales (creditos += 1) podían
+repetirse si una generación se marcaba como error dos veces.
+
+Ahora:
+- reservar: un solo UPDATE users ... WHERE creditos >= n (atómico entre
+  procesos) + una fila "reservado" por generación en movimientos_credito
+- confirmar: la generación terminó bien; la reserva pasa a "confirmado"
+- liberar: la generación falló; UPDATE condicional de la reserva a
+  "liberado" y, solo si cambió, el crédito vuelve al saldo
+
+Ninguna función hace commit: se confirman junto con el cambio de estado de
+la generación, en la misma transacción.
+"""
+from typing import List
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import ahora_utc
+from app.models.user import User
+from app.models.credito import MovimientoCredito, TipoMovimiento, EstadoMovimiento
+
+
+TIPO_TRANSACCION = "transaccion"
+
+
+class CreditosInsuficientesError(Exception):
+    """El saldo no alcanza para la reserva"""
+
+    def __init__(self, necesarios: int):
+        self.necesarios = necesarios
+        super().__init__(f"Se necesitan {necesarios} créditos")
+
+
+async def reservar_creditos(
+    db: AsyncSession,
+    usuario: User,
+    tipo_objeto: str,
+    objeto_ids: List[int]
+):
+    """
+    Aparta un crédito por cada generación de objeto_ids.
+    Lanza CreditosInsuficientesError si el saldo (en la DB) no alcanza.
+
+    El saldo en memoria de `usuario` se actualiza sin marcarlo como
+    modificado, así el flush no vuelve a escribir un valor viejo.
+    """
+    cantidad = len(objeto_ids)
+    result = await db.execute(
+        update(User)
+        .where(User.id == usuario.id, User.creditos >= cantidad)
+        .values(
+            creditos=User.creditos - cantidad,
+            creditos_usados=User.creditos_usados + cantidad
+        )
+        .execution_options(synchronize_session="evaluate")
+    )
+    if result.rowcount != 1:
+        raise CreditosInsuficientesError(cantidad)
+
+    db.add_all([
+        MovimientoCredito(
+            user_id=usuario.id,
+            tipo=TipoMovimiento.RESERVA.value,
+            estado=EstadoMovimiento.RESERVADO.value,
+            cantidad=1,
+            tipo_objeto=tipo_objeto,
+            objeto_id=objeto_id
+        )
+        for objeto_id in objeto_ids
+    ])
+
+
+async def confirmar_reserva(db: AsyncSession, tipo_objeto: str, objeto_id: int) -> bool:
+    """
+    La generación terminó bien: el crédito queda consumido. Idempotente,
+    retorna True solo la vez que la reserva se confirmó.
+    """
+    result = await db.execute(
+        update(MovimientoCredito)
+        .where(
+            MovimientoCredito.tipo_objeto == tipo_objeto,
+            MovimientoCredito.objeto_id == objeto_id,
+            MovimientoCredito.estado == EstadoMovimiento.RESERVADO.value
+        )
+        .values(estado=EstadoMovimiento.CONFIRMADO.value, resuelto_en=ahora_utc())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+async def liberar_reserva(db: AsyncSession, user_id: int, tipo_objeto: str, objeto_id: int) -> bool:
+    """
+    La generación falló: devuelve el crédito. Idempotente, una reserva solo
+    se libera una vez. Retorna True si se devolvió.
+    """
+    result = await db.execute(
+        update(MovimientoCredito)
+        .where(
+            MovimientoCredito.tipo_objeto == tipo_objeto,
+            MovimientoCredito.objeto_id == objeto_id,
+            MovimientoCredito.estado == EstadoMovimiento.RESERVADO.value
+        )
+        .values(estado=EstadoMovimiento.LIBERADO.value, resuelto_en=ahora_utc())
+        .execution_options(synchronize_session=False)
+    )
+    # Cada reserva es de un crédito
+    liberados = result.rowcount
+    if not liberados:
+        return False
+
+    await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            creditos=User.creditos + liberados,
+            creditos_usados=User.creditos_usados - liberados
+        )
+        .execution_options(synchronize_session="evaluate")
+    )
+    return True
+
+
+async def abonar_creditos(db: AsyncSession, user_id: int, cantidad: int, transaccion_id: int):
+    """Suma créditos comprados al saldo y lo registra en el libro"""
+    await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(creditos=User.creditos + cantidad)
+        .execution_options(synchronize_session="evaluate")
+    )
+    db.add(MovimientoCredito(
+        user_id=user_id,
+        tipo=TipoMovimiento.COMPRA.value,
+        estado=EstadoMovimiento.CONFIRMADO.value,
+        cantidad=cantidad,
+        tipo_objeto=TIPO_TRANSACCION,
+        objeto_id=transaccion_id,
+        resuelto_en=ahora_utc()
+    ))
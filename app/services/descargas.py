@@ -0,0 +1,170 @@
+"""
+Descarga de archivos generados (audio de MusicGPT) por streaming
+
+- Escribe por bloques a un .part con aiofiles: la memoria por descarga
+  queda acotada al tamaño del bloque.
+- Si la transferencia se corta, reanuda con Range desde lo ya escrito
+  (también tras un reinicio: el .part queda en disco).
+- Verifica el tamaño contra Content-Length/Content-Range y el MD5 contra
+  el ETag de S3 (o un SHA-256 esperado) antes de renombrar el archivo.
+"""
+import asyncio
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import aiofiles
+import httpx
+
+from app.core.config import settings
+from app.services.resilience import llamar_con_reintentos
+
+
+# ETag de un objeto S3 subido en una sola parte: MD5 del contenido
+_ETAG_MD5 = re.compile(r'^"?([0-9a-f]{32})"?$')
+
+# Bloque para releer un .part existente al reanudar
+_BLOQUE_RELECTURA = 1024 * 1024
+
+
+class DescargaError(Exception):
+    """La descarga no se completó o no pasó la verificación"""
+
+
+def _hashes_parciales(ruta: str) -> Tuple[int, "hashlib._Hash", "hashlib._Hash"]:
+    """(bytes, md5, sha256) de un .part existente, para continuar los hashes al reanudar"""
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    escritos = 0
+    if os.path.exists(ruta):
+        with open(ruta, "rb") as f:
+            while bloque := f.read(_BLOQUE_RELECTURA):
+                md5.update(bloque)
+                sha256.update(bloque)
+                escritos += len(bloque)
+    return escritos, md5, sha256
+
+
+def _tamano_total(response: httpx.Response) -> Optional[int]:
+    """Tamaño total del archivo según Content-Range (206) o Content-Length (200)"""
+    if response.status_code == 206:
+        rango = response.headers.get("content-range", "")
+        total = rango.rsplit("/", 1)[-1]
+        return int(total) if total.isdigit() else None
+    longitud = response.headers.get("content-length")
+    return int(longitud) if longitud and longitud.isdigit() else None
+
+
+def _eliminar(ruta: str):
+    if os.path.exists(ruta):
+        os.remove(ruta)
+
+
+async def descargar_archivo(
+    client: httpx.AsyncClient,
+    url: str,
+    ruta: str,
+    sha256_esperado: Optional[str] = None
+) -> Dict[str, object]:
+    """
+    Descarga `url` en `ruta` por streaming, reanudando cortes con Range.
+
+    Retorna {"bytes": int, "sha256": str}. Lanza DescargaError si no se
+    completa tras DESCARGA_MAX_REANUDACIONES o si la verificación falla.
+    """
+    Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+    temporal = f"{ruta}.part"
+    etag: Optional[str] = None
+
+    for _ in range(settings.DESCARGA_MAX_REANUDACIONES + 1):
+        escritos, md5, sha256 = await asyncio.to_thread(_hashes_parciales, temporal)
+
+        headers = {}
+        if escritos:
+            headers["Range"] = f"bytes={escritos}-"
+            if etag:
+                # Si el archivo cambió, el servidor responde 200 con el archivo completo
+                headers["If-Range"] = etag
+
+        total: Optional[int] = None
+        try:
+            response = await llamar_con_reintentos("descargas", lambda: client.send(
+                client.build_request("GET", url, headers=headers),
+                stream=True
+            ))
+            try:
+                if response.status_code == 416 and escritos:
+                    # El .part no corresponde al archivo actual: empezar de cero
+                    await asyncio.to_thread(_eliminar, temporal)
+                    continue
+                if response.is_error:
+                    await response.aread()
+                response.raise_for_status()
+
+                if escritos and response.status_code != 206:
+                    # El servidor ignoró el Range
+                    escritos, md5, sha256 = 0, hashlib.md5(), hashlib.sha256()
+
+                etag = response.headers.get("etag") or etag
+                total = _tamano_total(response)
+
+                async with aiofiles.open(temporal, "ab" if escritos else "wb") as f:
+                    async for datos in response.aiter_bytes(settings.DESCARGA_BLOQUE_BYTES):
+                        md5.update(datos)
+                        sha256.update(datos)
+                        await f.write(datos)
+                        escritos += len(datos)
+            finally:
+                await response.aclose()
+        except httpx.TransportError as e:
+            print(f"[DESCARGA] Transferencia cortada en {escritos} bytes ({type(e).__name__}), reanudando")
+            continue
+
+        if total is not None and escritos < total:
+            print(f"[DESCARGA] Recibidos {escritos} de {total} bytes, reanudando")
+            continue
+
+        # Verificación: tamaño, MD5 del ETag de S3 y SHA-256 esperado
+        coincide_etag = _ETAG_MD5.match(etag or "")
+        if total is not None and escritos != total:
+            error = f"tamaño {escritos} distinto del esperado {total}"
+        elif coincide_etag and coincide_etag.group(1) != md5.hexdigest():
+            error = "el MD5 no coincide con el ETag"
+        elif sha256_esperado and sha256_esperado != sha256.hexdigest():
+            error = "el SHA-256 no coincide"
+        else:
+            os.replace(temporal, ruta)
+            return {"bytes": escritos, "sha256": sha256.hexdigest()}
+
+        await asyncio.to_thread(_eliminar, temporal)
+        raise DescargaError(f"Descarga inválida de {url}: {error}")
+
+    raise DescargaError(
+        f"Descarga incompleta de {url} tras {settings.DESCARGA_MAX_REANUDACIONES} reanudaciones"
+    )
+
+
+async def descargar_varios(
+    client: httpx.AsyncClient,
+    destinos: List[Tuple[str, str]]
+) -> List[Optional[Dict[str, object]]]:
+    """
+    Descarga varios archivos [(url, ruta), ...] en paralelo.
+    Retorna un resultado por destino (None si esa descarga falló).
+    """
+    resultados = await asyncio.gather(
+        *(descargar_archivo(client, url, ruta) for url, ruta in destinos),
+        return_exceptions=True
+    )
+    salida = []
+    for (url, _), resultado in zip(destinos, resultados):
+        if isinstance(resultado, BaseException):
+            if not isinstance(resultado, Exception):
+                raise resultado
+            print(f"[DESCARGA] Error descargando {url}: {resultado}")
+            salida.append(None)
+        else:
+            salida.append(resultado)
+    return salida
@@ -0,0 +1,140 @@
+"""
+Cola de escrituras de fondo (un solo escritor por proceso)
+
+SQLite admite un escritor a la vez: si cada tarea de fondo abre su propia
+transacción, bajo una ráfaga compiten por el lock del archivo y la latencia
+se dispara hasta terminar en "database is locked". Aquí las escrituras
+cortas de las tareas de fondo se encolan y un único escritor las ejecuta en
+lotes: varias operaciones, un solo commit (un solo fsync del WAL).
+
+Si una operación del lote falla se deshace el lote y sus operaciones se
+reintentan una por una, así el error solo le llega a la que lo causó.
+
+Sin iniciar (app.worker, scripts) o con PostgreSQL, escribir() ejecuta la
+operación en su propia sesión como antes.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+
+
+# Recibe la sesión del lote; no debe hacer commit ni rollback
+Operacion = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class ColaEscrituras:
+    """Escritor único que agrupa las escrituras de fondo en lotes"""
+
+    def __init__(self, max_lote: int, espera_ms: int):
+        self.max_lote = max_lote
+        self.espera = espera_ms / 1000
+        self._cola: Optional["asyncio.Queue[Tuple[Operacion, asyncio.Future]]"] = None
+        self._escritor: Optional[asyncio.Task] = None
+
+        self.lotes = 0
+        self.operaciones = 0
+        self.reintentos = 0
+        self.max_en_cola = 0
+
+    @property
+    def activa(self) -> bool:
+        return self._escritor is not None and not self._escritor.done()
+
+    def iniciar(self):
+        """Arranca el escritor (en el startup del lifespan)"""
+        self._cola = asyncio.Queue()
+        self._escritor = asyncio.create_task(self._ejecutar())
+
+    async def detener(self):
+        """Confirma lo que quede en la cola y detiene el escritor"""
+        if self._cola is None:
+            return
+        await self._cola.join()
+        self._escritor.cancel()
+        await asyncio.gather(self._escritor, return_exceptions=True)
+        self._escritor = None
+
+    async def escribir(self, operacion: Operacion) -> Any:
+        """
+        Ejecuta operacion(db) y confirma. Retorna lo que retorne la operación
+        (p. ej. el rowcount de un UPDATE condicional).
+        """
+        if not self.activa:
+            async with async_session_maker() as db:
+                resultado = await operacion(db)
+                await db.commit()
+                return resultado
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._cola.put_nowait((operacion, futuro))
+        self.max_en_cola = max(self.max_en_cola, self._cola.qsize())
+        return await futuro
+
+    async def _ejecutar(self):
+        while True:
+            lote = [await self._cola.get()]
+            # Breve espera para que se sumen las escrituras de la misma ráfaga
+            if self.espera:
+                await asyncio.sleep(self.espera)
+            while len(lote) < self.max_lote and not self._cola.empty():
+                lote.append(self._cola.get_nowait())
+
+            try:
+                await self._confirmar_lote(lote)
+            finally:
+                for _ in lote:
+                    self._cola.task_done()
+
+    async def _confirmar_lote(self, lote: List[Tuple[Operacion, asyncio.Future]]):
+        self.lotes += 1
+        self.operaciones += len(lote)
+        try:
+            async with async_session_maker() as db:
+                resultados = [await operacion(db) for operacion, _ in lote]
+                await db.commit()
+        except Exception as e:
+            if len(lote) == 1:
+                if not lote[0][1].done():
+                    lote[0][1].set_exception(e)
+                return
+            # Aislar la que falló: cada una en su propia transacción
+            self.reintentos += len(lote)
+            for operacion, futuro in lote:
+                await self._confirmar_sola(operacion, futuro)
+            return
+
+        for (_, futuro), resultado in zip(lote, resultados):
+            if not futuro.done():
+                futuro.set_result(resultado)
+
+    async def _confirmar_sola(self, operacion: Operacion, futuro: asyncio.Future):
+        try:
+            async with async_session_maker() as db:
+                resultado = await operacion(db)
+                await db.commit()
+        except Exception as e:
+            if not futuro.done():
+                futuro.set_exception(e)
+            return
+        if not futuro.done():
+            futuro.set_result(resultado)
+
+    def metricas(self) -> dict:
+        """Lotes confirmados y tamaño medio (por proceso)"""
+        return {
+            "activa": self.activa,
+            "en_cola": self._cola.qsize() if self._cola else 0,
+            "max_en_cola": self.max_en_cola,
+            "lotes": self.lotes,
+            "operaciones": self.operaciones,
+            "operaciones_por_lote": round(self.operaciones / self.lotes, 1) if self.lotes else 0,
+            "reintentos": self.reintentos
+        }
+
+
+# Instancia global (se inicia en el lifespan solo con SQLite)
+cola_escrituras = ColaEscrituras(settings.SQLITE_ESCRITURAS_LOTE, settings.SQLITE_ESCRITURAS_ESPERA_MS)
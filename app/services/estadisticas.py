@@ -0,0 +1,154 @@
+"""
+Estadísticas diarias (rollups) del panel de admin
+
+/admin/stats hacía ~25 agregados (COUNT/SUM por rango de fechas) sobre
+users, transactions, generations y music_generations en cada carga: el
+costo crecía con el tamaño de las tablas. Ahora cada evento suma 1 a su
+fila (día, métrica, dimensión) de estadisticas_diarias, en la misma
+transacción que lo produce, y el panel solo suma esas filas.
+
+Métricas:
+- usuarios: registros
+- pagos: pagos completados (suma = ingresos MXN)
+- creditos_vendidos: créditos de esos pagos
+- generaciones_completadas / generaciones_fallidas: por estilo
+- musica_completadas / musica_fallidas: por género
+
+Las generaciones se cuentan al terminar: los incrementos van donde se
+confirma o libera la reserva del crédito, que ocurre una sola vez por
+generación.
+
+Recalcular todo desde las tablas (backfill):
+    python -m app.services.estadisticas
+"""
+import asyncio
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import Date, cast, delete, func, insert, literal, literal_column, select
+from sqlalchemy.dialects.postgresql import insert as insert_postgres
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import ES_SQLITE, ahora_utc
+from app.models.estadistica import EstadisticaDiaria
+
+
+USUARIOS = "usuarios"
+PAGOS = "pagos"
+CREDITOS_VENDIDOS = "creditos_vendidos"
+GENERACIONES_COMPLETADAS = "generaciones_completadas"
+GENERACIONES_FALLIDAS = "generaciones_fallidas"
+MUSICA_COMPLETADAS = "musica_completadas"
+MUSICA_FALLIDAS = "musica_fallidas"
+
+
+async def sumar_estadistica(
+    db: AsyncSession,
+    metrica: str,
+    dimension: Optional[str] = None,
+    cantidad: int = 1,
+    suma: float = 0.0,
+    fecha: Optional[date] = None
+):
+    """
+    Incrementa la fila del día (hoy UTC por defecto) con un upsert.
+    No hace commit: se confirma junto con el evento que cuenta.
+    """
+    insertar = insert_sqlite if ES_SQLITE else insert_postgres
+    tabla = EstadisticaDiaria.__table__
+    sentencia = insertar(tabla).values(
+        fecha=fecha or ahora_utc().date(),
+        metrica=metrica,
+        dimension=dimension or "",
+        cantidad=cantidad,
+        suma=suma
+    )
+    await db.execute(
+        sentencia.on_conflict_do_update(
+            index_elements=[tabla.c.fecha, tabla.c.metrica, tabla.c.dimension],
+            set_={
+                "cantidad": tabla.c.cantidad + sentencia.excluded.cantidad,
+                "suma": tabla.c.suma + sentencia.excluded.suma
+            }
+        )
+    )
+
+
+# ========== BACKFILL ==========
+
+def _dia(conn: Connection, columna):
+    """Fecha UTC de un timestamp, igual en SQLite y PostgreSQL"""
+    if conn.dialect.name == "postgresql":
+        # Sin parámetros enlazados: la expresión debe ser idéntica en SELECT y GROUP BY
+        return cast(func.timezone(literal_column("'UTC'"), columna), Date)
+    return func.date(columna)
+
+
+def recalcular_estadisticas(conn: Connection):
+    """
+    Reconstruye estadisticas_diarias desde las tablas de origen (en la
+    transacción de `conn`). Las generaciones fallidas sin fecha de fin se
+    cuentan en su día de creación.
+    """
+    from app.models import (
+        User, Transaction, EstadoTransaccion, Generation, EstadoGeneracion,
+        MusicGeneration, EstadoMusicGeneration
+    )
+
+    tabla = EstadisticaDiaria.__table__
+    conn.execute(delete(tabla))
+
+    columnas = ["fecha", "metrica", "dimension", "cantidad", "suma"]
+
+    sin_dimension = literal_column("''")
+
+    def agregar(metrica: str, fecha, dimension, cantidad, suma, *condiciones):
+        dia = _dia(conn, fecha)
+        # PostgreSQL no acepta una constante en GROUP BY
+        agrupar = [dia] if dimension is sin_dimension else [dia, dimension]
+        consulta = (
+            select(dia, literal(metrica), dimension, cantidad, suma)
+            .where(*condiciones)
+            .group_by(*agrupar)
+        )
+        conn.execute(insert(tabla).from_select(columnas, consulta))
+    pagada = func.coalesce(Transaction.completed_at, Transaction.created_at)
+
+    agregar(USUARIOS, User.created_at, sin_dimension, func.count(), literal(0.0),
+            User.created_at.isnot(None))
+    agregar(PAGOS, pagada, sin_dimension, func.count(), func.sum(Transaction.monto_mxn),
+            Transaction.estado == EstadoTransaccion.COMPLETADA.value)
+    agregar(CREDITOS_VENDIDOS, pagada, sin_dimension, func.sum(Transaction.creditos), literal(0.0),
+            Transaction.estado == EstadoTransaccion.COMPLETADA.value)
+
+    agregar(GENERACIONES_COMPLETADAS,
+            func.coalesce(Generation.completed_at, Generation.created_at),
+            Generation.estilo, func.count(), literal(0.0),
+            Generation.estado == EstadoGeneracion.COMPLETADA.value)
+    agregar(GENERACIONES_FALLIDAS, Generation.created_at, Generation.estilo, func.count(), literal(0.0),
+            Generation.estado == EstadoGeneracion.ERROR.value)
+
+    genero = func.coalesce(MusicGeneration.genero, sin_dimension)
+    agregar(MUSICA_COMPLETADAS,
+            func.coalesce(MusicGeneration.completed_at, MusicGeneration.created_at),
+            genero, func.count(), literal(0.0),
+            MusicGeneration.estado == EstadoMusicGeneration.COMPLETADA.value)
+    agregar(MUSICA_FALLIDAS, MusicGeneration.created_at, genero, func.count(), literal(0.0),
+            MusicGeneration.estado == EstadoMusicGeneration.ERROR.value)
+
+
+async def _main():
+    from app.core.database import engine
+
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(recalcular_estadisticas)
+        print("[ESTADISTICAS] Recalculadas desde las tablas de origen")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,178 @@
+"""
+Eventos de estado de las generaciones (para Server-Sent Events)
+
+Quien cambia el estado de una generación registra el evento en la misma
+transacción (tabla eventos_estado), sea el proceso web o app.worker. Cada
+worker web corre una sola tarea que sigue la tabla y reparte los eventos
+en memoria a las conexiones SSE abiertas de cada usuario: una consulta por
+intervalo por worker, sin importar cuántos clientes estén conectados.
+
+Orden de entrega: en SQLite hay un solo escritor y los eventos se
+confirman en orden de id. En PostgreSQL el id se asigna en el INSERT pero
+las transacciones confirman en cualquier orden: un evento puede aparecer
+después de otros con id mayor. Por eso cada lectura (y el reenvío por
+Last-Event-ID) relee los últimos EVENTOS_MARGEN_IDS ids y descarta los ya
+entregados. Garantía: se entrega todo evento cuya transacción confirme
+antes de que se asignen EVENTOS_MARGEN_IDS ids posteriores; los eventos
+de una misma generación llegan en orden.
+"""
+import asyncio
+from datetime import timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import ES_SQLITE, async_session_maker, ahora_utc
+from app.models.evento import EventoEstado
+from app.services.escrituras import cola_escrituras
+
+
+TIPO_IMAGEN = "imagen"
+TIPO_MUSICA = "musica"
+
+# Eventos pendientes por conexión; si un cliente no los consume se descartan
+MAX_EVENTOS_POR_CONEXION = 100
+
+# Cada cuánto se purgan los eventos viejos
+PURGA_SEGUNDOS = 60.0
+
+# Ids por debajo del último visto que se releen (commits fuera de orden)
+MARGEN_IDS = 0 if ES_SQLITE else settings.EVENTOS_MARGEN_IDS
+
+
+def publicar_evento(
+    db: AsyncSession,
+    user_id: int,
+    tipo: str,
+    objeto_id: int,
+    estado: str,
+    **datos
+):
+    """
+    Registra una transición de estado.
+    No hace commit: se confirma junto con el cambio de estado.
+    """
+    db.add(EventoEstado(
+        user_id=user_id,
+        tipo=tipo,
+        objeto_id=objeto_id,
+        estado=estado,
+        datos=datos or None
+    ))
+
+
+def _a_dict(evento: EventoEstado) -> dict:
+    return {
+        "id": evento.id,
+        "tipo": evento.tipo,
+        "objeto_id": evento.objeto_id,
+        "estado": evento.estado,
+        **(evento.datos or {})
+    }
+
+
+class BusEventos:
+    """Pub/sub en proceso alimentado desde la tabla eventos_estado"""
+
+    def __init__(self):
+        self._suscriptores: Dict[int, Set[asyncio.Queue]] = {}
+        self._ultimo_id: Optional[int] = None
+        # Ids ya repartidos dentro del margen (para no repetirlos)
+        self._vistos: Set[int] = set()
+        self.entregados = 0
+        self.descartados = 0
+
+    def suscribir(self, user_id: int) -> asyncio.Queue:
+        """Cola que recibe los eventos del usuario mientras la conexión siga abierta"""
+        cola: asyncio.Queue = asyncio.Queue(maxsize=MAX_EVENTOS_POR_CONEXION)
+        self._suscriptores.setdefault(user_id, set()).add(cola)
+        return cola
+
+    def cancelar(self, user_id: int, cola: asyncio.Queue):
+        colas = self._suscriptores.get(user_id)
+        if colas is not None:
+            colas.discard(cola)
+            if not colas:
+                del self._suscriptores[user_id]
+
+    async def desde(self, user_id: int, ultimo_id: int) -> List[dict]:
+        """
+        Eventos del usuario posteriores a ultimo_id (al reconectar con
+        Last-Event-ID). Incluye el margen por debajo de ultimo_id: puede
+        repetir eventos ya recibidos, en orden, así el último estado de cada
+        generación sigue siendo el correcto.
+        """
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(EventoEstado)
+                .where(EventoEstado.user_id == user_id, EventoEstado.id > ultimo_id - MARGEN_IDS)
+                .order_by(EventoEstado.id)
+                .limit(MAX_EVENTOS_POR_CONEXION)
+            )
+            return [_a_dict(e) for e in result.scalars().all()]
+
+    async def ejecutar(self):
+        """Tarea de fondo: sigue la tabla y reparte (se cancela en el shutdown)"""
+        ultima_purga = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await self._leer_nuevos()
+                if loop.time() - ultima_purga >= PURGA_SEGUNDOS:
+                    ultima_purga = loop.time()
+                    await self._purgar()
+            except Exception as e:
+                print(f"[EVENTOS] Error leyendo eventos: {e}")
+            await asyncio.sleep(settings.EVENTOS_INTERVALO_SEGUNDOS)
+
+    async def _leer_nuevos(self):
+        async with async_session_maker() as db:
+            if self._ultimo_id is None:
+                # Al arrancar solo interesan los eventos nuevos
+                self._ultimo_id = (await db.execute(select(func.max(EventoEstado.id)))).scalar() or 0
+                return
+
+            result = await db.execute(
+                select(EventoEstado)
+                .where(EventoEstado.id > self._ultimo_id - MARGEN_IDS)
+                .order_by(EventoEstado.id)
+                .limit(MARGEN_IDS + 500)
+            )
+            eventos = result.scalars().all()
+
+        for evento in eventos:
+            if evento.id in self._vistos or evento.id <= self._ultimo_id - MARGEN_IDS:
+                continue
+            if MARGEN_IDS:
+                self._vistos.add(evento.id)
+            self._ultimo_id = max(self._ultimo_id, evento.id)
+            for cola in self._suscriptores.get(evento.user_id, ()):
+                try:
+                    cola.put_nowait(_a_dict(evento))
+                    self.entregados += 1
+                except asyncio.QueueFull:
+                    self.descartados += 1
+
+        piso = self._ultimo_id - MARGEN_IDS
+        self._vistos = {i for i in self._vistos if i > piso}
+
+    async def _purgar(self):
+        limite = ahora_utc() - timedelta(seconds=settings.EVENTOS_RETENCION_SEGUNDOS)
+        await cola_escrituras.escribir(
+            lambda db: db.execute(delete(EventoEstado).where(EventoEstado.created_at < limite))
+        )
+
+    def estadisticas(self) -> dict:
+        """Conexiones SSE y eventos repartidos en este proceso"""
+        return {
+            "usuarios_conectados": len(self._suscriptores),
+            "conexiones": sum(len(c) for c in self._suscriptores.values()),
+            "entregados": self.entregados,
+            "descartados": self.descartados
+        }
+
+
+# Instancia global del bus (una por worker web)
+bus_eventos = BusEventos()
@@ -4,15 +4,33 @@ Servicio de generación de imágenes usando OpenAI (prompts) y Gemini (imágenes
 import os
 import json
 import base64
-import httpx
+import hashlib
 import asyncio
+import time
+import uuid
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 from pathlib import Path
 import re
 
+import aiofiles
+from fastapi import UploadFile
+
 from app.core.config import settings
-from app.services.viral_styles import construir_prompt_imagen, obtener_estilo
+from app.services.viral_styles import (
+    construir_prompt_imagen,
+    construir_prompt_copy,
+    construir_prompt_lote,
+    obtener_estilo
+)
+from app.services.http_clients import ClientesUpstream, obtener_cliente
+from app.services.resilience import PresupuestoReintentos, llamar_con_reintentos
+from app.services.admission import limitador
+from app.services.openai_cache import cache_openai, clave_cache
+from app.services.json_stream import ExtractorBase64, cuerpo_json_base64, marcador
+
+# Tamaño de bloque al copiar uploads a disco
+BLOQUE_UPLOAD = 1024 * 1024
 
 
 class GenerationService:
@@ -23,6 +41,11 @@ class GenerationService:
         self.gemini_key = settings.GEMINI_API_KEY
         self.openai_model = settings.OPENAI_MODEL
         self.gemini_model = settings.GEMINI_MODEL
+        self.clientes: Optional[ClientesUpstream] = None
+
+    def usar_clientes(self, clientes: ClientesUpstream):
+        """Inyecta el pool de clientes HTTP compartido"""
+        self.clientes = clientes
 
     async def generar_contenido_completo(
         self,
@@ -30,60 +53,273 @@ class GenerationService:
         nombre_producto: str,
         descripcion_producto: str,
         marca: str,
-        imagen_producto_b64: str,
+        imagen_producto: bytes,
         precio: str = "",
-        logo_b64: Optional[str] = None,
+        logo: Optional[bytes] = None,
         imagen_mime: str = "image/jpeg",
-        logo_mime: str = "image/png"
+        logo_mime: str = "image/png",
+        usar_cache: bool = True,
+        imagen_analisis: Optional[bytes] = None,
+        imagen_analisis_mime: Optional[str] = None,
+        ruta_imagen: Optional[str] = None
     ) -> dict:
         """
-        Genera imagen y copy completo para redes sociales
+        Genera imagen y copy completo para redes sociales.
+        Las imágenes se reciben en bytes; el base64 se codifica por bloques
+        solo al enviar cada petición.
+        La imagen generada se decodifica en streaming directo a ruta_imagen
+        (por defecto un nombre nuevo en GENERATED_DIR).
+        Con usar_cache=False se ignora la caché de OpenAI (regenerar copy).
+        imagen_analisis permite mandar a OpenAI una versión más ligera
+        que la usada como referencia en Gemini.
+
+        El copy para redes se genera en paralelo: la llamada corta de OpenAI
+        (solo prompt de imagen) alimenta a Gemini lo antes posible.
 
         Retorna:
         {
-            "imagen_b64": str,
+            "imagen_path": str,
             "copy_facebook": str,
             "hashtags_facebook": list,
             "copy_instagram": str,
             "hashtags_instagram": list,
             "prompt_usado": str,
-            "tiempo_ms": int
+            "tiempo_ms": int,
+            "tiempos": {"prompt_ms": int, "copy_ms": int, "imagen_ms": int}
         }
         """
         inicio = datetime.now()
+        tiempos = {}
+        tarea_copy = None
+        # Reintentos compartidos por las tres llamadas de esta generación
+        presupuesto = PresupuestoReintentos()
 
         try:
-            # 1. Generar prompt y copy con OpenAI
+            imagen_openai = imagen_analisis or imagen_producto
+            mime_openai = imagen_analisis_mime or imagen_mime
+
+            # 1. Copy para redes: corre en paralelo con el prompt y con Gemini
+            tarea_copy = asyncio.create_task(_medir(tiempos, "copy_ms", self._generar_copy(
+                nombre_producto, descripcion_producto, marca, precio,
+                imagen_openai, mime_openai, usar_cache, presupuesto
+            )))
+
+            # 2. Prompt de imagen con OpenAI (llamada corta)
             prompt_sistema = construir_prompt_imagen(
                 estilo_id=estilo_id,
                 nombre_producto=nombre_producto,
                 descripcion_producto=descripcion_producto,
                 marca=marca,
                 precio=precio,
-                tiene_logo=logo_b64 is not None
+                tiene_logo=logo is not None
             )
 
-            contenido_ai = await self._llamar_openai(
+            clave = clave_cache(
+                imagen=imagen_producto,
+                estilo_id=estilo_id,
+                nombre_producto=nombre_producto,
+                descripcion_producto=descripcion_producto,
+                marca=marca,
+                precio=precio,
+                tiene_logo=logo is not None,
+                prompt=prompt_sistema,
+                modelo=self.openai_model
+            )
+            datos_prompt = await _medir(tiempos, "prompt_ms", self._consultar_openai(
                 prompt_sistema,
-                imagen_producto_b64,
-                imagen_mime
+                imagen_openai,
+                mime_openai,
+                clave,
+                usar_cache=usar_cache,
+                max_tokens=800,
+                es_completo=lambda d: bool(d.get("image_prompt")),
+                presupuesto=presupuesto
+            ))
+
+            # 3. Generar imagen con Gemini
+            prompt_imagen = datos_prompt.get("image_prompt", "")
+            if not prompt_imagen:
+                raise ValueError("OpenAI no generó un prompt de imagen válido")
+
+            prompt_completo = self._construir_prompt_gemini(
+                estilo_id, prompt_imagen, nombre_producto, marca, precio, tiene_logo=logo is not None
             )
 
-            # Parsear respuesta JSON de OpenAI
-            datos_generados = self._parsear_respuesta_openai(contenido_ai)
+            if ruta_imagen is None:
+                ruta_imagen = str(Path(settings.GENERATED_DIR) / f"{uuid.uuid4().hex}.png")
 
-            # 2. Generar imagen con Gemini
-            prompt_imagen = datos_generados.get("image_prompt", "")
-            if not prompt_imagen:
-                raise ValueError("OpenAI no generó un prompt de imagen válido")
+            await _medir(tiempos, "imagen_ms", self._llamar_gemini(
+                prompt_completo,
+                imagen_producto,
+                imagen_mime,
+                ruta_imagen,
+                logo,
+                logo_mime,
+                presupuesto
+            ))
+
+            # Normalmente el copy ya terminó mientras Gemini trabajaba
+            datos_copy = await tarea_copy
+
+            fin = datetime.now()
+            tiempo_ms = int((fin - inicio).total_seconds() * 1000)
+
+            return {
+                "imagen_path": ruta_imagen,
+                "copy_facebook": datos_copy.get("facebook", {}).get("copy", ""),
+                "hashtags_facebook": datos_copy.get("facebook", {}).get("hashtags", []),
+                "copy_instagram": datos_copy.get("instagram", {}).get("copy", ""),
+                "hashtags_instagram": datos_copy.get("instagram", {}).get("hashtags", []),
+                "prompt_usado": prompt_imagen,
+                "tiempo_ms": tiempo_ms,
+                "tiempos": tiempos,
+                "exito": True
+            }
+
+        except Exception as e:
+            if tarea_copy and not tarea_copy.done():
+                tarea_copy.cancel()
+            fin = datetime.now()
+            tiempo_ms = int((fin - inicio).total_seconds() * 1000)
+            return {
+                "exito": False,
+                "error": str(e),
+                "tiempo_ms": tiempo_ms,
+                "tiempos": tiempos
+            }
+
+    async def generar_lote(
+        self,
+        estilo_ids: List[str],
+        nombre_producto: str,
+        descripcion_producto: str,
+        marca: str,
+        imagen_producto: bytes,
+        rutas_imagen: Dict[str, str],
+        al_completar: Callable[[str, dict], Awaitable[None]],
+        precio: str = "",
+        logo: Optional[bytes] = None,
+        imagen_mime: str = "image/jpeg",
+        logo_mime: str = "image/png",
+        usar_cache: bool = True,
+        imagen_analisis: Optional[bytes] = None,
+        imagen_analisis_mime: Optional[str] = None
+    ) -> Dict[str, dict]:
+        """
+        Genera el mismo producto en varios estilos.
 
-            # Agregar contexto del estilo al prompt
-            estilo = obtener_estilo(estilo_id)
+        Una sola llamada a OpenAI produce el prompt de cada estilo y el copy;
+        después las llamadas a Gemini corren en paralelo (máximo
+        LOTE_CONCURRENCIA_GEMINI). al_completar(estilo_id, resultado) se llama
+        en cuanto termina cada estilo, con el mismo formato de resultado que
+        generar_contenido_completo.
 
-            # Instrucciones de logo para Gemini
-            logo_instructions = ""
-            if logo_b64:
-                logo_instructions = """
+        Retorna {estilo_id: resultado}.
+        """
+        inicio = datetime.now()
+        tiempos = {}
+        resultados: Dict[str, dict] = {}
+
+        async def terminar(estilo_id: str, resultado: dict):
+            resultado["tiempo_ms"] = int((datetime.now() - inicio).total_seconds() * 1000)
+            resultados[estilo_id] = resultado
+            await al_completar(estilo_id, resultado)
+
+        # 1. Prompts de todos los estilos + copy en una sola llamada
+        try:
+            prompt_sistema = construir_prompt_lote(
+                estilo_ids=estilo_ids,
+                nombre_producto=nombre_producto,
+                descripcion_producto=descripcion_producto,
+                marca=marca,
+                precio=precio,
+                tiene_logo=logo is not None
+            )
+            clave = clave_cache(
+                imagen=imagen_producto,
+                estilo_id=",".join(estilo_ids),
+                nombre_producto=nombre_producto,
+                descripcion_producto=descripcion_producto,
+                marca=marca,
+                precio=precio,
+                tiene_logo=logo is not None,
+                prompt=prompt_sistema,
+                modelo=self.openai_model
+            )
+            datos = await _medir(tiempos, "prompt_ms", self._consultar_openai(
+                prompt_sistema,
+                imagen_analisis or imagen_producto,
+                imagen_analisis_mime or imagen_mime,
+                clave,
+                usar_cache=usar_cache,
+                max_tokens=600 * len(estilo_ids) + 600,
+                es_completo=lambda d: all(d.get("image_prompts", {}).get(e) for e in estilo_ids)
+            ))
+        except Exception as e:
+            for estilo_id in estilo_ids:
+                await terminar(estilo_id, {"exito": False, "error": str(e), "tiempos": dict(tiempos)})
+            return resultados
+
+        prompts = datos.get("image_prompts") or {}
+        semaforo = asyncio.Semaphore(settings.LOTE_CONCURRENCIA_GEMINI)
+
+        # 2. Una imagen por estilo, en paralelo
+        async def generar_estilo(estilo_id: str):
+            tiempos_estilo = dict(tiempos)
+            try:
+                prompt_imagen = prompts.get(estilo_id, "")
+                if not prompt_imagen:
+                    raise ValueError("OpenAI no generó un prompt de imagen válido")
+
+                prompt_completo = self._construir_prompt_gemini(
+                    estilo_id, prompt_imagen, nombre_producto, marca, precio, tiene_logo=logo is not None
+                )
+                async with semaforo:
+                    await _medir(tiempos_estilo, "imagen_ms", self._llamar_gemini(
+                        prompt_completo,
+                        imagen_producto,
+                        imagen_mime,
+                        rutas_imagen[estilo_id],
+                        logo,
+                        logo_mime,
+                        PresupuestoReintentos()
+                    ))
+
+                resultado = {
+                    "imagen_path": rutas_imagen[estilo_id],
+                    "copy_facebook": datos.get("facebook", {}).get("copy", ""),
+                    "hashtags_facebook": datos.get("facebook", {}).get("hashtags", []),
+                    "copy_instagram": datos.get("instagram", {}).get("copy", ""),
+                    "hashtags_instagram": datos.get("instagram", {}).get("hashtags", []),
+                    "prompt_usado": prompt_imagen,
+                    "tiempos": tiempos_estilo,
+                    "exito": True
+                }
+            except Exception as e:
+                resultado = {"exito": False, "error": str(e), "tiempos": tiempos_estilo}
+
+            await terminar(estilo_id, resultado)
+
+        await asyncio.gather(*(generar_estilo(e) for e in estilo_ids))
+        return resultados
+
+    def _construir_prompt_gemini(
+        self,
+        estilo_id: str,
+        prompt_imagen: str,
+        nombre_producto: str,
+        marca: str,
+        precio: str,
+        tiene_logo: bool = False
+    ) -> str:
+        """Prompt final para Gemini: especificaciones del estilo + prompt de OpenAI"""
+        # Agregar contexto del estilo al prompt
+        estilo = obtener_estilo(estilo_id)
+
+        # Instrucciones de logo para Gemini
+        logo_instructions = ""
+        if tiene_logo:
+            logo_instructions = """
 IMPORTANT - LOGO INTEGRATION:
 A logo image is provided as the THIRD image. You MUST integrate this logo INTO the scene physically:
 - The logo should appear as if it's PART of the environment (engraved, printed, embroidered, neon sign, etc.)
@@ -92,19 +328,19 @@ A logo image is provided as the THIRD image. You MUST integrate this logo INTO t
 - Match the logo's integration style to the overall aesthetic
 """
 
-            # Construir lista de textos a incluir
-            textos_producto = []
-            if nombre_producto:
-                textos_producto.append(f'Product name: "{nombre_producto}"')
-            if marca:
-                textos_producto.append(f'Brand: "{marca}"')
-            if precio:
-                textos_producto.append(f'Price: "{precio}"')
+        # Construir lista de textos a incluir
+        textos_producto = []
+        if nombre_producto:
+            textos_producto.append(f'Product name: "{nombre_producto}"')
+        if marca:
+            textos_producto.append(f'Brand: "{marca}"')
+        if precio:
+            textos_producto.append(f'Price: "{precio}"')
 
-            textos_a_mostrar = " | ".join(textos_producto) if textos_producto else nombre_producto
+        textos_a_mostrar = " | ".join(textos_producto) if textos_producto else nombre_producto
 
-            # Instrucciones para texto creativo con materiales
-            texto_creativo = f"""
+        # Instrucciones para texto creativo con materiales
+        texto_creativo = f"""
 ### CREATIVE TYPOGRAPHY WITH PRODUCT MATERIALS
 
 **IMPORTANT: Include these product details as artistic text in the image:**
@@ -137,11 +373,11 @@ Create stunning artistic text using the product's own materials, ingredients, or
 - Consider 3D depth - letters can emerge from the scene, cast shadows, have reflections
 """
 
-            # Obtener campos cinematográficos avanzados
-            color_grade = estilo.get('color_grade', 'Professional commercial color science with vibrant product colors')
-            composition = estilo.get('composition', 'Product-centered composition optimized for social media engagement')
+        # Obtener campos cinematográficos avanzados
+        color_grade = estilo.get('color_grade', 'Professional commercial color science with vibrant product colors')
+        composition = estilo.get('composition', 'Product-centered composition optimized for social media engagement')
 
-            prompt_completo = f"""
+        prompt_completo = f"""
 ## PROFESSIONAL CINEMATOGRAPHIC PRODUCT PHOTOGRAPHY
 
 ### VISUAL STYLE: {estilo['nombre']} - {estilo['mood']}
@@ -178,44 +414,99 @@ Create stunning artistic text using the product's own materials, ingredients, or
 Create a stunning, scroll-stopping 1:1 aspect ratio image that looks like it belongs in a Super Bowl commercial or Vogue magazine spread.
 """
 
-            imagen_generada_b64 = await self._llamar_gemini(
-                prompt_completo,
-                imagen_producto_b64,
-                imagen_mime,
-                logo_b64,
-                logo_mime
+        return prompt_completo
+
+    async def _generar_copy(
+        self,
+        nombre_producto: str,
+        descripcion_producto: str,
+        marca: str,
+        precio: str,
+        imagen: bytes,
+        mime_type: str,
+        usar_cache: bool = True,
+        presupuesto: Optional[PresupuestoReintentos] = None
+    ) -> dict:
+        """
+        Genera el copy de Facebook e Instagram.
+        Un error aquí no invalida la imagen: se retorna copy vacío.
+        """
+        prompt = construir_prompt_copy(
+            nombre_producto=nombre_producto,
+            descripcion_producto=descripcion_producto,
+            marca=marca,
+            precio=precio
+        )
+        clave = clave_cache(
+            imagen=imagen,
+            estilo_id="",
+            nombre_producto=nombre_producto,
+            descripcion_producto=descripcion_producto,
+            marca=marca,
+            precio=precio,
+            tiene_logo=False,
+            prompt=prompt,
+            modelo=self.openai_model
+        )
+
+        try:
+            return await self._consultar_openai(
+                prompt,
+                imagen,
+                mime_type,
+                clave,
+                usar_cache=usar_cache,
+                max_tokens=800,
+                es_completo=lambda d: bool(d.get("facebook", {}).get("copy")),
+                presupuesto=presupuesto
             )
+        except Exception as e:
+            print(f"[GENERACION] Error generando copy: {e}")
+            return {}
 
-            fin = datetime.now()
-            tiempo_ms = int((fin - inicio).total_seconds() * 1000)
+    async def _consultar_openai(
+        self,
+        prompt: str,
+        imagen: bytes,
+        mime_type: str,
+        clave: str,
+        usar_cache: bool = True,
+        max_tokens: int = 2000,
+        es_completo: Callable[[dict], bool] = lambda d: True,
+        presupuesto: Optional[PresupuestoReintentos] = None
+    ) -> dict:
+        """
+        Llama a OpenAI y parsea el JSON, usando la caché por contenido.
+        es_completo decide si la respuesta es cacheable (no el fallback sin JSON).
+        """
+        usar_cache = usar_cache and settings.OPENAI_CACHE_HABILITADO
 
-            return {
-                "imagen_b64": imagen_generada_b64,
-                "copy_facebook": datos_generados.get("facebook", {}).get("copy", ""),
-                "hashtags_facebook": datos_generados.get("facebook", {}).get("hashtags", []),
-                "copy_instagram": datos_generados.get("instagram", {}).get("copy", ""),
-                "hashtags_instagram": datos_generados.get("instagram", {}).get("hashtags", []),
-                "prompt_usado": prompt_imagen,
-                "tiempo_ms": tiempo_ms,
-                "exito": True
-            }
+        if usar_cache:
+            datos = await cache_openai.obtener(clave)
+            if datos is not None:
+                return datos
 
-        except Exception as e:
-            fin = datetime.now()
-            tiempo_ms = int((fin - inicio).total_seconds() * 1000)
-            return {
-                "exito": False,
-                "error": str(e),
-                "tiempo_ms": tiempo_ms
-            }
+        contenido_ai = await self._llamar_openai(
+            prompt, imagen, mime_type, max_tokens=max_tokens, presupuesto=presupuesto
+        )
+
+        # Parsear respuesta JSON de OpenAI
+        datos = self._parsear_respuesta_openai(contenido_ai)
+
+        if settings.OPENAI_CACHE_HABILITADO and es_completo(datos):
+            await cache_openai.guardar(clave, datos)
+
+        return datos
 
     async def _llamar_openai(
         self,
         prompt: str,
-        imagen_b64: str,
-        mime_type: str = "image/jpeg"
+        imagen: bytes,
+        mime_type: str = "image/jpeg",
+        max_tokens: int = 2000,
+        presupuesto: Optional[PresupuestoReintentos] = None
     ) -> str:
-        """Llama a OpenAI para generar prompt y copy"""
+        """Llama a OpenAI con el prompt y la imagen del producto"""
         url = "https://api.openai.com/v1/chat/completions"
 
         headers = {
@@ -233,32 +524,45 @@ Create a stunning, scroll-stopping 1:1 aspect ratio image that looks like it bel
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:{mime_type};base64,{imagen_b64}"
+                                "url": f"data:{mime_type};base64,{marcador('imagen')}"
                             }
                         }
                     ]
                 }
             ],
-            "max_tokens": 2000,
+            "max_tokens": max_tokens,
             "temperature": 0.7
         }
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
+        longitud, cuerpo = cuerpo_json_base64(payload, {"imagen": imagen})
+        headers["Content-Length"] = str(longitud)
+
+        client = obtener_cliente("openai", self.clientes)
+        response = await llamar_con_reintentos(
+            "openai",
+            lambda: client.post(url, headers=headers, content=cuerpo()),
+            presupuesto
+        )
+        response.raise_for_status()
+        data = response.json()
 
         return data["choices"][0]["message"]["content"]
 
     async def _llamar_gemini(
         self,
         prompt: str,
-        imagen_producto_b64: str,
+        imagen_producto: bytes,
         imagen_mime: str,
-        logo_b64: Optional[str] = None,
-        logo_mime: str = "image/png"
-    ) -> str:
-        """Llama a Gemini para generar la imagen"""
+        ruta_destino: str,
+        logo: Optional[bytes] = None,
+        logo_mime: str = "image/png",
+        presupuesto: Optional[PresupuestoReintentos] = None
+    ) -> int:
+        """
+        Llama a Gemini para generar la imagen.
+        La respuesta se lee en streaming y la imagen se escribe en ruta_destino
+        sin cargar el JSON en memoria. Retorna los bytes escritos.
+        """
         url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.gemini_model}:generateContent"
 
         headers = {
@@ -273,18 +577,20 @@ Create a stunning, scroll-stopping 1:1 aspect ratio image that looks like it bel
         parts.append({
             "inline_data": {
                 "mime_type": imagen_mime,
-                "data": imagen_producto_b64
+                "data": marcador("imagen")
             }
         })
+        binarios = {"imagen": imagen_producto}
 
         # Agregar logo si existe
-        if logo_b64:
+        if logo:
             parts.append({
                 "inline_data": {
                     "mime_type": logo_mime,
-                    "data": logo_b64
+                    "data": marcador("logo")
                 }
             })
+            binarios["logo"] = logo
 
         payload = {
             "contents": [{"parts": parts}],
@@ -293,23 +599,28 @@ Create a stunning, scroll-stopping 1:1 aspect ratio image that looks like it bel
             }
         }
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-
-        # Extraer imagen de la respuesta
-        candidates = data.get("candidates", [])
-        if not candidates:
-            raise ValueError("Gemini no retornó candidatos")
-
-        parts = candidates[0].get("content", {}).get("parts", [])
-        for part in parts:
-            inline_data = part.get("inlineData") or part.get("inline_data")
-            if inline_data and "data" in inline_data:
-                return inline_data["data"]
-
-        raise ValueError("Gemini no generó una imagen")
+        longitud, cuerpo = cuerpo_json_base64(payload, binarios)
+        headers["Content-Length"] = str(longitud)
+
+        client = obtener_cliente("gemini", self.clientes)
+        # El permiso se toma por intento: no se retiene durante el backoff
+        async with limitador.por_intento("gemini") as permiso:
+            response = await llamar_con_reintentos(
+                "gemini",
+                lambda: client.send(
+                    client.build_request("POST", url, headers=headers, content=cuerpo()),
+                    stream=True
+                ),
+                presupuesto,
+                permiso=permiso
+            )
+            try:
+                if response.is_error:
+                    await response.aread()
+                response.raise_for_status()
+                return await extraer_imagen_a_archivo(response.aiter_bytes(), ruta_destino)
+            finally:
+                await response.aclose()
 
     def _parsear_respuesta_openai(self, contenido: str) -> dict:
         """Parsea la respuesta JSON de OpenAI"""
@@ -329,18 +640,83 @@ Create a stunning, scroll-stopping 1:1 aspect ratio image that looks like it bel
         }
 
 
-def guardar_imagen(imagen_b64: str, nombre_archivo: str) -> str:
-    """Guarda imagen en disco y retorna la ruta"""
-    directorio = Path(settings.GENERATED_DIR)
+async def _medir(tiempos: dict, etapa: str, coro):
+    """Espera una corrutina registrando su duración en tiempos[etapa] (ms)"""
+    inicio = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        tiempos[etapa] = int((time.perf_counter() - inicio) * 1000)
+
+
+async def extraer_imagen_a_archivo(flujo: AsyncIterator[bytes], ruta: str) -> int:
+    """
+    Decodifica la primera imagen (inlineData.data) de una respuesta de Gemini
+    mientras llega y la escribe en `ruta`. Se escribe a un .part y se renombra
+    al terminar, así nunca queda una imagen a medias.
+    Retorna los bytes escritos.
+    """
+    Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+    temporal = f"{ruta}.part"
+    extractor = ExtractorBase64(frozenset({"inlineData", "inline_data"}), "data")
+
+    try:
+        async with aiofiles.open(temporal, "wb") as f:
+            async for bloque in flujo:
+                # Se lee hasta el final para poder reutilizar la conexión
+                for datos in extractor.procesar(bloque):
+                    await f.write(datos)
+            await f.write(extractor.terminar())
+
+        if not extractor.encontrado or extractor.bytes_decodificados == 0:
+            raise ValueError("Gemini no generó una imagen")
+        if not extractor.completo:
+            raise ValueError("La respuesta de Gemini se cortó antes de terminar la imagen")
+
+        os.replace(temporal, ruta)
+        return extractor.bytes_decodificados
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+async def huella_upload(archivo: UploadFile) -> str:
+    """SHA-256 del contenido de un archivo subido (leído por bloques, sin consumirlo)"""
+    sha256 = hashlib.sha256()
+    await archivo.seek(0)
+    while bloque := await archivo.read(BLOQUE_UPLOAD):
+        sha256.update(bloque)
+    await archivo.seek(0)
+    return sha256.hexdigest()
+
+
+async def guardar_upload(archivo: UploadFile, directorio: str, nombre_archivo: str) -> str:
+    """
+    Guarda un archivo subido en disco por bloques (sin cargarlo completo
+    en memoria) y retorna la ruta
+    """
+    directorio = Path(directorio)
     directorio.mkdir(parents=True, exist_ok=True)
 
     ruta = directorio / nombre_archivo
-    with open(ruta, "wb") as f:
-        f.write(base64.b64decode(imagen_b64))
+    async with aiofiles.open(ruta, "wb") as f:
+        while bloque := await archivo.read(BLOQUE_UPLOAD):
+            await f.write(bloque)
 
     return str(ruta)
 
 
+def extension_para_mime(mime: str) -> str:
+    """Extensión de archivo para un tipo de imagen"""
+    return {
+        "image/jpeg": ".jpg",
+        "image/png": ".png",
+        "image/webp": ".webp",
+        "image/gif": ".gif"
+    }.get(mime, ".png")
+
+
 def imagen_a_base64(ruta_archivo: str) -> Tuple[str, str]:
     """Lee imagen de disco y retorna (base64, mime_type)"""
     with open(ruta_archivo, "rb") as f:
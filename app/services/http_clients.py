@@ -0,0 +1,120 @@
+"""
+Clientes HTTP compartidos (pool de conexiones) para los proveedores de IA
+
+Un cliente httpx por proveedor, creado en el lifespan de la app y reutilizado
+por todos los servicios para no pagar DNS + TCP + TLS en cada llamada.
+"""
+from typing import Dict, Optional
+import httpx
+
+from app.core.config import settings
+
+try:
+    import h2  # noqa: F401  (requerido por httpx para HTTP/2)
+    HTTP2_DISPONIBLE = True
+except ImportError:
+    HTTP2_DISPONIBLE = False
+
+
+# Configuración por proveedor
+# - http2: solo donde el proveedor lo soporta
+# - timeout: timeout por defecto (cada llamada puede sobreescribirlo)
+PROVEEDORES = {
+    "openai": {"http2": True, "timeout": 60.0},
+    "gemini": {"http2": True, "timeout": 120.0},
+    "musicgpt": {"http2": False, "timeout": 60.0},
+    "descargas": {"http2": False, "timeout": 60.0},  # Audio generado (S3)
+}
+
+
+class ClientesUpstream:
+    """Pool de clientes HTTP, uno por proveedor"""
+
+    def __init__(self):
+        self._clientes: Dict[str, httpx.AsyncClient] = {}
+        self._solicitudes: Dict[str, int] = {nombre: 0 for nombre in PROVEEDORES}
+        self._errores: Dict[str, int] = {nombre: 0 for nombre in PROVEEDORES}
+
+    def _crear_cliente(self, nombre: str) -> httpx.AsyncClient:
+        """Crea el cliente de un proveedor con keep-alive y límites por host"""
+        config = PROVEEDORES[nombre]
+
+        limites = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONEXIONES_POR_HOST,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        )
+
+        async def contar_solicitud(request: httpx.Request):
+            self._solicitudes[nombre] += 1
+
+        async def contar_respuesta(response: httpx.Response):
+            if response.status_code >= 400:
+                self._errores[nombre] += 1
+
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(config["timeout"], connect=10.0),
+            limits=limites,
+            http2=config["http2"] and settings.HTTP2_HABILITADO and HTTP2_DISPONIBLE,
+            event_hooks={
+                "request": [contar_solicitud],
+                "response": [contar_respuesta]
+            }
+        )
+
+    async def iniciar(self):
+        """Crea todos los clientes (llamar en el startup)"""
+        for nombre in PROVEEDORES:
+            if nombre not in self._clientes:
+                self._clientes[nombre] = self._crear_cliente(nombre)
+
+    async def cerrar(self):
+        """Cierra todos los clientes y sus conexiones (llamar en el shutdown)"""
+        for cliente in self._clientes.values():
+            await cliente.aclose()
+        self._clientes.clear()
+
+    def cliente(self, nombre: str) -> httpx.AsyncClient:
+        """
+        Obtiene el cliente de un proveedor.
+        Si no se inició (scripts fuera del lifespan), se crea bajo demanda.
+        """
+        cliente = self._clientes.get(nombre)
+        if cliente is None or cliente.is_closed:
+            cliente = self._crear_cliente(nombre)
+            self._clientes[nombre] = cliente
+        return cliente
+
+    def metricas(self) -> dict:
+        """Uso del pool de conexiones por proveedor"""
+        resultado = {}
+        for nombre in PROVEEDORES:
+            cliente = self._clientes.get(nombre)
+            conexiones = _conexiones_del_pool(cliente) if cliente else []
+
+            resultado[nombre] = {
+                "activo": cliente is not None and not cliente.is_closed,
+                "solicitudes": self._solicitudes[nombre],
+                "errores": self._errores[nombre],
+                "conexiones_abiertas": len(conexiones),
+                "conexiones_ociosas": sum(1 for c in conexiones if c.is_idle()),
+                "conexiones_http2": sum(1 for c in conexiones if "HTTP/2" in c.info()),
+                "max_conexiones": settings.HTTP_MAX_CONEXIONES_POR_HOST,
+            }
+        return resultado
+
+
+def _conexiones_del_pool(cliente: httpx.AsyncClient) -> list:
+    """Lee las conexiones del pool de httpcore (vacío si no está disponible)"""
+    transport = getattr(cliente, "_transport", None)
+    pool = getattr(transport, "_pool", None)
+    return list(getattr(pool, "connections", []) or [])
+
+
+# Instancia global del pool
+clientes_upstream = ClientesUpstream()
+
+
+def obtener_cliente(nombre: str, clientes: Optional[ClientesUpstream] = None) -> httpx.AsyncClient:
+    """Obtiene el cliente de un proveedor del pool indicado o del global"""
+    return (clientes or clientes_upstream).cliente(nombre)
@@ -0,0 +1,161 @@
+"""
+Normalización de imágenes antes de enviarlas a OpenAI y Gemini
+
+Corrige la orientación EXIF, reduce al lado máximo configurado, elimina
+metadatos y recomprime. Corre en un ProcessPoolExecutor para no bloquear
+el event loop (Pillow es CPU-bound).
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from app.core.config import settings
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+# Contadores del proceso actual
+estadisticas_pipeline = {
+    "imagenes": 0,
+    "bytes_originales": 0,
+    "bytes_enviados": 0,
+    "errores": 0,
+}
+
+
+def _obtener_pool() -> ProcessPoolExecutor:
+    """Crea el pool de procesos bajo demanda"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.IMAGEN_PROCESOS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def cerrar_pool():
+    """Apaga el pool de procesos (llamar en el shutdown)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def _descartar_pool(pool: ProcessPoolExecutor):
+    """
+    Un hijo que muere (OOM, bomba de descompresión) deja el pool roto para
+    siempre: se descarta y la siguiente llamada crea uno nuevo.
+    """
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ============ TRABAJO EN EL PROCESO HIJO ============
+
+def _recomprimir(img, max_lado: int, calidad: int) -> Tuple[bytes, str]:
+    """Reduce y recomprime una imagen ya orientada. Retorna (bytes, mime)."""
+    from PIL import Image
+
+    if max(img.size) > max_lado:
+        img = img.copy()
+        img.thumbnail((max_lado, max_lado), Image.LANCZOS)
+
+    salida = io.BytesIO()
+
+    # Conservar transparencia (logos, productos recortados) en PNG
+    tiene_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if tiene_alpha:
+        img = img.convert("RGBA")
+        if img.getextrema()[3][0] < 255:
+            img.save(salida, format="PNG", optimize=True)
+            return salida.getvalue(), "image/png"
+
+    img.convert("RGB").save(salida, format="JPEG", quality=calidad, optimize=True, progressive=True)
+    return salida.getvalue(), "image/jpeg"
+
+
+def _normalizar(ruta: str, lados: Tuple[int, ...], calidad: int) -> list:
+    """
+    Genera una variante por cada lado máximo solicitado.
+    El archivo se lee aquí, en el proceso hijo: el original nunca pasa por
+    la memoria del worker.
+    Al volver a guardar sin 'exif' ni 'icc_profile' se eliminan los metadatos.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(ruta) as original:
+        img = ImageOps.exif_transpose(original)
+        img.load()
+        return [_recomprimir(img, lado, calidad) for lado in lados]
+
+
+def _leer(ruta: str) -> bytes:
+    """Lee el archivo original completo (solo en el fallback)"""
+    with open(ruta, "rb") as f:
+        return f.read()
+
+
+# ============ API ASYNC ============
+
+async def normalizar_imagen(
+    ruta: str,
+    mime: str,
+    lados: Tuple[int, ...]
+) -> dict:
+    """
+    Normaliza la imagen guardada en `ruta` en el pool de procesos.
+
+    Retorna:
+    {
+        "variantes": [(bytes, mime), ...],  # una por cada lado de `lados`
+        "bytes_originales": int,
+        "bytes_ahorrados": int  # respecto a enviar el original en cada variante
+    }
+
+    Si Pillow no puede abrir la imagen se retorna el original sin cambios.
+    """
+    loop = asyncio.get_running_loop()
+    tamano_original = os.path.getsize(ruta)
+
+    pool = _obtener_pool()
+    try:
+        variantes = await loop.run_in_executor(
+            pool, _normalizar, ruta, lados, settings.IMAGEN_CALIDAD_JPEG
+        )
+    except BrokenProcessPool as e:
+        print(f"[IMAGEN] Pool de procesos roto, se recrea; se usa el original: {e}")
+        _descartar_pool(pool)
+        estadisticas_pipeline["errores"] += 1
+        variantes = []
+    except Exception as e:
+        print(f"[IMAGEN] No se pudo normalizar, se usa el original: {e}")
+        estadisticas_pipeline["errores"] += 1
+        variantes = []
+
+    # Nunca enviar algo más pesado que el original
+    if not variantes or any(len(v) >= tamano_original for v, _ in variantes):
+        original = await asyncio.to_thread(_leer, ruta)
+        variantes = [(original, mime)] * len(lados) if not variantes else [
+            (v, m) if len(v) < tamano_original else (original, mime)
+            for v, m in variantes
+        ]
+
+    originales = tamano_original * len(lados)
+    enviados = sum(len(v) for v, _ in variantes)
+
+    estadisticas_pipeline["imagenes"] += 1
+    estadisticas_pipeline["bytes_originales"] += originales
+    estadisticas_pipeline["bytes_enviados"] += enviados
+
+    return {
+        "variantes": variantes,
+        "bytes_originales": tamano_original,
+        "bytes_ahorrados": originales - enviados
+    }
@@ -0,0 +1,500 @@
+"""
+Cola persistente de trabajos de generación de imágenes
+
+La API solo encola (tabla generation_jobs) y responde de inmediato;
+los procesos de app.worker reclaman y ejecutan los trabajos.
+
+Cada trabajo usa dos transacciones cortas: reclamar (trabajo EN_PROCESO +
+generación PROCESANDO) y finalizar (resultado + crédito). La llamada al
+upstream, que tarda segundos, corre sin ninguna sesión abierta: en SQLite
+una transacción abierta retiene el lock de escritura de toda la base.
+"""
+import os
+import uuid
+from datetime import timedelta
+from typing import List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session_maker, ahora_utc
+from app.models.generation import Generation, EstadoGeneracion
+from app.models.job import GenerationJob, EstadoTrabajo
+from app.services.generation import generation_service
+from app.services.image_pipeline import normalizar_imagen
+from app.services.eventos import publicar_evento, TIPO_IMAGEN
+from app.services.creditos import confirmar_reserva, liberar_reserva
+from app.services.estadisticas import sumar_estadistica, GENERACIONES_COMPLETADAS, GENERACIONES_FALLIDAS
+
+
+def encolar_generacion(db: AsyncSession, generacion: Generation, payload: dict) -> GenerationJob:
+    """
+    Agrega un trabajo a la cola para la generación indicada.
+    No hace commit: se confirma junto con el resto de la transacción.
+    """
+    trabajo = GenerationJob(
+        generation_id=generacion.id,
+        user_id=generacion.user_id,
+        payload=payload,
+        estado=EstadoTrabajo.PENDIENTE.value,
+        max_intentos=settings.TRABAJO_MAX_INTENTOS
+    )
+    db.add(trabajo)
+    return trabajo
+
+
+async def contar_trabajos_pendientes(db: AsyncSession) -> int:
+    """Trabajos en espera de un worker (backlog de la cola)"""
+    return await db.scalar(
+        select(func.count(GenerationJob.id))
+        .where(GenerationJob.estado == EstadoTrabajo.PENDIENTE.value)
+    ) or 0
+
+
+async def reclamar_trabajo(db: AsyncSession, worker_id: str) -> Optional[int]:
+    """
+    Reclama el trabajo pendiente más antiguo.
+    El UPDATE condicional garantiza que solo un worker lo obtenga.
+    Retorna el id del trabajo o None si la cola está vacía.
+
+    No hace commit: reclamar_lote completa el reclamo en la misma transacción.
+    """
+    result = await db.execute(
+        select(GenerationJob.id)
+        .where(GenerationJob.estado == EstadoTrabajo.PENDIENTE.value)
+        .order_by(GenerationJob.id)
+        .limit(1)
+    )
+    trabajo_id = result.scalar_one_or_none()
+    if trabajo_id is None:
+        return None
+
+    ahora = ahora_utc()
+    result = await db.execute(
+        update(GenerationJob)
+        .where(
+            GenerationJob.id == trabajo_id,
+            GenerationJob.estado == EstadoTrabajo.PENDIENTE.value
+        )
+        .values(
+            estado=EstadoTrabajo.EN_PROCESO.value,
+            worker_id=worker_id,
+            intentos=GenerationJob.intentos + 1,
+            started_at=ahora,
+            heartbeat_at=ahora
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    # Otro worker lo tomó primero
+    if result.rowcount != 1:
+        await db.rollback()
+        return None
+    return trabajo_id
+
+
+async def registrar_heartbeat(db: AsyncSession, worker_id: str, trabajo_ids: List[int]):
+    """Marca como vivos los trabajos que este worker está procesando"""
+    if not trabajo_ids:
+        return
+    await db.execute(
+        update(GenerationJob)
+        .where(
+            GenerationJob.id.in_(trabajo_ids),
+            GenerationJob.worker_id == worker_id
+        )
+        .values(heartbeat_at=ahora_utc())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def devolver_a_cola(db: AsyncSession, worker_id: str, trabajo_ids: List[int]):
+    """
+    Devuelve a la cola trabajos interrumpidos por un apagado ordenado.
+    No cuenta como intento fallido.
+    """
+    if not trabajo_ids:
+        return
+    await db.execute(
+        update(GenerationJob)
+        .where(
+            GenerationJob.id.in_(trabajo_ids),
+            GenerationJob.worker_id == worker_id,
+            GenerationJob.estado == EstadoTrabajo.EN_PROCESO.value
+        )
+        .values(
+            estado=EstadoTrabajo.PENDIENTE.value,
+            worker_id=None,
+            intentos=GenerationJob.intentos - 1
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def recuperar_trabajos_huerfanos(db: AsyncSession) -> int:
+    """
+    Recupera trabajos cuyo worker murió (sin heartbeat reciente).
+    Se reencolan si les quedan intentos; si no, se marcan como error
+    y se devuelve el crédito.
+    Retorna el número de trabajos recuperados.
+    """
+    limite = ahora_utc() - timedelta(seconds=settings.TRABAJO_TIMEOUT_SEGUNDOS)
+
+    result = await db.execute(
+        select(GenerationJob).where(
+            GenerationJob.estado == EstadoTrabajo.EN_PROCESO.value,
+            GenerationJob.heartbeat_at < limite
+        )
+    )
+    huerfanos = result.scalars().all()
+
+    for trabajo in huerfanos:
+        if trabajo.intentos < trabajo.max_intentos:
+            trabajo.estado = EstadoTrabajo.PENDIENTE.value
+            trabajo.worker_id = None
+        else:
+            await _marcar_fallido(db, trabajo, "El trabajo se interrumpió demasiadas veces")
+
+    if huerfanos:
+        await db.commit()
+    return len(huerfanos)
+
+
+async def reclamar_lote(db: AsyncSession, worker_id: str, trabajo_id: int) -> List[int]:
+    """
+    Si el trabajo reclamado es parte de un lote (varios estilos del mismo
+    producto), reclama también los hermanos pendientes para ejecutarlos juntos.
+    Marca las generaciones como PROCESANDO y confirma todo el reclamo en un
+    solo commit. Retorna los ids reclamados, empezando por trabajo_id.
+    """
+    trabajo = await db.get(GenerationJob, trabajo_id)
+    hermanos = [tid for tid in (trabajo.payload or {}).get("lote", []) if tid != trabajo_id] if trabajo else []
+    trabajo_ids = [trabajo_id]
+
+    if hermanos:
+        ahora = ahora_utc()
+        await db.execute(
+            update(GenerationJob)
+            .where(
+                GenerationJob.id.in_(hermanos),
+                GenerationJob.estado == EstadoTrabajo.PENDIENTE.value
+            )
+            .values(
+                estado=EstadoTrabajo.EN_PROCESO.value,
+                worker_id=worker_id,
+                intentos=GenerationJob.intentos + 1,
+                started_at=ahora,
+                heartbeat_at=ahora
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        # Otros workers pueden haber tomado alguno de los hermanos
+        result = await db.execute(
+            select(GenerationJob.id).where(
+                GenerationJob.id.in_(hermanos),
+                GenerationJob.worker_id == worker_id,
+                GenerationJob.estado == EstadoTrabajo.EN_PROCESO.value
+            )
+        )
+        trabajo_ids += sorted(result.scalars().all())
+
+    await _marcar_procesando(db, trabajo_ids)
+    await db.commit()
+    return trabajo_ids
+
+
+async def _marcar_procesando(db: AsyncSession, trabajo_ids: List[int]):
+    """Pasa a PROCESANDO las generaciones de los trabajos reclamados (sin commit)"""
+    result = await db.execute(
+        select(Generation).where(
+            Generation.id.in_(
+                select(GenerationJob.generation_id).where(GenerationJob.id.in_(trabajo_ids))
+            )
+        )
+    )
+    for generacion in result.scalars().all():
+        generacion.estado = EstadoGeneracion.PROCESANDO.value
+        publicar_evento(db, generacion.user_id, TIPO_IMAGEN, generacion.id, generacion.estado)
+
+
+async def _preparar_imagenes(trabajo_id: int, payload: dict) -> dict:
+    """
+    Normaliza producto y logo: una variante ligera para OpenAI y otra para
+    Gemini. Retorna los argumentos de imagen para el servicio de generación.
+    """
+    imagen = await normalizar_imagen(
+        payload["imagen_path"],
+        payload.get("imagen_mime", "image/jpeg"),
+        (settings.IMAGEN_MAX_LADO_ANALISIS, settings.IMAGEN_MAX_LADO_CONDICIONAMIENTO)
+    )
+    (analisis, analisis_mime), (condicionamiento, imagen_mime) = imagen["variantes"]
+    bytes_ahorrados = imagen["bytes_ahorrados"]
+
+    logo_bytes = None
+    logo_mime = payload.get("logo_mime", "image/png")
+    if payload.get("logo_path"):
+        logo = await normalizar_imagen(
+            payload["logo_path"],
+            logo_mime,
+            (settings.IMAGEN_MAX_LADO_CONDICIONAMIENTO,)
+        )
+        (logo_bytes, logo_mime), = logo["variantes"]
+        bytes_ahorrados += logo["bytes_ahorrados"]
+
+    print(f"[WORKER] Trabajo {trabajo_id}: normalización ahorró {bytes_ahorrados // 1024} KB")
+
+    return {
+        "imagen_producto": condicionamiento,
+        "imagen_mime": imagen_mime,
+        "logo": logo_bytes,
+        "logo_mime": logo_mime,
+        "imagen_analisis": analisis,
+        "imagen_analisis_mime": analisis_mime
+    }
+
+
+def _ruta_imagen(generacion: Generation) -> str:
+    """Ruta donde se escribe la imagen generada"""
+    return os.path.join(settings.GENERATED_DIR, f"{generacion.id}_{uuid.uuid4().hex[:8]}.png")
+
+
+async def _aplicar_resultado(
+    db: AsyncSession,
+    trabajo: GenerationJob,
+    generacion: Generation,
+    resultado: dict,
+    worker_id: str
+):
+    """
+    Finaliza trabajo y generación según el resultado del servicio (sin
+    commit). Si el trabajo ya no es de este worker (recuperado como huérfano
+    mientras corría) el resultado se descarta.
+    """
+    print(f"[WORKER] Trabajo {trabajo.id}: tiempos por etapa {resultado.get('tiempos')}")
+
+    if not resultado.get("exito"):
+        await _marcar_fallido(db, trabajo, resultado.get("error", "Error desconocido"), generacion, worker_id)
+        return
+
+    if not await _cerrar_trabajo(db, trabajo.id, worker_id, EstadoTrabajo.COMPLETADO.value):
+        print(f"[WORKER] Trabajo {trabajo.id}: ya no es de {worker_id}, se descarta el resultado")
+        _eliminar_imagen(resultado.get("imagen_path"))
+        return
+
+    if generacion:
+        # La imagen ya quedó en disco (escrita en streaming)
+        generacion.estado = EstadoGeneracion.COMPLETADA.value
+        generacion.imagen_generada_path = resultado["imagen_path"]
+        generacion.prompt_generado = resultado.get("prompt_usado")
+        generacion.copy_facebook = resultado.get("copy_facebook")
+        generacion.hashtags_facebook = resultado.get("hashtags_facebook")
+        generacion.copy_instagram = resultado.get("copy_instagram")
+        generacion.hashtags_instagram = resultado.get("hashtags_instagram")
+        generacion.tiempo_procesamiento_ms = resultado.get("tiempo_ms")
+        generacion.completed_at = ahora_utc()
+        publicar_evento(
+            db, generacion.user_id, TIPO_IMAGEN, generacion.id, generacion.estado,
+            imagen_url=f"/viralpost/imagenes/{os.path.basename(generacion.imagen_generada_path)}"
+        )
+        if await confirmar_reserva(db, TIPO_IMAGEN, generacion.id):
+            await sumar_estadistica(db, GENERACIONES_COMPLETADAS, generacion.estilo)
+
+
+async def _cerrar_trabajo(
+    db: AsyncSession,
+    trabajo_id: int,
+    worker_id: str,
+    estado: str,
+    error: Optional[str] = None
+) -> bool:
+    """
+    Pasa el trabajo a su estado final solo si sigue EN_PROCESO y reclamado
+    por worker_id (UPDATE condicional, sin commit). Retorna True si lo cerró.
+    """
+    result = await db.execute(
+        update(GenerationJob)
+        .where(
+            GenerationJob.id == trabajo_id,
+            GenerationJob.estado == EstadoTrabajo.EN_PROCESO.value,
+            GenerationJob.worker_id == worker_id
+        )
+        .values(estado=estado, error_mensaje=error, completed_at=ahora_utc())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _eliminar_imagen(ruta: Optional[str]):
+    """Borra una imagen generada cuyo resultado se descartó"""
+    if ruta and os.path.exists(ruta):
+        try:
+            os.remove(ruta)
+        except OSError as e:
+            print(f"[WORKER] No se pudo borrar {ruta}: {e}")
+
+
+async def ejecutar_trabajo(trabajo_id: int):
+    """
+    Ejecuta un trabajo reclamado: genera contenido y finaliza la generación.
+    La generación ya está en PROCESANDO (reclamar_lote).
+    """
+    # Lectura corta; la sesión se cierra antes de llamar al upstream
+    async with async_session_maker() as db:
+        trabajo = await db.get(GenerationJob, trabajo_id)
+        if not trabajo:
+            return
+
+        generacion = await db.get(Generation, trabajo.generation_id)
+        if not generacion:
+            trabajo.estado = EstadoTrabajo.ERROR.value
+            trabajo.error_mensaje = "Generación no encontrada"
+            await db.commit()
+            return
+
+    # Asignado al reclamar; el resultado solo se aplica si sigue siendo de este worker
+    worker_id = trabajo.worker_id
+    payload = trabajo.payload
+    try:
+        imagenes = await _preparar_imagenes(trabajo_id, payload)
+
+        resultado = await generation_service.generar_contenido_completo(
+            estilo_id=generacion.estilo,
+            nombre_producto=generacion.nombre_producto,
+            descripcion_producto=generacion.descripcion_producto or "",
+            marca=generacion.marca or "",
+            precio=payload.get("precio") or "",
+            usar_cache=not payload.get("sin_cache", False),
+            ruta_imagen=_ruta_imagen(generacion),
+            **imagenes
+        )
+    except Exception as e:
+        resultado = {"exito": False, "error": str(e)}
+
+    # Finalizar: una sola transacción con el resultado y el crédito
+    async with async_session_maker() as db:
+        try:
+            trabajo = await db.get(GenerationJob, trabajo_id)
+            generacion = await db.get(Generation, trabajo.generation_id)
+            await _aplicar_resultado(db, trabajo, generacion, resultado, worker_id)
+            await db.commit()
+
+        except Exception as e:
+            await db.rollback()
+            trabajo = await db.get(GenerationJob, trabajo_id)
+            await _marcar_fallido(db, trabajo, str(e), worker_id=worker_id)
+            await db.commit()
+
+
+async def ejecutar_lote(trabajo_ids: List[int]):
+    """
+    Ejecuta varios trabajos reclamados del mismo lote con una sola llamada a
+    OpenAI. Cada estilo se confirma (y su crédito se devuelve si falla) en
+    cuanto termina, sin esperar al resto. Las generaciones ya están en
+    PROCESANDO (reclamar_lote).
+    """
+    async with async_session_maker() as db:
+        result = await db.execute(select(GenerationJob).where(GenerationJob.id.in_(trabajo_ids)))
+        trabajos = {t.id: t for t in result.scalars().all()}
+        result = await db.execute(
+            select(Generation).where(Generation.id.in_([t.generation_id for t in trabajos.values()]))
+        )
+        generaciones = {g.id: g for g in result.scalars().all()}
+
+        # estilo -> (trabajo_id, generacion)
+        por_estilo = {}
+        sin_generacion = False
+        for trabajo_id in trabajo_ids:
+            trabajo = trabajos.get(trabajo_id)
+            generacion = generaciones.get(trabajo.generation_id) if trabajo else None
+            if generacion:
+                por_estilo[generacion.estilo] = (trabajo_id, generacion)
+            elif trabajo:
+                trabajo.estado = EstadoTrabajo.ERROR.value
+                trabajo.error_mensaje = "Generación no encontrada"
+                sin_generacion = True
+        if sin_generacion:
+            await db.commit()
+
+    if not por_estilo:
+        return
+
+    # Todos los trabajos del lote los reclamó este worker
+    worker_id = trabajos[trabajo_ids[0]].worker_id
+
+    async def al_completar(estilo_id: str, resultado: dict):
+        trabajo_id, _ = por_estilo[estilo_id]
+        async with async_session_maker() as db:
+            trabajo = await db.get(GenerationJob, trabajo_id)
+            generacion = await db.get(Generation, trabajo.generation_id)
+            await _aplicar_resultado(db, trabajo, generacion, resultado, worker_id)
+            await db.commit()
+
+    primer_id, primera = next(iter(por_estilo.values()))
+    payload = trabajos[primer_id].payload
+
+    try:
+        imagenes = await _preparar_imagenes(primer_id, payload)
+
+        await generation_service.generar_lote(
+            estilo_ids=list(por_estilo.keys()),
+            nombre_producto=primera.nombre_producto,
+            descripcion_producto=primera.descripcion_producto or "",
+            marca=primera.marca or "",
+            precio=payload.get("precio") or "",
+            usar_cache=not payload.get("sin_cache", False),
+            rutas_imagen={estilo: _ruta_imagen(g) for estilo, (_, g) in por_estilo.items()},
+            al_completar=al_completar,
+            **imagenes
+        )
+
+    except Exception as e:
+        # Fallar solo los que no alcanzaron a terminar
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(GenerationJob).where(
+                    GenerationJob.id.in_(trabajo_ids),
+                    GenerationJob.estado == EstadoTrabajo.EN_PROCESO.value,
+                    GenerationJob.worker_id == worker_id
+                )
+            )
+            for trabajo in result.scalars().all():
+                await _marcar_fallido(db, trabajo, str(e), worker_id=worker_id)
+            await db.commit()
+
+
+async def _marcar_fallido(
+    db: AsyncSession,
+    trabajo: GenerationJob,
+    error: str,
+    generacion: Optional[Generation] = None,
+    worker_id: Optional[str] = None
+):
+    """
+    Marca trabajo y generación como error y devuelve el crédito.
+    Con worker_id (el worker que lo ejecutaba) solo lo hace si el trabajo
+    sigue siendo suyo; sin él (recuperación de huérfanos) siempre.
+    """
+    if worker_id is not None:
+        if not await _cerrar_trabajo(db, trabajo.id, worker_id, EstadoTrabajo.ERROR.value, error):
+            print(f"[WORKER] Trabajo {trabajo.id}: ya no es de {worker_id}, se descarta el error")
+            return
+    else:
+        trabajo.estado = EstadoTrabajo.ERROR.value
+        trabajo.error_mensaje = error
+        trabajo.completed_at = ahora_utc()
+
+    if generacion is None:
+        generacion = await db.get(Generation, trabajo.generation_id)
+
+    if generacion:
+        generacion.estado = EstadoGeneracion.ERROR.value
+        generacion.error_mensaje = error
+        publicar_evento(db, generacion.user_id, TIPO_IMAGEN, generacion.id, generacion.estado, error=error)
+
+    # Devolver crédito (una sola vez aunque se marque como error de nuevo)
+    if await liberar_reserva(db, trabajo.user_id, TIPO_IMAGEN, trabajo.generation_id):
+        await sumar_estadistica(db, GENERACIONES_FALLIDAS, generacion.estilo if generacion else None)
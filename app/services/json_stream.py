@@ -0,0 +1,227 @@
+"""
+Cuerpos JSON con imágenes en base64 generados y leídos en streaming
+
+En lugar de construir el string base64 completo, meterlo en un dict y
+serializarlo (tres copias del archivo en memoria), el base64 se codifica por
+bloques al momento de enviar la petición.
+
+En sentido inverso, ExtractorBase64 recorre una respuesta JSON por bloques y
+decodifica un campo base64 (la imagen de Gemini) sin materializar el JSON.
+"""
+import base64
+import binascii
+import json
+from typing import AsyncIterator, Callable, Dict, FrozenSet, List, Optional, Tuple, Union
+
+# Múltiplo de 3: cada bloque se codifica sin padding intermedio
+BLOQUE_BASE64 = 3 * 64 * 1024
+
+
+def marcador(nombre: str) -> str:
+    """Placeholder que se coloca en el payload donde va el base64 de `nombre`"""
+    return f"@@BASE64:{nombre}@@"
+
+
+def cuerpo_json_base64(
+    payload: dict,
+    binarios: Dict[str, bytes]
+) -> Tuple[int, Callable[[], AsyncIterator[bytes]]]:
+    """
+    Serializa `payload` sustituyendo cada marcador(nombre) por el base64 de
+    binarios[nombre].
+
+    Retorna (content_length, fabrica) donde fabrica() crea un iterador async
+    nuevo en cada llamada (permite reintentar la petición).
+    """
+    texto = json.dumps(payload).encode("utf-8")
+
+    # Ubicar los marcadores en el orden en que aparecen en el JSON
+    posiciones = sorted(
+        (texto.index(marcador(nombre).encode("ascii")), nombre)
+        for nombre in binarios
+    )
+
+    segmentos: list = []
+    cursor = 0
+    for inicio, nombre in posiciones:
+        segmentos.append(texto[cursor:inicio])
+        segmentos.append(memoryview(binarios[nombre]))
+        cursor = inicio + len(marcador(nombre))
+    segmentos.append(texto[cursor:])
+
+    longitud = sum(_longitud(s) for s in segmentos)
+
+    async def generar() -> AsyncIterator[bytes]:
+        for segmento in segmentos:
+            if isinstance(segmento, memoryview):
+                for i in range(0, len(segmento), BLOQUE_BASE64):
+                    yield base64.b64encode(segmento[i:i + BLOQUE_BASE64])
+            elif segmento:
+                yield segmento
+
+    return longitud, generar
+
+
+def _longitud(segmento: Union[bytes, memoryview]) -> int:
+    """Bytes que ocupa un segmento ya codificado"""
+    if isinstance(segmento, memoryview):
+        return 4 * ((len(segmento) + 2) // 3)
+    return len(segmento)
+
+
+class ExtractorBase64:
+    """
+    Parser JSON incremental que decodifica el primer string cuya ruta termina
+    en <una de claves_padre>.<clave> (p. ej. inlineData.data).
+
+    Solo sigue la estructura (objetos, arreglos y claves); los demás valores
+    se saltan sin guardarse. Uso:
+
+        extractor = ExtractorBase64({"inlineData", "inline_data"}, "data")
+        for bloque in respuesta:
+            for decodificado in extractor.procesar(bloque):
+                archivo.write(decodificado)
+        archivo.write(extractor.terminar())
+    """
+
+    def __init__(self, claves_padre: FrozenSet[str], clave: str):
+        self.claves_padre = frozenset(claves_padre)
+        self.clave = clave
+
+        # Una entrada por contenedor abierto: clave actual (objetos) o None (arreglos)
+        self._pila: List[Optional[str]] = []
+        self._es_objeto: List[bool] = []
+        self._esperando_clave = False
+
+        self._en_string = False
+        self._string_es_clave = False
+        self._string_es_objetivo = False
+        self._escape_pendiente = False
+        self._clave_parcial = bytearray()
+
+        self._pendiente_b64 = b""  # Caracteres base64 que aún no completan un grupo de 4
+        self.encontrado = False
+        self.completo = False
+        self.bytes_decodificados = 0
+
+    def procesar(self, bloque: bytes) -> List[bytes]:
+        """Consume un bloque de la respuesta. Retorna los bytes decodificados."""
+        salida: List[bytes] = []
+        i = 0
+        n = len(bloque)
+
+        while i < n:
+            if self._en_string:
+                i = self._procesar_string(bloque, i, salida)
+                continue
+
+            c = bloque[i]
+            if c == 0x22:  # "
+                self._abrir_string()
+            elif c == 0x7B:  # {
+                self._pila.append(None)
+                self._es_objeto.append(True)
+                self._esperando_clave = True
+            elif c == 0x5B:  # [
+                self._pila.append(None)
+                self._es_objeto.append(False)
+                self._esperando_clave = False
+            elif c in (0x7D, 0x5D):  # } ]
+                if self._pila:
+                    self._pila.pop()
+                    self._es_objeto.pop()
+                self._esperando_clave = False
+            elif c == 0x2C:  # ,
+                self._esperando_clave = bool(self._es_objeto) and self._es_objeto[-1]
+            # ':' , espacios, números y literales no cambian la ruta
+            i += 1
+
+        return salida
+
+    def terminar(self) -> bytes:
+        """Decodifica lo que quede pendiente (con padding)"""
+        if not self._pendiente_b64:
+            return b""
+        pendiente = self._pendiente_b64
+        self._pendiente_b64 = b""
+        pendiente += b"=" * (-len(pendiente) % 4)
+        datos = base64.b64decode(pendiente)
+        self.bytes_decodificados += len(datos)
+        return datos
+
+    # ---------- Strings ----------
+
+    def _abrir_string(self):
+        self._en_string = True
+        self._escape_pendiente = False
+        self._string_es_clave = self._esperando_clave
+        self._string_es_objetivo = False
+        if self._string_es_clave:
+            self._clave_parcial.clear()
+        elif (
+            not self.encontrado
+            and len(self._pila) >= 2
+            and self._es_objeto[-1]
+            and self._pila[-1] == self.clave
+            and self._pila[-2] in self.claves_padre
+        ):
+            self._string_es_objetivo = True
+            self.encontrado = True
+
+    def _procesar_string(self, bloque: bytes, i: int, salida: List[bytes]) -> int:
+        """Avanza dentro de un string; retorna la nueva posición"""
+        if self._escape_pendiente:
+            escapado = bloque[i:i + 1]
+            self._escape_pendiente = False
+            if self._string_es_objetivo:
+                if escapado == b"/":
+                    self._agregar_b64(b"/", salida)
+                elif escapado not in (b"n", b"r"):
+                    raise ValueError("Escape inesperado en el campo base64")
+            elif self._string_es_clave:
+                self._clave_parcial += escapado
+            return i + 1
+
+        # Saltar directo al siguiente " o \ (el contenido puede medir megabytes)
+        fin_comilla = bloque.find(b'"', i)
+        fin_escape = bloque.find(b"\\", i, fin_comilla if fin_comilla != -1 else len(bloque))
+        fin = fin_escape if fin_escape != -1 else fin_comilla
+        if fin == -1:
+            fin = len(bloque)
+
+        if self._string_es_objetivo:
+            self._agregar_b64(bloque[i:fin], salida)
+        elif self._string_es_clave:
+            self._clave_parcial += bloque[i:fin]
+
+        if fin == len(bloque):
+            return fin
+        if fin == fin_escape:
+            self._escape_pendiente = True
+            return fin + 1
+
+        # Cierre del string
+        self._en_string = False
+        if self._string_es_clave:
+            self._pila[-1] = self._clave_parcial.decode("utf-8", errors="replace")
+            self._esperando_clave = False
+        elif self._string_es_objetivo:
+            self._string_es_objetivo = False
+            self.completo = True
+            final = self.terminar()
+            if final:
+                salida.append(final)
+        return fin + 1
+
+    def _agregar_b64(self, texto: bytes, salida: List[bytes]):
+        """Decodifica en grupos de 4 caracteres; el resto queda pendiente"""
+        datos = self._pendiente_b64 + texto
+        corte = len(datos) - len(datos) % 4
+        self._pendiente_b64 = datos[corte:]
+        if corte:
+            try:
+                decodificado = base64.b64decode(datos[:corte], validate=True)
+            except binascii.Error as e:
+                raise ValueError(f"Base64 inválido en la respuesta: {e}")
+            self.bytes_decodificados += len(decodificado)
+            salida.append(decodificado)
@@ -0,0 +1,60 @@
+"""
+Elección de líder entre procesos usando la base de datos
+
+Cada uvicorn worker puede correr las mismas tareas de fondo; con un lock
+renovable en la tabla liderazgos solo una instancia las ejecuta por
+despliegue.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from app.core.database import async_session_maker
+from app.models.lock import Liderazgo
+
+
+async def adquirir_liderazgo(nombre: str, propietario: str, ttl_segundos: float) -> bool:
+    """
+    Toma o renueva el liderazgo de `nombre` por ttl_segundos.
+    Retorna True si `propietario` es el líder vigente.
+    """
+    ahora = datetime.utcnow()
+    expira = ahora + timedelta(seconds=ttl_segundos)
+
+    async with async_session_maker() as db:
+        result = await db.execute(
+            update(Liderazgo)
+            .where(
+                Liderazgo.nombre == nombre,
+                or_(Liderazgo.propietario == propietario, Liderazgo.expira_en < ahora)
+            )
+            .values(propietario=propietario, expira_en=expira)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if result.rowcount == 1:
+            return True
+
+        # Primera vez: crear el registro (si otro lo creó antes, no somos líder)
+        if await db.get(Liderazgo, nombre) is not None:
+            return False
+        db.add(Liderazgo(nombre=nombre, propietario=propietario, expira_en=expira))
+        try:
+            await db.commit()
+            return True
+        except IntegrityError:
+            await db.rollback()
+            return False
+
+
+async def liberar_liderazgo(nombre: str, propietario: str):
+    """Suelta el liderazgo (en el shutdown) para que otro lo tome de inmediato"""
+    async with async_session_maker() as db:
+        await db.execute(
+            delete(Liderazgo).where(
+                Liderazgo.nombre == nombre,
+                Liderazgo.propietario == propietario
+            )
+        )
+        await db.commit()
@@ -0,0 +1,407 @@
+"""
+Tareas de generación de música
+
+Iniciar la canción y finalizarla corren en el supervisor tareas_musica
+(concurrencia acotada, drenado en el shutdown). MusicGPT avisa al terminar
+llamando a un webhook firmado (POST /music/webhook/{id}?firma=...); el
+planificador central (music_scheduler) consulta /byId para los callbacks
+que nunca llegan y reanuda las generaciones devueltas a PENDIENTE.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+from typing import Callable, List, Optional, Set
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session_maker, ahora_utc, como_utc
+from app.models.music_generation import MusicGeneration, EstadoMusicGeneration, MusicAudioVariante
+from app.services.music_service import music_service
+from app.services.eventos import publicar_evento, TIPO_MUSICA
+from app.services.escrituras import cola_escrituras
+from app.services.creditos import confirmar_reserva, liberar_reserva
+from app.services.estadisticas import sumar_estadistica, MUSICA_COMPLETADAS, MUSICA_FALLIDAS
+from app.services.tareas import SupervisorTareas
+
+
+# ============ FIRMA DEL CALLBACK ============
+
+def firmar_callback(generacion_id: int) -> str:
+    """HMAC-SHA256 del id de la generación con MUSICGPT_WEBHOOK_SECRET"""
+    return hmac.new(
+        settings.MUSICGPT_WEBHOOK_SECRET.encode("utf-8"),
+        f"music:{generacion_id}".encode("utf-8"),
+        hashlib.sha256
+    ).hexdigest()
+
+
+def verificar_firma(generacion_id: int, firma: str) -> bool:
+    """Compara la firma recibida en tiempo constante"""
+    if not settings.MUSICGPT_WEBHOOK_SECRET or not firma:
+        return False
+    return hmac.compare_digest(firmar_callback(generacion_id), firma)
+
+
+def url_callback(generacion_id: int) -> Optional[str]:
+    """URL pública del webhook para una generación (None si no hay secreto)"""
+    if not settings.MUSICGPT_WEBHOOK_SECRET:
+        return None
+    return (
+        f"{settings.BASE_URL}/api/music/webhook/{generacion_id}"
+        f"?firma={firmar_callback(generacion_id)}"
+    )
+
+
+# Supervisor de las tareas de música de este proceso (se inicia en el lifespan)
+tareas_musica = SupervisorTareas("musica", settings.TAREAS_MUSICA_CONCURRENCIA)
+
+# Canciones cuyo POST a MusicGPT ya empezó desde este proceso. Si la tarea se
+# cancela no vuelven a PENDIENTE (se enviarían y cobrarían dos veces): si el
+# conversion_id no alcanzó a guardarse, el planificador las cierra por timeout.
+_solicitadas: Set[int] = set()
+
+
+# ============ INICIO ============
+
+def lanzar_generacion(generacion_id: int):
+    """Encola el inicio de una canción en el supervisor"""
+    tareas_musica.enviar(
+        f"generación {generacion_id}",
+        lambda: procesar_generacion(generacion_id),
+        lambda: devolver_generacion(generacion_id)
+    )
+
+
+async def procesar_generacion(generacion_id: int):
+    """
+    Genera el prompt y solicita la canción a MusicGPT con los datos
+    guardados en la generación.
+
+    Solo guarda el conversion_id: el resultado llega a POST /music/webhook/{id}
+    o lo recoge el planificador central.
+    """
+    cancelada = False
+    try:
+        async with async_session_maker() as db:
+            generacion = await db.get(MusicGeneration, generacion_id)
+        if not generacion or generacion.estado != EstadoMusicGeneration.GENERANDO_PROMPT.value:
+            return
+
+        webhook_url = url_callback(generacion_id)
+
+        resultado = await music_service.iniciar_cancion(
+            descripcion=generacion.descripcion,
+            duracion=generacion.duracion_segundos,
+            genero=generacion.genero,
+            mood=generacion.mood,
+            es_instrumental=generacion.es_instrumental,
+            webhook_url=webhook_url,
+            # Solo desde el POST: cancelada durante el prompt vuelve a PENDIENTE
+            al_enviar=lambda: _solicitadas.add(generacion_id)
+        )
+
+        if not resultado.get("exito"):
+            # Error - devuelve el crédito
+            await finalizar_generacion(generacion_id, error=resultado.get("error", "Error desconocido"))
+            return
+
+        async def guardar_solicitud(db: AsyncSession):
+            await db.execute(
+                update(MusicGeneration)
+                .where(MusicGeneration.id == generacion_id)
+                .values(
+                    prompt_musicgpt=resultado.get("prompt_usado"),
+                    music_style=resultado.get("music_style"),
+                    mood=resultado.get("mood"),
+                    genero=resultado.get("genre"),
+                    musicgpt_conversion_id=resultado.get("conversion_id")
+                )
+                .execution_options(synchronize_session=False)
+            )
+            # Un webhook rápido pudo finalizarla antes de este commit: solo
+            # avanza si sigue en GENERANDO_PROMPT
+            avance = await db.execute(
+                update(MusicGeneration)
+                .where(
+                    MusicGeneration.id == generacion_id,
+                    MusicGeneration.estado == EstadoMusicGeneration.GENERANDO_PROMPT.value
+                )
+                .values(estado=EstadoMusicGeneration.GENERANDO_MUSICA.value)
+                .execution_options(synchronize_session=False)
+            )
+            if avance.rowcount == 1:
+                publicar_evento(
+                    db, generacion.user_id, TIPO_MUSICA, generacion_id,
+                    EstadoMusicGeneration.GENERANDO_MUSICA.value
+                )
+
+        async def guardar():
+            async with async_session_maker() as db:
+                await guardar_solicitud(db)
+                await db.commit()
+
+        # Directo (sin la cola por lotes) y protegido de la cancelación del
+        # drenado: la canción ya está pagada en MusicGPT
+        await asyncio.shield(guardar())
+
+    except asyncio.CancelledError:
+        cancelada = True
+        raise
+    except Exception as e:
+        # Error inesperado - devuelve el crédito
+        try:
+            await finalizar_generacion(generacion_id, error=str(e))
+        except Exception as e2:
+            print(f"[MUSIC] No se pudo marcar el error de {generacion_id}: {e2}")
+    finally:
+        # Si se canceló, devolver_generacion la consulta (y la quita)
+        if not cancelada:
+            _solicitadas.discard(generacion_id)
+
+
+async def devolver_generacion(generacion_id: int):
+    """
+    Devuelve a su estado persistente una tarea que no terminó (shutdown):
+    - sin canción solicitada: PENDIENTE, el planificador la vuelve a lanzar
+    - solicitada a MusicGPT sin conversion_id guardado: se queda en
+      GENERANDO_PROMPT y el planificador la cierra por timeout (reembolso)
+    - descarga interrumpida: GENERANDO_MUSICA, se vuelve a consultar y la
+      descarga se reanuda desde el .part
+    """
+    solicitada = generacion_id in _solicitadas
+    _solicitadas.discard(generacion_id)
+
+    async def devolver(db: AsyncSession):
+        if not solicitada:
+            await db.execute(
+                update(MusicGeneration)
+                .where(
+                    MusicGeneration.id == generacion_id,
+                    MusicGeneration.estado == EstadoMusicGeneration.GENERANDO_PROMPT.value,
+                    MusicGeneration.musicgpt_conversion_id.is_(None)
+                )
+                .values(estado=EstadoMusicGeneration.PENDIENTE.value)
+                .execution_options(synchronize_session=False)
+            )
+        await _devolver_descargando(db, generacion_id)
+
+    # En el shutdown se devuelven muchas a la vez: un solo commit
+    await cola_escrituras.escribir(devolver)
+
+
+async def devolver_descarga(generacion_id: int):
+    """
+    Abandono de una finalización: solo deshace DESCARGANDO -> GENERANDO_MUSICA.
+    Nunca vuelve a PENDIENTE: la finalización con error de una canción sin
+    conversion_id puede ser de una ya pagada en MusicGPT (caída tras el POST).
+    """
+    await cola_escrituras.escribir(lambda db: _devolver_descargando(db, generacion_id))
+
+
+async def _devolver_descargando(db: AsyncSession, generacion_id: int):
+    await db.execute(
+        update(MusicGeneration)
+        .where(
+            MusicGeneration.id == generacion_id,
+            MusicGeneration.estado == EstadoMusicGeneration.DESCARGANDO.value
+        )
+        .values(estado=EstadoMusicGeneration.GENERANDO_MUSICA.value)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def reanudar_pendientes() -> int:
+    """
+    Reclama las generaciones devueltas a PENDIENTE (UPDATE condicional, así
+    solo un proceso las toma) y las encola de nuevo. Retorna cuántas.
+    """
+    async with async_session_maker() as db:
+        result = await db.execute(
+            select(MusicGeneration.id)
+            .where(MusicGeneration.estado == EstadoMusicGeneration.PENDIENTE.value)
+            .order_by(MusicGeneration.id)
+            .limit(settings.TAREAS_MUSICA_CONCURRENCIA * 4)
+        )
+        candidatas = result.scalars().all()
+
+        reanudadas = []
+        for generacion_id in candidatas:
+            result = await db.execute(
+                update(MusicGeneration)
+                .where(
+                    MusicGeneration.id == generacion_id,
+                    MusicGeneration.estado == EstadoMusicGeneration.PENDIENTE.value
+                )
+                .values(estado=EstadoMusicGeneration.GENERANDO_PROMPT.value)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                reanudadas.append(generacion_id)
+        await db.commit()
+
+    for generacion_id in reanudadas:
+        lanzar_generacion(generacion_id)
+    return len(reanudadas)
+
+
+# ============ FINALIZACIÓN ============
+
+def lanzar_finalizacion(generacion_id: int, al_terminar: Optional[Callable[[], None]] = None, **kwargs):
+    """
+    Encola la finalización (descarga o error) en el supervisor. al_terminar()
+    se llama cuando la tarea corrió (o se abandonó).
+    """
+    async def finalizar():
+        try:
+            await finalizar_generacion(generacion_id, **kwargs)
+        finally:
+            if al_terminar:
+                al_terminar()
+
+    async def abandonar():
+        try:
+            await devolver_descarga(generacion_id)
+        finally:
+            if al_terminar:
+                al_terminar()
+
+    tareas_musica.enviar(f"finalización {generacion_id}", finalizar, abandonar)
+
+
+async def finalizar_generacion(
+    generacion_id: int,
+    audio_url: Optional[str] = None,
+    error: Optional[str] = None,
+    audio_urls: Optional[List[str]] = None
+) -> bool:
+    """
+    Completa (descargando el audio) o marca como error una generación.
+
+    Idempotente: el UPDATE condicional a DESCARGANDO garantiza que solo un
+    proceso finalice, aunque llegue el webhook y el planificador al mismo tiempo
+    o MusicGPT repita el callback. Retorna True si esta llamada la finalizó.
+
+    Las variantes (audio_urls) se descargan en paralelo; la primera que se
+    descarga bien queda como audio principal de la generación.
+    """
+    async def reclamar(db: AsyncSession) -> int:
+        result = await db.execute(
+            update(MusicGeneration)
+            .where(
+                MusicGeneration.id == generacion_id,
+                MusicGeneration.estado.in_([
+                    EstadoMusicGeneration.GENERANDO_PROMPT.value,
+                    EstadoMusicGeneration.GENERANDO_MUSICA.value
+                ])
+            )
+            .values(
+                estado=EstadoMusicGeneration.DESCARGANDO.value,
+                descarga_heartbeat_at=ahora_utc()
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    if await cola_escrituras.escribir(reclamar) != 1:
+        return False
+
+    async with async_session_maker() as db:
+        generacion = await db.get(MusicGeneration, generacion_id)
+
+        if error or not (audio_url or audio_urls):
+            await _marcar_error(db, generacion, error or "MusicGPT no retornó audio")
+            await db.commit()
+            return True
+
+        publicar_evento(db, generacion.user_id, TIPO_MUSICA, generacion.id, EstadoMusicGeneration.DESCARGANDO.value)
+        await db.commit()
+
+        # Guardar las variantes localmente. Nombres deterministas para que
+        # un reintento tras una caída reanude el .part existente.
+        urls = audio_urls or [audio_url]
+        destinos = [
+            (url, os.path.join(settings.GENERATED_DIR, "music", _nombre_archivo(generacion.id, numero, url)))
+            for numero, url in enumerate(urls, start=1)
+        ]
+        # Mientras descarga renueva su heartbeat: el planificador solo
+        # reintenta descargas sin señal de vida (proceso caído)
+        latido = asyncio.create_task(_latir_descarga(generacion.id))
+        try:
+            descargas = await music_service.descargar_variantes(destinos)
+        finally:
+            latido.cancel()
+
+        principal = None
+        for numero, ((url, ruta_local), descarga) in enumerate(zip(destinos, descargas), start=1):
+            variante = MusicAudioVariante(generacion_id=generacion.id, numero=numero)
+            if descarga:
+                variante.audio_path = ruta_local
+                variante.audio_url = f"/viralpost/music/{os.path.basename(ruta_local)}"
+                variante.tamano_bytes = descarga["bytes"]
+                variante.sha256 = descarga["sha256"]
+                principal = principal or variante
+            else:
+                variante.audio_url = url
+            db.add(variante)
+
+        if principal:
+            generacion.audio_path = principal.audio_path
+            generacion.audio_url = principal.audio_url
+        else:
+            generacion.audio_url = audio_url or urls[0]
+
+        ahora = ahora_utc()
+        generacion.estado = EstadoMusicGeneration.COMPLETADA.value
+        generacion.completed_at = ahora
+        if generacion.created_at:
+            generacion.tiempo_procesamiento_ms = int(
+                (ahora - como_utc(generacion.created_at)).total_seconds() * 1000
+            )
+        publicar_evento(
+            db, generacion.user_id, TIPO_MUSICA, generacion.id, generacion.estado,
+            audio_url=generacion.audio_url
+        )
+        if await confirmar_reserva(db, TIPO_MUSICA, generacion.id):
+            await sumar_estadistica(db, MUSICA_COMPLETADAS, generacion.genero)
+        await db.commit()
+        return True
+
+
+async def _latir_descarga(generacion_id: int):
+    """Renueva descarga_heartbeat_at hasta que se cancele"""
+    async def latir(db: AsyncSession):
+        await db.execute(
+            update(MusicGeneration)
+            .where(
+                MusicGeneration.id == generacion_id,
+                MusicGeneration.estado == EstadoMusicGeneration.DESCARGANDO.value
+            )
+            .values(descarga_heartbeat_at=ahora_utc())
+            .execution_options(synchronize_session=False)
+        )
+
+    while True:
+        await asyncio.sleep(settings.DESCARGA_HEARTBEAT_SEGUNDOS)
+        try:
+            await cola_escrituras.escribir(latir)
+        except Exception as e:
+            print(f"[MUSIC] No se pudo renovar el heartbeat de la descarga {generacion_id}: {e}")
+
+
+def _nombre_archivo(generacion_id: int, numero: int, url: str) -> str:
+    """Nombre local de una variante (no adivinable, estable entre reintentos)"""
+    huella = hashlib.sha256(f"{generacion_id}:{url}".encode("utf-8")).hexdigest()[:8]
+    return f"music_{generacion_id}_{numero}_{huella}.mp3"
+
+
+async def _marcar_error(db: AsyncSession, generacion: MusicGeneration, error: str):
+    """Marca la generación como error y devuelve el crédito (sin commit)"""
+    generacion.estado = EstadoMusicGeneration.ERROR.value
+    generacion.error_mensaje = error
+    publicar_evento(db, generacion.user_id, TIPO_MUSICA, generacion.id, generacion.estado, error=error)
+
+    if await liberar_reserva(db, generacion.user_id, TIPO_MUSICA, generacion.id):
+        await sumar_estadistica(db, MUSICA_FALLIDAS, generacion.genero)
@@ -0,0 +1,282 @@
+"""
+Planificador central de consultas a MusicGPT
+
+Una sola tarea por despliegue (elegida con liderazgo en la base de datos)
+lee de la DB todas las canciones en proceso y consulta /byId con
+concurrencia acotada e intervalos adaptativos. Como el estado vive en la DB,
+al reiniciar se retoman las canciones pendientes sin perder nada.
+
+Con el webhook de MusicGPT configurado, las consultas son solo un respaldo
+lento para callbacks que no llegan.
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import and_, or_, select, update
+
+from app.core.config import settings
+from app.core.database import async_session_maker, ahora_utc, como_utc
+from app.models.music_generation import MusicGeneration, EstadoMusicGeneration
+from app.services.liderazgo import adquirir_liderazgo, liberar_liderazgo
+from app.services.music_jobs import lanzar_finalizacion, reanudar_pendientes
+from app.services.music_service import music_service
+
+
+NOMBRE_LIDERAZGO = "planificador_musica"
+
+# Cada cuánto se despachan las consultas vencidas
+TICK_SEGUNDOS = 1.0
+
+# Cada cuánto se relee la DB (canciones nuevas, terminadas por webhook...)
+REFRESCO_SEGUNDOS = 5.0
+
+# Crecimiento del intervalo entre consultas de una misma canción
+FACTOR_INTERVALO = 1.5
+
+
+class PlanificadorMusica:
+    """Consulta el estado de todas las canciones en proceso desde una sola tarea"""
+
+    def __init__(self):
+        self.id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.es_lider = False
+
+        # generacion_id -> (conversion_id, próxima consulta (monotonic), intervalo actual)
+        self._agenda: Dict[int, Tuple[str, float, float]] = {}
+        self._en_consulta: Set[int] = set()
+        # Finalizaciones encoladas en el supervisor que aún no corren: la fila
+        # sigue en GENERANDO_* hasta que la tarea la reclama
+        self._por_finalizar: Set[int] = set()
+        self._cola: Optional["asyncio.Queue[int]"] = None
+        self._ultimo_refresco = 0.0
+        self._ultima_renovacion = 0.0
+
+        self.consultas = 0
+        self.finalizadas = 0
+
+    # ---------- Ciclo principal ----------
+
+    async def ejecutar(self):
+        """Tarea de fondo (se cancela en el shutdown)"""
+        self._cola = asyncio.Queue()
+        consultores = [
+            asyncio.create_task(self._consultor())
+            for _ in range(settings.MUSICGPT_POLL_CONCURRENCIA)
+        ]
+        try:
+            while True:
+                try:
+                    await self._renovar_liderazgo()
+                    if self.es_lider:
+                        await self._planificar()
+                except Exception as e:
+                    print(f"[MUSIC] Error en planificador: {e}")
+                await asyncio.sleep(TICK_SEGUNDOS)
+        finally:
+            for consultor in consultores:
+                consultor.cancel()
+            if self.es_lider:
+                try:
+                    await liberar_liderazgo(NOMBRE_LIDERAZGO, self.id)
+                except Exception:
+                    pass
+
+    async def _renovar_liderazgo(self):
+        """Renueva el lock a un tercio del TTL; los demás procesos esperan"""
+        ahora = time.monotonic()
+        if ahora - self._ultima_renovacion < settings.LIDERAZGO_TTL_SEGUNDOS / 3:
+            return
+        self._ultima_renovacion = ahora
+
+        era_lider = self.es_lider
+        self.es_lider = await adquirir_liderazgo(
+            NOMBRE_LIDERAZGO, self.id, settings.LIDERAZGO_TTL_SEGUNDOS
+        )
+        if self.es_lider and not era_lider:
+            print(f"[MUSIC] {self.id} es el planificador de MusicGPT")
+            self._ultimo_refresco = 0.0
+        elif era_lider and not self.es_lider:
+            self._agenda.clear()
+
+    async def _planificar(self):
+        """Relee la DB si toca y encola las consultas vencidas"""
+        ahora = time.monotonic()
+        if ahora - self._ultimo_refresco >= REFRESCO_SEGUNDOS:
+            self._ultimo_refresco = ahora
+            await self._refrescar()
+
+        for generacion_id, (_, proxima, _) in list(self._agenda.items()):
+            if proxima <= ahora and generacion_id not in self._en_consulta:
+                self._en_consulta.add(generacion_id)
+                self._cola.put_nowait(generacion_id)
+
+    async def _refrescar(self):
+        """
+        Sincroniza la agenda con la DB: agrega canciones nuevas, quita las
+        finalizadas (p. ej. por webhook), resuelve las atascadas y relanza
+        las que un proceso devolvió a PENDIENTE al apagarse.
+        """
+        reanudadas = await reanudar_pendientes()
+        if reanudadas:
+            print(f"[MUSIC] {reanudadas} generaciones reanudadas tras un reinicio")
+
+        ahora = ahora_utc()
+        limite_descarga = ahora - timedelta(seconds=settings.DESCARGA_TIMEOUT_SEGUNDOS)
+
+        async with async_session_maker() as db:
+            # Descargas interrumpidas (proceso caído, sin heartbeat): volver a
+            # consultarlas. Una descarga en curso renueva su heartbeat y no se toca.
+            await db.execute(
+                update(MusicGeneration)
+                .where(
+                    MusicGeneration.estado == EstadoMusicGeneration.DESCARGANDO.value,
+                    or_(
+                        MusicGeneration.descarga_heartbeat_at < limite_descarga,
+                        # Filas de antes del heartbeat
+                        and_(
+                            MusicGeneration.descarga_heartbeat_at.is_(None),
+                            MusicGeneration.created_at < ahora - timedelta(seconds=settings.MUSICGPT_TIMEOUT_SEGUNDOS)
+                        )
+                    )
+                )
+                .values(estado=EstadoMusicGeneration.GENERANDO_MUSICA.value)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+            result = await db.execute(
+                select(
+                    MusicGeneration.id,
+                    MusicGeneration.estado,
+                    MusicGeneration.musicgpt_conversion_id,
+                    MusicGeneration.created_at
+                ).where(
+                    MusicGeneration.estado.in_([
+                        EstadoMusicGeneration.GENERANDO_PROMPT.value,
+                        EstadoMusicGeneration.GENERANDO_MUSICA.value
+                    ])
+                )
+            )
+            filas = result.all()
+
+        vigentes = set()
+        for generacion_id, estado, conversion_id, created_at in filas:
+            if generacion_id in self._por_finalizar:
+                continue
+            edad = (ahora - como_utc(created_at)).total_seconds() if created_at else 0.0
+
+            if not conversion_id:
+                # El proceso que iniciaba la canción murió antes de enviarla
+                if edad > settings.MUSICGPT_TIMEOUT_SEGUNDOS:
+                    self._finalizar(generacion_id, error="La generación no se pudo iniciar")
+                continue
+
+            vigentes.add(generacion_id)
+            if generacion_id not in self._agenda:
+                primera = (
+                    settings.MUSICGPT_GRACIA_SEGUNDOS if settings.MUSICGPT_WEBHOOK_SECRET
+                    else settings.MUSICGPT_POLL_PRIMERA_SEGUNDOS
+                )
+                self._agenda[generacion_id] = (
+                    conversion_id,
+                    time.monotonic() + max(0.0, primera - edad),
+                    self._intervalo_inicial()
+                )
+
+        for generacion_id in list(self._agenda):
+            if generacion_id not in vigentes:
+                del self._agenda[generacion_id]
+
+    def _intervalo_inicial(self) -> float:
+        # Con webhook el polling es solo respaldo: directo al intervalo máximo
+        if settings.MUSICGPT_WEBHOOK_SECRET:
+            return settings.MUSICGPT_POLL_INTERVALO_MAX
+        return settings.MUSICGPT_POLL_INTERVALO_MIN
+
+    # ---------- Consultas ----------
+
+    async def _consultor(self):
+        """Uno de N consumidores fijos: la cantidad de corrutinas no crece con las canciones"""
+        while True:
+            generacion_id = await self._cola.get()
+            try:
+                await self._consultar(generacion_id)
+            except Exception as e:
+                print(f"[MUSIC] Error consultando generación {generacion_id}: {e}")
+                self._reprogramar(generacion_id)
+            finally:
+                self._en_consulta.discard(generacion_id)
+
+    async def _consultar(self, generacion_id: int):
+        entrada = self._agenda.get(generacion_id)
+        if entrada is None:
+            return
+        conversion_id, _, _ = entrada
+
+        self.consultas += 1
+        resultado = await music_service.consultar_resultado(conversion_id)
+
+        if resultado["estado"] == "completado":
+            self._finalizar(
+                generacion_id,
+                audio_url=resultado["audio_url"],
+                audio_urls=resultado.get("audio_urls")
+            )
+        elif resultado["estado"] == "error":
+            self._finalizar(generacion_id, error=resultado["error"])
+        elif await self._vencida(generacion_id):
+            self._finalizar(generacion_id, error="Tiempo de espera agotado")
+        else:
+            self._reprogramar(generacion_id)
+
+    def _reprogramar(self, generacion_id: int):
+        """Siguiente consulta con intervalo creciente (hasta el máximo)"""
+        entrada = self._agenda.get(generacion_id)
+        if entrada is None:
+            return
+        conversion_id, _, intervalo = entrada
+        self._agenda[generacion_id] = (
+            conversion_id,
+            time.monotonic() + intervalo,
+            min(settings.MUSICGPT_POLL_INTERVALO_MAX, intervalo * FACTOR_INTERVALO)
+        )
+
+    async def _vencida(self, generacion_id: int) -> bool:
+        async with async_session_maker() as db:
+            generacion = await db.get(MusicGeneration, generacion_id)
+        if not generacion or not generacion.created_at:
+            return False
+        edad = (ahora_utc() - como_utc(generacion.created_at)).total_seconds()
+        return edad > settings.MUSICGPT_TIMEOUT_SEGUNDOS
+
+    def _finalizar(self, generacion_id: int, **kwargs):
+        """La descarga corre en el supervisor: los consultores siguen consultando"""
+        self._agenda.pop(generacion_id, None)
+        self._por_finalizar.add(generacion_id)
+        lanzar_finalizacion(
+            generacion_id,
+            al_terminar=lambda: self._por_finalizar.discard(generacion_id),
+            **kwargs
+        )
+        self.finalizadas += 1
+
+    def estadisticas(self) -> dict:
+        """Estado del planificador en este proceso"""
+        return {
+            "id": self.id,
+            "es_lider": self.es_lider,
+            "canciones_en_agenda": len(self._agenda),
+            "consultas_en_curso": len(self._en_consulta),
+            "finalizaciones_en_cola": len(self._por_finalizar),
+            "consultas": self.consultas,
+            "finalizadas": self.finalizadas
+        }
+
+
+# Instancia global del planificador
+planificador_musica = PlanificadorMusica()
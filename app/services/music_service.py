@@ -3,13 +3,13 @@ Servicio de generación de música con IA usando OpenAI (prompts) y MusicGPT (m
 """
 import os
 import json
-import httpx
-import asyncio
-from datetime import datetime
-from typing import Optional, Dict, Any
-from pathlib import Path
+from typing import Callable, Optional, Dict, Any, List, Tuple
 
 from app.core.config import settings
+from app.services.http_clients import ClientesUpstream, obtener_cliente
+from app.services.resilience import PresupuestoReintentos, llamar_con_reintentos
+from app.services.admission import limitador
+from app.services.descargas import descargar_varios
 
 
 class MusicService:
@@ -20,6 +20,11 @@ class MusicService:
         self.musicgpt_key = settings.MUSICGPT_API_KEY
         self.musicgpt_url = settings.MUSICGPT_API_URL
         self.openai_model = settings.OPENAI_MODEL
+        self.clientes: Optional[ClientesUpstream] = None
+
+    def usar_clientes(self, clientes: ClientesUpstream):
+        """Inyecta el pool de clientes HTTP compartido"""
+        self.clientes = clientes
 
     async def generar_prompt_musical(
         self,
@@ -97,22 +102,23 @@ OUTPUT JSON:
         }
 
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers=headers,
-                    json=payload
-                )
+            client = obtener_cliente("openai", self.clientes)
+            response = await llamar_con_reintentos("openai", lambda: client.post(
+                "https://api.openai.com/v1/chat/completions",
+                headers=headers,
+                json=payload,
+                timeout=30
+            ))
 
-                if response.status_code == 200:
-                    content = response.json()['choices'][0]['message']['content']
-                    data = json.loads(content)
+            if response.status_code == 200:
+                content = response.json()['choices'][0]['message']['content']
+                data = json.loads(content)
 
-                    # Truncar prompt si es necesario
-                    if len(data.get("music_prompt", "")) > 300:
-                        data["music_prompt"] = data["music_prompt"][:297] + "..."
+                # Truncar prompt si es necesario
+                if len(data.get("music_prompt", "")) > 300:
+                    data["music_prompt"] = data["music_prompt"][:297] + "..."
 
-                    return data
+                return data
 
         except Exception as e:
             print(f"[MUSIC] Error OpenAI: {e}")
@@ -131,10 +137,12 @@ OUTPUT JSON:
         prompt: str,
         music_style: str = "Commercial Jingle, Latin Pop",
         es_instrumental: bool = False,
-        duracion: int = 30
+        duracion: int = 30,
+        webhook_url: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Genera música usando MusicGPT API.
+        Con webhook_url, MusicGPT avisa al terminar y no hace falta polling.
 
         Retorna:
         {
@@ -150,14 +158,8 @@ OUTPUT JSON:
         if len(prompt) > 300:
             prompt = prompt[:297] + "..."
 
-        # Asegurar formato del header
-        if self.musicgpt_key.startswith("Bearer"):
-            auth_header = self.musicgpt_key
-        else:
-            auth_header = f"Bearer {self.musicgpt_key}"
-
         headers = {
-            "Authorization": auth_header,
+            "Authorization": self._auth_header(),
             "Content-Type": "application/json"
         }
 
@@ -166,151 +168,117 @@ OUTPUT JSON:
             "music_style": music_style,
             "make_instrumental": es_instrumental
         }
+        if webhook_url:
+            payload["webhook_url"] = webhook_url
 
         try:
-            async with httpx.AsyncClient(timeout=60) as client:
-                response = await client.post(
+            client = obtener_cliente("musicgpt", self.clientes)
+            # Crear la canción no es idempotente: solo se reintenta si no se procesó
+            async with limitador.por_intento("musicgpt") as permiso:
+                response = await llamar_con_reintentos("musicgpt", lambda: client.post(
                     f"{self.musicgpt_url}/MusicAI",
                     headers=headers,
                     json=payload
-                )
-
-                if response.status_code != 200:
-                    return {
-                        "exito": False,
-                        "error": f"Error API código {response.status_code}: {response.text}"
-                    }
+                ), idempotente=False, permiso=permiso)
 
-                data = response.json()
+            if response.status_code != 200:
+                return {
+                    "exito": False,
+                    "error": f"Error API código {response.status_code}: {response.text}"
+                }
 
-                if not data.get("success"):
-                    return {
-                        "exito": False,
-                        "error": f"API respondió success=False: {data}"
-                    }
+            data = response.json()
 
-                conversion_id = data.get("conversion_id") or data.get("conversion_id_1")
-                if not conversion_id:
-                    return {
-                        "exito": False,
-                        "error": "No se recibió conversion_id"
-                    }
+            if not data.get("success"):
+                return {
+                    "exito": False,
+                    "error": f"API respondió success=False: {data}"
+                }
 
+            conversion_id = data.get("conversion_id") or data.get("conversion_id_1")
+            if not conversion_id:
                 return {
-                    "exito": True,
-                    "conversion_id": conversion_id
+                    "exito": False,
+                    "error": "No se recibió conversion_id"
                 }
 
+            return {
+                "exito": True,
+                "conversion_id": conversion_id
+            }
+
         except Exception as e:
             return {"exito": False, "error": str(e)}
 
-    async def poll_resultado(
-        self,
-        conversion_id: str,
-        max_intentos: int = 60,
-        delay: float = 2.0
-    ) -> Dict[str, Any]:
+    def _auth_header(self) -> str:
+        """Header Authorization de MusicGPT"""
+        if self.musicgpt_key.startswith("Bearer"):
+            return self.musicgpt_key
+        return f"Bearer {self.musicgpt_key}"
+
+    async def consultar_resultado(self, conversion_id: str) -> Dict[str, Any]:
         """
-        Hace polling para obtener el resultado de MusicGPT.
+        Consulta una sola vez el estado de una conversión en MusicGPT.
 
         Retorna:
         {
-            "exito": bool,
-            "audio_url": str,
-            "error": str (si hay error)
+            "estado": "completado" | "error" | "pendiente",
+            "audio_url": str (si completó),
+            "error": str (si falló)
         }
         """
-        if self.musicgpt_key.startswith("Bearer"):
-            auth_header = self.musicgpt_key
-        else:
-            auth_header = f"Bearer {self.musicgpt_key}"
-
-        headers = {"Authorization": auth_header}
-
-        for i in range(1, max_intentos + 1):
-            try:
-                async with httpx.AsyncClient(timeout=30) as client:
-                    response = await client.get(
-                        f"{self.musicgpt_url}/byId",
-                        headers=headers,
-                        params={
-                            "conversionType": "MUSIC_AI",
-                            "conversion_id": conversion_id
-                        }
-                    )
-
-                    if response.status_code == 200:
-                        data = response.json()
-                        conversion = data.get("conversion") or {}
-                        status = conversion.get("status") or conversion.get("message")
-
-                        if status in ("COMPLETED", "success"):
-                            # Intentar obtener URL de varias formas
-                            audio_url = conversion.get("audio_url")
-                            path = conversion.get("conversion_path_1") or conversion.get("conversion_path_2")
-
-                            if audio_url:
-                                return {"exito": True, "audio_url": audio_url}
-                            if path:
-                                url = path if path.startswith("http") else f"https://lalals.s3.amazonaws.com/{path.lstrip('/')}"
-                                return {"exito": True, "audio_url": url}
-
-                        if status in ("FAILED", "ERROR"):
-                            return {
-                                "exito": False,
-                                "error": f"Generación falló en el servidor: {conversion}"
-                            }
-
-            except Exception as e:
-                print(f"[MUSIC] Error en poll: {e}")
-
-            await asyncio.sleep(delay)
-
-        return {"exito": False, "error": "Tiempo de espera agotado"}
-
-    async def descargar_audio(self, audio_url: str, output_path: str) -> bool:
-        """Descarga el archivo de audio."""
-        try:
-            async with httpx.AsyncClient(timeout=60) as client:
-                response = await client.get(audio_url)
-                if response.status_code == 200:
-                    # Asegurar que el directorio existe
-                    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-
-                    with open(output_path, "wb") as f:
-                        f.write(response.content)
-                    return True
-        except Exception as e:
-            print(f"[MUSIC] Error descargando audio: {e}")
-        return False
+        client = obtener_cliente("musicgpt", self.clientes)
+        # El llamador decide cuándo volver a consultar: sin reintentos extra
+        response = await llamar_con_reintentos("musicgpt", lambda: client.get(
+            f"{self.musicgpt_url}/byId",
+            headers={"Authorization": self._auth_header()},
+            params={
+                "conversionType": "MUSIC_AI",
+                "conversion_id": conversion_id
+            },
+            timeout=30
+        ), PresupuestoReintentos(max_reintentos=0))
+
+        if response.status_code != 200:
+            return {"estado": "pendiente"}
+
+        return interpretar_conversion(response.json().get("conversion") or {})
+
+    async def descargar_variantes(self, destinos: List[Tuple[str, str]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Descarga en paralelo las variantes de una canción [(url, ruta), ...].
+        Retorna un resultado por variante (None si esa falló).
+        """
+        client = obtener_cliente("descargas", self.clientes)
+        return await descargar_varios(client, destinos)
 
-    async def generar_cancion_completa(
+    async def iniciar_cancion(
         self,
-        titulo: str,
         descripcion: str,
         duracion: int = 30,
         genero: Optional[str] = None,
         mood: Optional[str] = None,
-        es_instrumental: bool = False
+        es_instrumental: bool = False,
+        webhook_url: Optional[str] = None,
+        al_enviar: Optional[Callable[[], None]] = None
     ) -> Dict[str, Any]:
         """
-        Flujo completo: genera prompt con OpenAI y música con MusicGPT.
+        Genera el prompt con OpenAI y solicita la canción a MusicGPT,
+        sin esperar el resultado. al_enviar() se llama justo antes de
+        solicitarla a MusicGPT (después del prompt).
 
         Retorna:
         {
             "exito": bool,
-            "audio_url": str,
+            "conversion_id": str,
             "prompt_usado": str,
             "music_style": str,
             "mood": str,
             "genre": str,
             "lyrics_theme": str,
-            "tiempo_ms": int,
             "error": str (si hay error)
         }
         """
-        inicio = datetime.now()
-
         try:
             # 1. Generar prompt con OpenAI
             prompt_data = await self.generar_prompt_musical(
@@ -328,11 +296,14 @@ OUTPUT JSON:
                 return {"exito": False, "error": "No se pudo generar prompt musical"}
 
             # 2. Solicitar generación a MusicGPT
+            if al_enviar:
+                al_enviar()
             gen_result = await self.generar_musica(
                 prompt=music_prompt,
                 music_style=music_style,
                 es_instrumental=es_instrumental,
-                duracion=duracion
+                duracion=duracion,
+                webhook_url=webhook_url
             )
 
             if not gen_result.get("exito"):
@@ -342,36 +313,52 @@ OUTPUT JSON:
                     "prompt_usado": music_prompt
                 }
 
-            conversion_id = gen_result.get("conversion_id")
-
-            # 3. Esperar resultado (polling)
-            poll_result = await self.poll_resultado(conversion_id)
-
-            if not poll_result.get("exito"):
-                return {
-                    "exito": False,
-                    "error": poll_result.get("error", "Error en polling"),
-                    "prompt_usado": music_prompt,
-                    "conversion_id": conversion_id
-                }
-
-            tiempo_ms = int((datetime.now() - inicio).total_seconds() * 1000)
-
             return {
                 "exito": True,
-                "audio_url": poll_result.get("audio_url"),
-                "conversion_id": conversion_id,
+                "conversion_id": gen_result.get("conversion_id"),
                 "prompt_usado": music_prompt,
                 "music_style": music_style,
                 "mood": prompt_data.get("mood", ""),
                 "genre": prompt_data.get("genre", ""),
-                "lyrics_theme": prompt_data.get("lyrics_theme", ""),
-                "tiempo_ms": tiempo_ms
+                "lyrics_theme": prompt_data.get("lyrics_theme", "")
             }
 
         except Exception as e:
             return {"exito": False, "error": str(e)}
 
 
+def interpretar_conversion(conversion: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Interpreta una conversión de MusicGPT (respuesta de /byId o cuerpo del
+    webhook). Retorna {"estado": "completado"|"error"|"pendiente", ...}.
+    """
+    status = conversion.get("status") or conversion.get("message")
+
+    if status in ("FAILED", "ERROR"):
+        return {"estado": "error", "error": f"Generación falló en el servidor: {conversion}"}
+
+    # Intentar obtener URL de varias formas
+    audio_url = conversion.get("audio_url")
+    path = conversion.get("conversion_path_1") or conversion.get("conversion_path_2") or conversion.get("conversion_path")
+
+    if status in ("COMPLETED", "success") or conversion.get("success") is True:
+        # MusicGPT genera dos variantes de cada canción
+        variantes = [
+            _url_audio(p) for p in (conversion.get("conversion_path_1"), conversion.get("conversion_path_2")) if p
+        ]
+        if audio_url:
+            return {"estado": "completado", "audio_url": audio_url, "audio_urls": variantes or [audio_url]}
+        if path:
+            url = _url_audio(path)
+            return {"estado": "completado", "audio_url": url, "audio_urls": variantes or [url]}
+
+    return {"estado": "pendiente"}
+
+
+def _url_audio(path: str) -> str:
+    """URL absoluta de un archivo generado por MusicGPT"""
+    return path if path.startswith("http") else f"https://lalals.s3.amazonaws.com/{path.lstrip('/')}"
+
+
 # Instancia global del servicio
 music_service = MusicService()
@@ -0,0 +1,203 @@
+"""
+Caché por contenido de las respuestas de OpenAI (análisis del producto + copy)
+
+Dos niveles:
+- Memoria: LRU por proceso (OrderedDict)
+- Disco: SQLite compartido entre procesos, con TTL y desalojo por tamaño
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+
+
+def clave_cache(
+    imagen: bytes,
+    estilo_id: str,
+    nombre_producto: str,
+    descripcion_producto: str,
+    marca: str,
+    precio: str,
+    tiene_logo: bool,
+    prompt: str,
+    modelo: str
+) -> str:
+    """
+    Clave SHA-256 del contenido: imagen, estilo, campos del producto y logo.
+    Incluye modelo y prompt para invalidar al cambiar cualquiera de los dos.
+    """
+    h = hashlib.sha256()
+    h.update(hashlib.sha256(imagen).digest())
+    for parte in (estilo_id, nombre_producto, descripcion_producto, marca, precio,
+                  "logo" if tiene_logo else "sin_logo", modelo):
+        h.update(b"\x00")
+        h.update((parte or "").encode("utf-8"))
+    h.update(b"\x00")
+    h.update(hashlib.sha256(prompt.encode("utf-8")).digest())
+    return h.hexdigest()
+
+
+class CacheOpenAI:
+    """Caché LRU en memoria respaldada por SQLite"""
+
+    def __init__(
+        self,
+        ruta: str,
+        max_entradas_memoria: int,
+        ttl_segundos: int,
+        max_bytes_disco: int
+    ):
+        self.ruta = ruta
+        self.max_entradas_memoria = max_entradas_memoria
+        self.ttl_segundos = ttl_segundos
+        self.max_bytes_disco = max_bytes_disco
+
+        self._memoria: "OrderedDict[str, tuple]" = OrderedDict()  # clave -> (expira, datos)
+        self._inicializada = False
+
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.escrituras = 0
+        self.desalojos = 0
+
+    # ---------- API pública ----------
+
+    async def obtener(self, clave: str) -> Optional[dict]:
+        """Busca en memoria y luego en disco. None si no existe o expiró."""
+        ahora = time.time()
+
+        entrada = self._memoria.get(clave)
+        if entrada:
+            expira, datos = entrada
+            if expira > ahora:
+                self._memoria.move_to_end(clave)
+                self.hits_memoria += 1
+                return datos
+            del self._memoria[clave]
+
+        datos = await asyncio.to_thread(self._leer_disco, clave, ahora)
+        if datos is not None:
+            self.hits_disco += 1
+            self._guardar_memoria(clave, datos, ahora)
+            return datos
+
+        self.misses += 1
+        return None
+
+    async def guardar(self, clave: str, datos: dict):
+        """Guarda en ambos niveles"""
+        ahora = time.time()
+        self._guardar_memoria(clave, datos, ahora)
+        await asyncio.to_thread(self._escribir_disco, clave, datos, ahora)
+        self.escrituras += 1
+
+    def estadisticas(self) -> dict:
+        """Contadores de uso de la caché (por proceso)"""
+        consultas = self.hits_memoria + self.hits_disco + self.misses
+        return {
+            "hits_memoria": self.hits_memoria,
+            "hits_disco": self.hits_disco,
+            "misses": self.misses,
+            "tasa_hit": round((self.hits_memoria + self.hits_disco) / consultas * 100, 1) if consultas else 0.0,
+            "escrituras": self.escrituras,
+            "desalojos": self.desalojos,
+            "entradas_memoria": len(self._memoria)
+        }
+
+    # ---------- Nivel memoria ----------
+
+    def _guardar_memoria(self, clave: str, datos: dict, ahora: float):
+        self._memoria[clave] = (ahora + self.ttl_segundos, datos)
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_entradas_memoria:
+            self._memoria.popitem(last=False)
+
+    # ---------- Nivel disco (se ejecuta en un thread) ----------
+
+    def _conectar(self) -> sqlite3.Connection:
+        if not self._inicializada:
+            Path(self.ruta).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.ruta, timeout=5.0)
+        if not self._inicializada:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS cache_openai (
+                    clave TEXT PRIMARY KEY,
+                    valor TEXT NOT NULL,
+                    tamano INTEGER NOT NULL,
+                    expira REAL NOT NULL,
+                    accedido REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_openai_accedido ON cache_openai (accedido)")
+            self._inicializada = True
+        return conn
+
+    def _leer_disco(self, clave: str, ahora: float) -> Optional[dict]:
+        conn = self._conectar()
+        try:
+            fila = conn.execute(
+                "SELECT valor, expira FROM cache_openai WHERE clave = ?", (clave,)
+            ).fetchone()
+            if not fila:
+                return None
+            valor, expira = fila
+            if expira <= ahora:
+                conn.execute("DELETE FROM cache_openai WHERE clave = ?", (clave,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE cache_openai SET accedido = ? WHERE clave = ?", (ahora, clave))
+            conn.commit()
+            return json.loads(valor)
+        finally:
+            conn.close()
+
+    def _escribir_disco(self, clave: str, datos: dict, ahora: float):
+        valor = json.dumps(datos, ensure_ascii=False)
+        conn = self._conectar()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_openai (clave, valor, tamano, expira, accedido) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (clave, valor, len(valor), ahora + self.ttl_segundos, ahora)
+            )
+            self._desalojar(conn, ahora)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _desalojar(self, conn: sqlite3.Connection, ahora: float):
+        """Elimina expirados y, si se supera el tamaño máximo, los menos usados"""
+        cursor = conn.execute("DELETE FROM cache_openai WHERE expira <= ?", (ahora,))
+        self.desalojos += cursor.rowcount
+
+        total = conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM cache_openai").fetchone()[0]
+        if total <= self.max_bytes_disco:
+            return
+
+        exceso = total - self.max_bytes_disco
+        liberado = 0
+        claves = []
+        for clave, tamano in conn.execute("SELECT clave, tamano FROM cache_openai ORDER BY accedido"):
+            claves.append((clave,))
+            liberado += tamano
+            if liberado >= exceso:
+                break
+        conn.executemany("DELETE FROM cache_openai WHERE clave = ?", claves)
+        self.desalojos += len(claves)
+
+
+# Instancia global de la caché
+cache_openai = CacheOpenAI(
+    ruta=settings.OPENAI_CACHE_PATH,
+    max_entradas_memoria=settings.OPENAI_CACHE_MAX_ENTRADAS_MEMORIA,
+    ttl_segundos=settings.OPENAI_CACHE_TTL_SEGUNDOS,
+    max_bytes_disco=settings.OPENAI_CACHE_MAX_MB_DISCO * 1024 * 1024
+)
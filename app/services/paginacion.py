@@ -0,0 +1,78 @@
+"""
+Paginación por cursor (keyset) para los historiales
+
+OFFSET obliga a la base a recorrer y descartar todas las filas anteriores:
+la página 500 de un usuario con miles de generaciones cuesta 500 veces la
+primera. Con keyset cada página continúa después de la última fila vista,
+(created_at, id) en orden descendente, y usa el índice (user_id,
+created_at): el costo es el mismo en cualquier página.
+
+El cursor es opaco para el cliente (base64 de la fecha y el id).
+"""
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import Select, desc, func, literal, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import ES_SQLITE
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido no se pudo decodificar"""
+    pass
+
+
+def codificar_cursor(created_at: datetime, id: int) -> str:
+    valor = f"{created_at.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(valor.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        fecha, id = base64.urlsafe_b64decode(cursor + relleno).decode("utf-8").rsplit("|", 1)
+        return datetime.fromisoformat(fecha), int(id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise CursorInvalido("Cursor de paginación inválido") from e
+
+
+def _fecha_comparable(fecha: datetime):
+    """
+    SQLite guarda las fechas como texto y las compara como texto: created_at
+    viene de CURRENT_TIMESTAMP ("YYYY-MM-DD HH:MM:SS", sin microsegundos),
+    mientras que SQLAlchemy enlaza "YYYY-MM-DD HH:MM:SS.ffffff". Para que la
+    igualdad funcione se enlaza el texto en el mismo formato guardado.
+    """
+    if not ES_SQLITE:
+        return fecha
+    formato = "%Y-%m-%d %H:%M:%S.%f" if fecha.microsecond else "%Y-%m-%d %H:%M:%S"
+    return literal(fecha.strftime(formato))
+
+
+def paginar(query: Select, modelo, cursor: Optional[str], limite: int) -> Select:
+    """
+    Aplica orden (created_at, id) descendente, el cursor y limite + 1
+    (la fila extra indica si hay otra página).
+    """
+    if cursor:
+        fecha, id = decodificar_cursor(cursor)
+        query = query.where(
+            tuple_(modelo.created_at, modelo.id) < tuple_(_fecha_comparable(fecha), id)
+        )
+    return query.order_by(desc(modelo.created_at), desc(modelo.id)).limit(limite + 1)
+
+
+def recortar_pagina(filas: List[Any], limite: int) -> Tuple[List[Any], Optional[str]]:
+    """(filas de la página, next_cursor o None si es la última)"""
+    if len(filas) <= limite:
+        return filas, None
+    filas = filas[:limite]
+    ultima = filas[-1]
+    return filas, codificar_cursor(ultima.created_at, ultima.id)
+
+
+async def contar(db: AsyncSession, modelo, *condiciones) -> int:
+    """COUNT(*) con las mismas condiciones (lo resuelve el índice, sin leer filas)"""
+    return await db.scalar(select(func.count()).select_from(modelo).where(*condiciones)) or 0
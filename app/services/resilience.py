@@ -0,0 +1,269 @@
+"""
+Reintentos con backoff y circuit breaker para los proveedores de IA
+
+- Reintenta errores transitorios (429, 5xx, errores de red) con backoff
+  exponencial con jitter, respetando Retry-After.
+- Un presupuesto por solicitud limita cuántos reintentos y cuánto tiempo
+  puede consumir una generación completa (prompt + copy + imagen).
+- Un circuit breaker por proveedor falla rápido mientras el proveedor está
+  caído en lugar de acumular llamadas que van a terminar en timeout.
+
+El estado de los circuitos es por proceso (cada worker tiene el suyo).
+"""
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.http_clients import PROVEEDORES
+
+
+# Códigos que se consideran transitorios
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+# Para llamadas no idempotentes (p. ej. crear una canción) solo se reintenta
+# cuando es seguro que el proveedor no procesó la petición
+ESTADOS_REINTENTABLES_NO_IDEMPOTENTE = {429, 503}
+
+
+class CircuitoAbiertoError(Exception):
+    """El proveedor está marcado como caído; no se intenta la llamada"""
+
+    def __init__(self, proveedor: str, reintentar_en: float):
+        self.proveedor = proveedor
+        self.reintentar_en = reintentar_en
+        super().__init__(
+            f"{proveedor} no está disponible temporalmente "
+            f"(reintentar en {int(reintentar_en) + 1}s)"
+        )
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker clásico de tres estados:
+    - cerrado: las llamadas pasan; N fallos consecutivos lo abren
+    - abierto: las llamadas fallan de inmediato durante segundos_abierto
+    - semiabierto: pasa una sola llamada de prueba; si funciona se cierra
+    """
+
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+    def __init__(self, nombre: str, umbral_fallos: int, segundos_abierto: float):
+        self.nombre = nombre
+        self.umbral_fallos = umbral_fallos
+        self.segundos_abierto = segundos_abierto
+
+        self.estado = self.CERRADO
+        self.fallos_consecutivos = 0
+        self._abierto_desde = 0.0
+        self._prueba_desde: Optional[float] = None
+
+        self.aperturas = 0
+        self.rechazadas = 0
+
+    def verificar(self):
+        """Lanza CircuitoAbiertoError si la llamada no debe intentarse"""
+        ahora = time.monotonic()
+
+        if self.estado == self.ABIERTO:
+            restante = self._abierto_desde + self.segundos_abierto - ahora
+            if restante > 0:
+                self.rechazadas += 1
+                raise CircuitoAbiertoError(self.nombre, restante)
+            self.estado = self.SEMIABIERTO
+            self._prueba_desde = None
+
+        if self.estado == self.SEMIABIERTO:
+            # Una sola prueba a la vez; si la prueba nunca reporta
+            # (cancelada), se permite otra pasado segundos_abierto
+            if self._prueba_desde is not None and ahora - self._prueba_desde < self.segundos_abierto:
+                self.rechazadas += 1
+                raise CircuitoAbiertoError(self.nombre, self.segundos_abierto - (ahora - self._prueba_desde))
+            self._prueba_desde = ahora
+
+    def registrar_exito(self):
+        if self.estado != self.CERRADO:
+            print(f"[RESILIENCIA] Circuito de {self.nombre} cerrado")
+        self.estado = self.CERRADO
+        self.fallos_consecutivos = 0
+        self._prueba_desde = None
+
+    def registrar_fallo(self):
+        self.fallos_consecutivos += 1
+        if self.estado == self.SEMIABIERTO or self.fallos_consecutivos >= self.umbral_fallos:
+            if self.estado != self.ABIERTO:
+                self.aperturas += 1
+                print(f"[RESILIENCIA] Circuito de {self.nombre} abierto tras {self.fallos_consecutivos} fallos")
+            self.estado = self.ABIERTO
+            self._abierto_desde = time.monotonic()
+            self._prueba_desde = None
+
+    def metricas(self) -> dict:
+        restante = 0.0
+        if self.estado == self.ABIERTO:
+            restante = max(0.0, self._abierto_desde + self.segundos_abierto - time.monotonic())
+        return {
+            "estado": self.estado,
+            "fallos_consecutivos": self.fallos_consecutivos,
+            "aperturas": self.aperturas,
+            "rechazadas": self.rechazadas,
+            "segundos_para_prueba": round(restante, 1)
+        }
+
+
+class PresupuestoReintentos:
+    """
+    Límite de reintentos de una solicitud completa.
+    Se comparte entre todas las llamadas de una generación para que los
+    reintentos de una etapa no multipliquen la latencia total.
+    """
+
+    def __init__(
+        self,
+        max_reintentos: Optional[int] = None,
+        max_segundos: Optional[float] = None
+    ):
+        self.max_reintentos = settings.REINTENTOS_MAX if max_reintentos is None else max_reintentos
+        self.max_segundos = settings.REINTENTOS_PRESUPUESTO_SEGUNDOS if max_segundos is None else max_segundos
+        self.reintentos = 0
+        self._inicio = time.monotonic()
+
+    def consumir(self, espera: float) -> bool:
+        """Reserva un reintento tras `espera` segundos. False si no alcanza."""
+        transcurrido = time.monotonic() - self._inicio
+        if self.reintentos >= self.max_reintentos or transcurrido + espera > self.max_segundos:
+            return False
+        self.reintentos += 1
+        return True
+
+
+# Un circuito por proveedor
+circuitos: Dict[str, CircuitBreaker] = {
+    nombre: CircuitBreaker(
+        nombre,
+        umbral_fallos=settings.CIRCUITO_UMBRAL_FALLOS,
+        segundos_abierto=settings.CIRCUITO_SEGUNDOS_ABIERTO
+    )
+    for nombre in PROVEEDORES
+}
+
+# Reintentos efectuados por proveedor (por proceso)
+_reintentos: Dict[str, int] = {nombre: 0 for nombre in PROVEEDORES}
+
+
+def estado_circuitos() -> dict:
+    """Estado de los circuitos y reintentos por proveedor (para monitoreo)"""
+    return {
+        nombre: {**circuito.metricas(), "reintentos": _reintentos[nombre]}
+        for nombre, circuito in circuitos.items()
+    }
+
+
+def segundos_retry_after(response: httpx.Response) -> Optional[float]:
+    """Lee Retry-After en segundos o como fecha HTTP. None si no viene."""
+    valor = response.headers.get("retry-after")
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def calcular_espera(intento: int, response: Optional[httpx.Response] = None) -> float:
+    """Backoff exponencial con jitter completo; Retry-After tiene prioridad"""
+    tope = settings.REINTENTO_MAX_ESPERA_SEGUNDOS
+    if response is not None:
+        retry_after = segundos_retry_after(response)
+        if retry_after is not None:
+            return min(tope, retry_after + random.uniform(0, settings.REINTENTO_BASE_SEGUNDOS))
+    return random.uniform(0, min(tope, settings.REINTENTO_BASE_SEGUNDOS * (2 ** intento)))
+
+
+def _es_reintentable(
+    response: Optional[httpx.Response],
+    error: Optional[Exception],
+    idempotente: bool
+) -> bool:
+    if response is not None:
+        estados = ESTADOS_REINTENTABLES if idempotente else ESTADOS_REINTENTABLES_NO_IDEMPOTENTE
+        return response.status_code in estados
+    if idempotente:
+        return isinstance(error, httpx.TransportError)
+    # Sin idempotencia: solo si la conexión nunca se estableció
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout))
+
+
+async def llamar_con_reintentos(
+    proveedor: str,
+    hacer_peticion: Callable[[], Awaitable[httpx.Response]],
+    presupuesto: Optional[PresupuestoReintentos] = None,
+    idempotente: bool = True,
+    permiso=None
+) -> httpx.Response:
+    """
+    Ejecuta hacer_peticion() con reintentos y circuit breaker.
+
+    hacer_peticion debe crear la petición desde cero en cada llamada
+    (p. ej. volver a llamar a la fábrica del cuerpo en streaming).
+
+    permiso (limitador.por_intento) se toma antes de cada intento y se
+    suelta antes de dormir el backoff; el de la respuesta retornada lo
+    suelta el llamador al salir de su bloque.
+
+    Retorna la última respuesta (el llamador revisa el status como siempre).
+    Lanza CircuitoAbiertoError si el proveedor está caído, o el último error
+    de red si se agotan los reintentos.
+    """
+    circuito = circuitos[proveedor]
+    if presupuesto is None:
+        presupuesto = PresupuestoReintentos()
+
+    intento = 0
+    while True:
+        circuito.verificar()
+        if permiso is not None:
+            await permiso.tomar()
+
+        response: Optional[httpx.Response] = None
+        error: Optional[Exception] = None
+        try:
+            response = await hacer_peticion()
+        except httpx.TransportError as e:
+            error = e
+
+        if response is not None and response.status_code not in ESTADOS_REINTENTABLES:
+            # Un 4xx es error del llamador, no del proveedor
+            circuito.registrar_exito()
+            return response
+
+        circuito.registrar_fallo()
+
+        espera = calcular_espera(intento, response)
+        if not _es_reintentable(response, error, idempotente) or not presupuesto.consumir(espera):
+            if response is not None:
+                return response
+            if permiso is not None:
+                await permiso.soltar()
+            raise error
+
+        motivo = f"HTTP {response.status_code}" if response is not None else type(error).__name__
+        print(f"[RESILIENCIA] {proveedor}: {motivo}, reintento {intento + 1} en {espera:.1f}s")
+        _reintentos[proveedor] += 1
+
+        if response is not None:
+            await response.aclose()
+        if permiso is not None:
+            await permiso.soltar()
+        await asyncio.sleep(espera)
+        intento += 1
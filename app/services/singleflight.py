@@ -0,0 +1,131 @@
+"""
+Singleflight de solicitudes de generación
+
+Doble clic o reintentos del cliente con el mismo contenido no deben lanzar
+otra generación ni cobrar otro crédito. Cada solicitud se identifica por
+usuario + contenido normalizado; mientras la generación original siga en
+curso (o haya terminado bien hace poco) los duplicados se enlazan a ella.
+
+La tabla solicitudes_en_vuelo se escribe en la misma transacción que crea
+la generación y cobra el crédito: si dos workers reciben el duplicado al
+mismo tiempo, la clave primaria deja pasar solo a uno.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import ahora_utc, como_utc
+from app.models.generation import Generation, EstadoGeneracion
+from app.models.music_generation import MusicGeneration, EstadoMusicGeneration
+from app.models.singleflight import SolicitudEnVuelo
+
+
+TIPO_IMAGEN = "imagen"
+TIPO_MUSICA = "musica"
+
+# tipo -> (modelo, estados en curso, estado completado)
+_GENERACIONES = {
+    TIPO_IMAGEN: (
+        Generation,
+        {EstadoGeneracion.PENDIENTE.value, EstadoGeneracion.PROCESANDO.value},
+        EstadoGeneracion.COMPLETADA.value
+    ),
+    TIPO_MUSICA: (
+        MusicGeneration,
+        {
+            EstadoMusicGeneration.PENDIENTE.value,
+            EstadoMusicGeneration.GENERANDO_PROMPT.value,
+            EstadoMusicGeneration.GENERANDO_MUSICA.value,
+            EstadoMusicGeneration.DESCARGANDO.value
+        },
+        EstadoMusicGeneration.COMPLETADA.value
+    ),
+}
+
+# Registros más viejos que esto ya no pueden estar en curso
+_RETENCION = timedelta(hours=1)
+
+
+def _normalizar(valor: Any) -> Any:
+    """Texto sin mayúsculas ni espacios de más; el resto tal cual"""
+    if isinstance(valor, str):
+        return " ".join(valor.split()).casefold()
+    return valor
+
+
+def clave_solicitud(user_id: int, tipo: str, contenido: Dict[str, Any]) -> str:
+    """Clave estable de una solicitud: usuario + tipo + contenido normalizado"""
+    datos = {k: _normalizar(v) for k, v in contenido.items()}
+    serializado = json.dumps([user_id, tipo, datos], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+
+async def buscar_en_vuelo(db: AsyncSession, clave: str) -> Optional[int]:
+    """
+    Id de la generación que ya atiende esta solicitud, o None si hay que
+    crear una nueva. Las que terminaron con error (crédito devuelto) o
+    fuera de la ventana no cuentan: el usuario puede reintentar.
+    """
+    solicitud = await db.get(SolicitudEnVuelo, clave)
+    if solicitud is None:
+        return None
+
+    modelo, en_curso, completada = _GENERACIONES[solicitud.tipo]
+    result = await db.execute(
+        select(modelo.estado, modelo.completed_at).where(modelo.id == solicitud.objeto_id)
+    )
+    fila = result.first()
+    estado, completed_at = fila if fila else (None, None)
+
+    if estado in en_curso:
+        return solicitud.objeto_id
+    if estado == completada and completed_at:
+        # Un reintento poco después de terminar recibe el mismo resultado
+        ventana = timedelta(seconds=settings.SINGLEFLIGHT_VENTANA_SEGUNDOS)
+        if como_utc(completed_at) + ventana > ahora_utc():
+            return solicitud.objeto_id
+
+    # La clave se libera al registrar la nueva generación (purgar_en_vuelo),
+    # sin escribir aquí: la transacción de escritura empieza después de
+    # guardar los uploads
+    db.expunge(solicitud)
+    return None
+
+
+def registrar_en_vuelo(db: AsyncSession, clave: str, user_id: int, tipo: str, objeto_id: int):
+    """
+    Reserva la clave para la generación recién creada.
+    No hace commit: un duplicado concurrente falla con IntegrityError
+    al confirmar y no se cobra.
+    """
+    db.add(SolicitudEnVuelo(clave=clave, user_id=user_id, tipo=tipo, objeto_id=objeto_id))
+
+
+async def purgar_en_vuelo(db: AsyncSession, user_id: int, clave: str, tipo: str):
+    """
+    Borra los registros viejos del usuario y el de `clave` si su generación
+    ya no está en curso (sin commit). Va justo antes de registrar_en_vuelo;
+    si otra solicitud registró la clave mientras tanto, su generación está
+    en curso, la fila se queda y el INSERT falla con IntegrityError.
+    """
+    modelo, en_curso, _ = _GENERACIONES[tipo]
+    en_curso_q = select(modelo.id).where(
+        modelo.id == SolicitudEnVuelo.objeto_id,
+        modelo.estado.in_(en_curso)
+    )
+    await db.execute(
+        delete(SolicitudEnVuelo)
+        .where(
+            SolicitudEnVuelo.user_id == user_id,
+            or_(
+                SolicitudEnVuelo.created_at < ahora_utc() - _RETENCION,
+                (SolicitudEnVuelo.clave == clave) & ~en_curso_q.exists()
+            )
+        )
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,131 @@
+"""
+Supervisor de tareas de fondo del proceso web
+
+Reemplaza los asyncio.create_task sueltos: las tareas entran a una cola y
+las ejecuta un número fijo de consumidores, así una ráfaga de solicitudes
+no lanza cientos de llamadas a la vez. En el shutdown se deja de aceptar
+trabajo, se espera a lo pendiente hasta un plazo y lo que no terminó se
+cancela y se devuelve a su estado persistente (al_abandonar) para que otro
+proceso lo retome.
+"""
+import asyncio
+from typing import Awaitable, Callable, List, Optional
+
+
+class _Tarea:
+    """Tarea encolada: qué ejecutar y cómo devolverla si no se completa"""
+
+    def __init__(
+        self,
+        descripcion: str,
+        funcion: Callable[[], Awaitable[None]],
+        al_abandonar: Optional[Callable[[], Awaitable[None]]] = None
+    ):
+        self.descripcion = descripcion
+        self.funcion = funcion
+        self.al_abandonar = al_abandonar
+
+
+class SupervisorTareas:
+    """Cola de tareas con concurrencia acotada y drenado en el shutdown"""
+
+    def __init__(self, nombre: str, concurrencia: int):
+        self.nombre = nombre
+        self.concurrencia = concurrencia
+        self._cola: Optional["asyncio.Queue[_Tarea]"] = None
+        self._consumidores: List[asyncio.Task] = []
+        self._aceptando = False
+
+        self.en_curso = 0
+        self.completadas = 0
+        self.fallidas = 0
+        self.abandonadas = 0
+        self.max_en_cola = 0
+
+    def iniciar(self):
+        """Arranca los consumidores (en el startup del lifespan)"""
+        self._cola = asyncio.Queue()
+        self._consumidores = [
+            asyncio.create_task(self._consumidor()) for _ in range(self.concurrencia)
+        ]
+        self._aceptando = True
+
+    def enviar(
+        self,
+        descripcion: str,
+        funcion: Callable[[], Awaitable[None]],
+        al_abandonar: Optional[Callable[[], Awaitable[None]]] = None
+    ):
+        """
+        Encola una tarea. funcion() y al_abandonar() se llaman sin argumentos
+        (usar lambda o functools.partial para pasarlos).
+        """
+        if not self._aceptando:
+            raise RuntimeError(f"El supervisor {self.nombre} no acepta tareas")
+        self._cola.put_nowait(_Tarea(descripcion, funcion, al_abandonar))
+        self.max_en_cola = max(self.max_en_cola, self._cola.qsize())
+
+    async def detener(self, plazo: float):
+        """
+        Drena la cola hasta `plazo` segundos; lo que no terminó se cancela
+        y se abandona (vuelve a su estado persistente).
+        """
+        if self._cola is None:
+            return
+        self._aceptando = False
+
+        try:
+            await asyncio.wait_for(self._cola.join(), timeout=plazo)
+        except asyncio.TimeoutError:
+            print(
+                f"[TAREAS] {self.nombre}: plazo de drenado agotado "
+                f"({self.en_curso} en curso, {self._cola.qsize()} en cola)"
+            )
+
+        for consumidor in self._consumidores:
+            consumidor.cancel()
+        await asyncio.gather(*self._consumidores, return_exceptions=True)
+
+        while not self._cola.empty():
+            await self._abandonar(self._cola.get_nowait())
+
+        if self.abandonadas:
+            print(f"[TAREAS] {self.nombre}: {self.abandonadas} tareas devueltas para reanudarse")
+
+    async def _consumidor(self):
+        while True:
+            tarea = await self._cola.get()
+            self.en_curso += 1
+            try:
+                await tarea.funcion()
+                self.completadas += 1
+            except asyncio.CancelledError:
+                await self._abandonar(tarea)
+                raise
+            except Exception as e:
+                self.fallidas += 1
+                print(f"[TAREAS] {self.nombre}: error en {tarea.descripcion}: {e}")
+            finally:
+                self.en_curso -= 1
+                self._cola.task_done()
+
+    async def _abandonar(self, tarea: _Tarea):
+        self.abandonadas += 1
+        if tarea.al_abandonar is None:
+            return
+        try:
+            await tarea.al_abandonar()
+        except Exception as e:
+            print(f"[TAREAS] {self.nombre}: no se pudo devolver {tarea.descripcion}: {e}")
+
+    def metricas(self) -> dict:
+        """Profundidad de la cola y contadores (por proceso)"""
+        return {
+            "concurrencia": self.concurrencia,
+            "en_cola": self._cola.qsize() if self._cola else 0,
+            "max_en_cola": self.max_en_cola,
+            "en_curso": self.en_curso,
+            "completadas": self.completadas,
+            "fallidas": self.fallidas,
+            "abandonadas": self.abandonadas
+        }
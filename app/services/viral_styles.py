@@ -235,46 +235,26 @@ def obtener_todos_estilos(categoria: str = None) -> list:
     return estilos
 
 
-def construir_prompt_imagen(
-    estilo_id: str,
+def _brief_producto(
     nombre_producto: str,
     descripcion_producto: str,
     marca: str = None,
-    precio: str = None,
-    tiene_logo: bool = False
+    precio: str = None
 ) -> str:
-    """
-    Construye el prompt maestro para generación de imagen
-    basado en el estilo seleccionado
-    """
-    style = obtener_estilo(estilo_id)
-
-    # Instrucciones de logo
-    if tiene_logo:
-        instruccion_logo = """### LOGO OFICIAL (Imagen del logo proporcionada)
-- INTEGRACIÓN FÍSICA OBLIGATORIA: El logo debe estar FABRICADO en la escena.
-- Opciones: grabado en metal, bordado en tela, neón real, tallado en madera, impreso en material del producto.
-- PROHIBIDO: Logo flotando, pegado digitalmente, o sobrepuesto como watermark."""
-    else:
-        instruccion_logo = """### LOGO (Crear tipográfico si hay marca)
-- Diseña logotipo elegante usando el nombre de la marca.
-- Debe estar físicamente integrado en un material de la escena."""
-
-    prompt = f"""
-##############################################
-#  SISTEMA DE GENERACIÓN VIRAL              #
-##############################################
-
-### BRIEF DEL PRODUCTO
+    """Datos del producto comunes a los prompts de imagen"""
+    return f"""### BRIEF DEL PRODUCTO
 - **Producto:** {nombre_producto}
 - **Descripción:** {descripcion_producto or 'No especificada'}
 - **Marca:** {marca or 'No especificada'}
 - **Precio:** {precio or 'No especificado'}
 
-REGLA DE ORO: Si se proporciona precio, inclúyelo en el image_prompt como texto creativo formado de materiales. Si NO se proporciona precio, NO inventes uno.
+REGLA DE ORO: Si se proporciona precio, inclúyelo en el image_prompt como texto creativo formado de materiales. Si NO se proporciona precio, NO inventes uno."""
 
---------------------------------------------------
-### ESTILO VISUAL: {style['nombre'].upper()}
+
+def _bloque_estilo(style: dict, titulo: str) -> str:
+    """Especificaciones visuales de un estilo"""
+    return f"""--------------------------------------------------
+### {titulo}
 --------------------------------------------------
 
 **CÁMARA:**
@@ -290,9 +270,22 @@ REGLA DE ORO: Si se proporciona precio, inclúyelo en el image_prompt como texto
 {style['vfx']}
 
 **MOOD/EMOCIÓN:**
-{style['mood']}
+{style['mood']}"""
 
---------------------------------------------------
+
+def _reglas_produccion(tiene_logo: bool) -> str:
+    """Reglas cinematográficas e instrucciones de logo"""
+    if tiene_logo:
+        instruccion_logo = """### LOGO OFICIAL (Imagen del logo proporcionada)
+- INTEGRACIÓN FÍSICA OBLIGATORIA: El logo debe estar FABRICADO en la escena.
+- Opciones: grabado en metal, bordado en tela, neón real, tallado en madera, impreso en material del producto.
+- PROHIBIDO: Logo flotando, pegado digitalmente, o sobrepuesto como watermark."""
+    else:
+        instruccion_logo = """### LOGO (Crear tipográfico si hay marca)
+- Diseña logotipo elegante usando el nombre de la marca.
+- Debe estar físicamente integrado en un material de la escena."""
+
+    return f"""--------------------------------------------------
 ### REGLAS DE PRODUCCIÓN CINEMATOGRÁFICA
 --------------------------------------------------
 
@@ -312,29 +305,152 @@ REGLA DE ORO: Si se proporciona precio, inclúyelo en el image_prompt como texto
 - Punto focal inmediatamente claro.
 - Contraste dramático figura-fondo.
 - Detalle que recompense el zoom.
-- Aspecto ratio: 1:1 (optimizado para Instagram/Facebook).
+- Aspecto ratio: 1:1 (optimizado para Instagram/Facebook)."""
+
+
+# Formato del copy de redes (se inserta dentro del JSON de salida)
+_JSON_COPY = """"facebook": {
+    "copy": "Texto para Facebook en español mexicano (máx 280 chars). Solo hablar del producto.",
+    "hashtags": ["#relevante1", "#relevante2", "#viral"]
+  },
+  "instagram": {
+    "copy": "Texto para Instagram en español mexicano (máx 150 chars).",
+    "hashtags": ["#insta1", "#insta2", "#aesthetic"]
+  }"""
+
+_REGLAS_COPY = """IMPORTANTE PARA COPY DE REDES:
+- PROHIBIDO mencionar estilos visuales, fotografía o la imagen en el copy
+- El copy debe hablar SOLO del PRODUCTO REAL: sabor, beneficios, características
+- Tono: natural, atractivo, directo. Como lo escribiría el dueño del negocio."""
+
+
+def construir_prompt_imagen(
+    estilo_id: str,
+    nombre_producto: str,
+    descripcion_producto: str,
+    marca: str = None,
+    precio: str = None,
+    tiene_logo: bool = False
+) -> str:
+    """
+    Construye el prompt maestro para generación de imagen
+    basado en el estilo seleccionado
+    """
+    style = obtener_estilo(estilo_id)
+
+    prompt = f"""
+##############################################
+#  SISTEMA DE GENERACIÓN VIRAL              #
+##############################################
+
+{_brief_producto(nombre_producto, descripcion_producto, marca, precio)}
+
+{_bloque_estilo(style, f"ESTILO VISUAL: {style['nombre'].upper()}")}
+
+{_reglas_produccion(tiene_logo)}
 
 --------------------------------------------------
 ### OUTPUT REQUERIDO (JSON)
 --------------------------------------------------
 ```json
 {{
-  "image_prompt": "Prompt detallado en INGLÉS para generación de imagen. Incluir: estilo visual, cámara, iluminación, ambiente. Mínimo 100 palabras.",
-  "facebook": {{
-    "copy": "Texto para Facebook en español mexicano (máx 280 chars). SIN mencionar el estilo visual, solo hablar del producto.",
-    "hashtags": ["#relevante1", "#relevante2", "#viral"]
+  "image_prompt": "Prompt detallado en INGLÉS para generación de imagen. Incluir: estilo visual, cámara, iluminación, ambiente. Mínimo 100 palabras."
+}}
+```
+"""
+
+    return prompt
+
+
+def construir_prompt_copy(
+    nombre_producto: str,
+    descripcion_producto: str,
+    marca: str = None,
+    precio: str = None
+) -> str:
+    """
+    Construye el prompt para el copy de redes sociales.
+    No depende del estilo: se genera en paralelo con la imagen.
+    """
+    prompt = f"""
+##############################################
+#  COPY PARA REDES SOCIALES                  #
+##############################################
+
+### BRIEF DEL PRODUCTO (ver imagen adjunta)
+- **Producto:** {nombre_producto}
+- **Descripción:** {descripcion_producto or 'No especificada'}
+- **Marca:** {marca or 'No especificada'}
+- **Precio:** {precio or 'No especificado'}
+
+Si se proporciona precio puedes mencionarlo. Si NO se proporciona precio, NO inventes uno.
+
+--------------------------------------------------
+### OUTPUT REQUERIDO (JSON)
+--------------------------------------------------
+```json
+{{
+  {_JSON_COPY}
+}}
+```
+
+{_REGLAS_COPY}
+"""
+
+    return prompt
+
+
+def construir_prompt_lote(
+    estilo_ids: list,
+    nombre_producto: str,
+    descripcion_producto: str,
+    marca: str = None,
+    precio: str = None,
+    tiene_logo: bool = False
+) -> str:
+    """
+    Construye un solo prompt para varios estilos del mismo producto:
+    un image_prompt por estilo más el copy de redes, en una sola llamada.
+    """
+    bloques = "\n\n".join(
+        _bloque_estilo(
+            obtener_estilo(estilo_id),
+            f"ESTILO VISUAL {n}: {obtener_estilo(estilo_id)['nombre'].upper()} (id: {estilo_id})"
+        )
+        for n, estilo_id in enumerate(estilo_ids, start=1)
+    )
+    claves = ",\n    ".join(
+        f'"{estilo_id}": "Prompt detallado en INGLÉS para el estilo {estilo_id}. Mínimo 100 palabras."'
+        for estilo_id in estilo_ids
+    )
+
+    prompt = f"""
+##############################################
+#  SISTEMA DE GENERACIÓN VIRAL (VARIOS ESTILOS) #
+##############################################
+
+{_brief_producto(nombre_producto, descripcion_producto, marca, precio)}
+
+Genera un image_prompt INDEPENDIENTE para cada uno de los {len(estilo_ids)} estilos siguientes.
+Cada prompt debe aplicar solo las especificaciones de su estilo.
+
+{bloques}
+
+{_reglas_produccion(tiene_logo)}
+
+--------------------------------------------------
+### OUTPUT REQUERIDO (JSON)
+--------------------------------------------------
+```json
+{{
+  "image_prompts": {{
+    {claves}
   }},
-  "instagram": {{
-    "copy": "Texto para Instagram en español mexicano (máx 150 chars). SIN mencionar el estilo visual.",
-    "hashtags": ["#insta1", "#insta2", "#aesthetic"]
-  }}
+  {_JSON_COPY}
 }}
 ```
 
-IMPORTANTE PARA COPY DE REDES:
-- PROHIBIDO mencionar el estilo visual en el copy
-- El copy debe hablar SOLO del PRODUCTO REAL: sabor, beneficios, características
-- Tono: natural, atractivo, directo. Como lo escribiría el dueño del negocio.
+{_REGLAS_COPY}
 """
 
     return prompt
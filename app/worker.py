@@ -0,0 +1,169 @@
+"""
+ViralPost AI - Worker de generación de imágenes
+
+Procesa la cola persistente (generation_jobs) fuera de los workers de uvicorn,
+de modo que la capacidad de la API y la de generación escalen por separado.
+
+Uso:
+    python -m app.worker
+    python -m app.worker --concurrencia 8
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import uuid
+from typing import Dict, List
+
+from app.core.config import settings
+from app.core.database import init_db, close_db, async_session_maker
+from app.services.http_clients import clientes_upstream
+from app.services.generation import generation_service
+from app.services.image_pipeline import cerrar_pool
+from app.services.jobs import (
+    reclamar_trabajo,
+    reclamar_lote,
+    ejecutar_trabajo,
+    ejecutar_lote,
+    registrar_heartbeat,
+    devolver_a_cola,
+    recuperar_trabajos_huerfanos
+)
+
+
+class Worker:
+    """Reclama y ejecuta trabajos de generación con concurrencia acotada"""
+
+    def __init__(self, concurrencia: int):
+        self.id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.concurrencia = concurrencia
+        self.en_curso: Dict[int, asyncio.Task] = {}
+        self._detener = asyncio.Event()
+
+    def detener(self):
+        """Deja de reclamar trabajos nuevos (SIGTERM/SIGINT)"""
+        print(f"[WORKER] {self.id} deteniéndose...")
+        self._detener.set()
+
+    async def ejecutar(self):
+        """Loop principal del worker"""
+        await init_db()
+        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+        os.makedirs(settings.GENERATED_DIR, exist_ok=True)
+
+        await clientes_upstream.iniciar()
+        generation_service.usar_clientes(clientes_upstream)
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.detener)
+
+        heartbeat = asyncio.create_task(self._latir())
+        print(f"[WORKER] {self.id} iniciado (concurrencia={self.concurrencia})")
+
+        try:
+            while not self._detener.is_set():
+                async with async_session_maker() as db:
+                    recuperados = await recuperar_trabajos_huerfanos(db)
+                    if recuperados:
+                        print(f"[WORKER] {recuperados} trabajos huérfanos recuperados")
+
+                # Llenar los espacios libres
+                reclamado = False
+                while len(self.en_curso) < self.concurrencia and not self._detener.is_set():
+                    # Reclamo, hermanos del lote y PROCESANDO: un solo commit
+                    async with async_session_maker() as db:
+                        trabajo_id = await reclamar_trabajo(db, self.id)
+                        if trabajo_id is None:
+                            break
+                        trabajo_ids = await reclamar_lote(db, self.id, trabajo_id)
+                    reclamado = True
+                    self._lanzar(trabajo_ids)
+
+                if not reclamado:
+                    await self._esperar(settings.WORKER_POLL_INTERVALO)
+        finally:
+            await self._drenar()
+            heartbeat.cancel()
+            cerrar_pool()
+            await clientes_upstream.cerrar()
+            await close_db()
+            print(f"[WORKER] {self.id} detenido")
+
+    def _lanzar(self, trabajo_ids: List[int]):
+        """
+        Ejecuta un trabajo (o un lote de trabajos hermanos) en su propia tarea.
+        Cada trabajo del lote ocupa un espacio de concurrencia.
+        """
+        if len(trabajo_ids) == 1:
+            tarea = asyncio.create_task(ejecutar_trabajo(trabajo_ids[0]))
+        else:
+            tarea = asyncio.create_task(ejecutar_lote(trabajo_ids))
+
+        for trabajo_id in trabajo_ids:
+            self.en_curso[trabajo_id] = tarea
+
+        def liberar(_tarea):
+            for trabajo_id in trabajo_ids:
+                self.en_curso.pop(trabajo_id, None)
+
+        tarea.add_done_callback(liberar)
+
+    async def _esperar(self, segundos: float):
+        """Duerme hasta el siguiente poll o hasta que se pida detener"""
+        try:
+            await asyncio.wait_for(self._detener.wait(), timeout=segundos)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _latir(self):
+        """Heartbeat periódico de los trabajos en curso"""
+        while True:
+            await asyncio.sleep(settings.TRABAJO_HEARTBEAT_SEGUNDOS)
+            try:
+                async with async_session_maker() as db:
+                    await registrar_heartbeat(db, self.id, list(self.en_curso.keys()))
+            except Exception as e:
+                print(f"[WORKER] Error en heartbeat: {e}")
+
+    async def _drenar(self):
+        """
+        Espera a los trabajos en curso hasta WORKER_DRAIN_SEGUNDOS.
+        Los que no terminan se cancelan y vuelven a la cola.
+        """
+        if not self.en_curso:
+            return
+
+        _, pendientes = await asyncio.wait(
+            set(self.en_curso.values()),
+            timeout=settings.WORKER_DRAIN_SEGUNDOS
+        )
+        if not pendientes:
+            return
+
+        interrumpidos = [tid for tid, tarea in self.en_curso.items() if tarea in pendientes]
+        for tarea in pendientes:
+            tarea.cancel()
+        await asyncio.gather(*pendientes, return_exceptions=True)
+
+        async with async_session_maker() as db:
+            await devolver_a_cola(db, self.id, interrumpidos)
+        print(f"[WORKER] {len(interrumpidos)} trabajos devueltos a la cola")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de generación de ViralPost AI")
+    parser.add_argument(
+        "--concurrencia",
+        type=int,
+        default=settings.WORKER_CONCURRENCIA,
+        help="Generaciones simultáneas en este proceso"
+    )
+    args = parser.parse_args()
+
+    asyncio.run(Worker(args.concurrencia).ejecutar())
+
+
+if __name__ == "__main__":
+    main()
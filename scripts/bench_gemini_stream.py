@@ -0,0 +1,125 @@
+"""
+Benchmark: memoria al recibir la imagen de Gemini con N generaciones concurrentes
+
+Compara la ruta anterior (response.json() sobre todo el cuerpo -> string
+base64 -> b64decode -> escribir) contra la actual (ExtractorBase64
+decodificando inlineData.data por bloques directo al archivo).
+
+La respuesta se simula por bloques de 64 KB, intercalando las generaciones
+como lo haría el event loop con respuestas reales. Cada modo corre en un
+subproceso limpio y el pico se mide con tracemalloc a partir de que el
+cuerpo simulado ya existe (solo cuenta lo que asigna cada modo).
+
+Uso:
+    python scripts/bench_gemini_stream.py --concurrencia 50 --mb 3
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import tracemalloc
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BLOQUE_RED = 64 * 1024
+
+
+def respuesta_gemini(mb: int) -> bytes:
+    """Cuerpo con la forma de generateContent: texto + imagen en inlineData"""
+    imagen = base64.b64encode(os.urandom(mb * 1024 * 1024)).decode("ascii")
+    return json.dumps({
+        "candidates": [{
+            "content": {"parts": [
+                {"text": "Here is the generated image."},
+                {"inlineData": {"mimeType": "image/png", "data": imagen}}
+            ]},
+            "finishReason": "STOP"
+        }],
+        "usageMetadata": {"promptTokenCount": 812, "candidatesTokenCount": 1290}
+    }).encode("utf-8")
+
+
+async def flujo(cuerpo: bytes):
+    """Simula response.aiter_bytes()"""
+    for i in range(0, len(cuerpo), BLOQUE_RED):
+        yield cuerpo[i:i + BLOQUE_RED]
+        await asyncio.sleep(0)
+
+
+async def generacion_antes(cuerpo: bytes, destino: str, espera: asyncio.Event):
+    bloques = [bloque async for bloque in flujo(cuerpo)]
+    contenido = b"".join(bloques)                            # response.read()
+    data = json.loads(contenido)                             # response.json()
+    imagen_b64 = data["candidates"][0]["content"]["parts"][1]["inlineData"]["data"]
+    await espera.wait()                                      # El worker mantiene todo vivo
+    with open(destino, "wb") as f:
+        f.write(base64.b64decode(imagen_b64))                # guardar_imagen
+
+
+async def generacion_despues(cuerpo: bytes, destino: str, espera: asyncio.Event):
+    from app.services.json_stream import ExtractorBase64
+
+    extractor = ExtractorBase64(frozenset({"inlineData", "inline_data"}), "data")
+    with open(destino, "wb") as f:
+        async for bloque in flujo(cuerpo):
+            for datos in extractor.procesar(bloque):
+                f.write(datos)
+        f.write(extractor.terminar())
+    await espera.wait()
+    assert extractor.completo
+
+
+async def correr(modo: str, concurrencia: int, mb: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        # El cuerpo simulado es compartido: solo cuenta lo que cada modo asigna
+        cuerpo = respuesta_gemini(mb)
+
+        tracemalloc.start()
+        espera = asyncio.Event()
+        funcion = generacion_antes if modo == "antes" else generacion_despues
+        tareas = [
+            asyncio.create_task(funcion(cuerpo, os.path.join(tmp, f"{i}.png"), espera))
+            for i in range(concurrencia)
+        ]
+        await asyncio.sleep(0.5)
+        espera.set()
+        await asyncio.gather(*tareas)
+
+        _, pico_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        pico = pico_bytes / (1024 * 1024)
+        return {
+            "modo": modo,
+            "pico_mb": round(pico, 1),
+            "mb_por_generacion": round(pico / concurrencia, 2)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrencia", type=int, default=50)
+    parser.add_argument("--mb", type=int, default=3, help="Tamaño de la imagen generada")
+    parser.add_argument("--modo", choices=["antes", "despues"])
+    args = parser.parse_args()
+
+    if args.modo:
+        print(json.dumps(asyncio.run(correr(args.modo, args.concurrencia, args.mb))))
+        return
+
+    print(f"Imagen de {args.mb} MB, {args.concurrencia} generaciones concurrentes\n")
+    for modo in ("antes", "despues"):
+        salida = subprocess.run(
+            [sys.executable, __file__, "--modo", modo,
+             "--concurrencia", str(args.concurrencia), "--mb", str(args.mb)],
+            capture_output=True, text=True, check=True
+        )
+        r = json.loads(salida.stdout)
+        print(f"{r['modo']:>8}: pico {r['pico_mb']:8.1f} MB  |  {r['mb_por_generacion']:6.2f} MB por generación")
+
+
+if __name__ == "__main__":
+    main()
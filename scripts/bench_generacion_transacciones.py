@@ -0,0 +1,252 @@
+"""
+Benchmark: transacciones del ciclo de una generación en SQLite
+
+Simula N solicitudes de generación concurrentes contra una base SQLite
+temporal (perfil de producción de app.core.database), de dos formas:
+
+- "antes": la API guarda los uploads con la transacción abierta (después
+  del primer INSERT, con el lock de escritura tomado) y el worker confirma
+  el reclamo, el PROCESANDO y el resultado en commits separados
+- "despues": los uploads se escriben antes de abrir la transacción; la API
+  hace un commit (generación + reserva + trabajo), el worker uno al
+  reclamar (trabajo + PROCESANDO) y uno al finalizar; la espera al upstream
+  no tiene ninguna sesión abierta
+
+Reporta ciclos/s, latencia p50/p99 de la respuesta de la API y cuántas
+operaciones fallaron con "database is locked".
+
+Uso:
+    python scripts/bench_generacion_transacciones.py --concurrencia 50 --upload-kb 512
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def poblar(usuarios: int):
+    from app.core.database import async_session_maker, init_db
+    from app.models import User
+
+    await init_db()
+    async with async_session_maker() as db:
+        nuevos = [
+            User(email=f"bench{i}@viralpost.local", nombre=f"Bench {i}", creditos=1000)
+            for i in range(usuarios)
+        ]
+        db.add_all(nuevos)
+        await db.commit()
+        return [u.id for u in nuevos]
+
+
+async def escribir_upload(directorio: str, user_id: int, datos: bytes) -> str:
+    ruta = os.path.join(directorio, f"{user_id}_original_{uuid.uuid4().hex[:8]}.jpg")
+
+    def escribir():
+        with open(ruta, "wb") as f:
+            f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+
+    await asyncio.to_thread(escribir)
+    return ruta
+
+
+def nueva_generacion(user_id: int, ruta=None):
+    from app.models import Generation
+
+    return Generation(
+        user_id=user_id,
+        nombre_producto="Producto",
+        descripcion_producto="Descripción",
+        marca="Marca",
+        estilo="neon_noir",
+        imagen_producto_path=ruta,
+        estado="pendiente"
+    )
+
+
+async def crear_antes(user_id: int, directorio: str, datos: bytes) -> int:
+    """API anterior: upload en disco con la transacción de escritura abierta"""
+    from app.core.database import async_session_maker
+    from app.models import User
+    from app.services.creditos import reservar_creditos
+    from app.services.jobs import encolar_generacion
+
+    async with async_session_maker() as db:
+        usuario = await db.get(User, user_id)
+        generacion = nueva_generacion(user_id)
+        db.add(generacion)
+        await db.flush()
+        await reservar_creditos(db, usuario, "imagen", [generacion.id])
+
+        generacion.imagen_producto_path = await escribir_upload(directorio, user_id, datos)
+        trabajo = encolar_generacion(db, generacion, {"imagen_path": generacion.imagen_producto_path})
+        await db.commit()
+        return trabajo.id
+
+
+async def crear_despues(user_id: int, directorio: str, datos: bytes) -> int:
+    """API actual: upload primero, luego una transacción corta"""
+    from app.core.database import async_session_maker
+    from app.models import User
+    from app.services.creditos import reservar_creditos
+    from app.services.jobs import encolar_generacion
+
+    ruta = await escribir_upload(directorio, user_id, datos)
+    async with async_session_maker() as db:
+        usuario = await db.get(User, user_id)
+        generacion = nueva_generacion(user_id, ruta)
+        db.add(generacion)
+        await db.flush()
+        await reservar_creditos(db, usuario, "imagen", [generacion.id])
+        trabajo = encolar_generacion(db, generacion, {"imagen_path": ruta})
+        await db.commit()
+        return trabajo.id
+
+
+async def _reclamar(db, trabajo_id: int):
+    from sqlalchemy import update
+
+    from app.core.database import ahora_utc
+    from app.models import GenerationJob
+
+    await db.execute(
+        update(GenerationJob)
+        .where(GenerationJob.id == trabajo_id, GenerationJob.estado == "pendiente")
+        .values(estado="en_proceso", worker_id="bench", intentos=GenerationJob.intentos + 1,
+                started_at=ahora_utc(), heartbeat_at=ahora_utc())
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _finalizar(db, trabajo_id: int):
+    from app.models import Generation, GenerationJob
+    from app.services.jobs import _aplicar_resultado
+
+    trabajo = await db.get(GenerationJob, trabajo_id)
+    generacion = await db.get(Generation, trabajo.generation_id)
+    await _aplicar_resultado(db, trabajo, generacion, {
+        "exito": True,
+        "imagen_path": f"/tmp/{generacion.id}_0a1b2c3d.png",
+        "tiempos": {}
+    }, "bench")
+
+
+async def procesar_antes(trabajo_id: int, upstream_s: float):
+    """Worker anterior: reclamo, PROCESANDO y resultado en commits separados"""
+    from app.core.database import async_session_maker
+    from app.models import Generation, GenerationJob
+
+    async with async_session_maker() as db:
+        await _reclamar(db, trabajo_id)
+        await db.commit()
+
+    async with async_session_maker() as db:
+        trabajo = await db.get(GenerationJob, trabajo_id)
+        generacion = await db.get(Generation, trabajo.generation_id)
+        generacion.estado = "procesando"
+        await db.commit()
+
+        await asyncio.sleep(upstream_s)
+
+        await _finalizar(db, trabajo_id)
+        await db.commit()
+
+
+async def procesar_despues(trabajo_id: int, upstream_s: float):
+    """Worker actual: reclamo + PROCESANDO en un commit, upstream sin sesión, finalizar en otro"""
+    from app.core.database import async_session_maker
+    from app.services.jobs import reclamar_lote
+
+    async with async_session_maker() as db:
+        await _reclamar(db, trabajo_id)
+        await reclamar_lote(db, "bench", trabajo_id)
+
+    await asyncio.sleep(upstream_s)
+
+    async with async_session_maker() as db:
+        await _finalizar(db, trabajo_id)
+        await db.commit()
+
+
+async def correr_modo(modo: str, user_ids, directorio: str, datos: bytes, upstream_s: float) -> dict:
+    from sqlalchemy.exc import OperationalError
+
+    crear = crear_antes if modo == "antes" else crear_despues
+    procesar = procesar_antes if modo == "antes" else procesar_despues
+
+    latencias = []
+    bloqueos = 0
+    completados = 0
+
+    async def ciclo(user_id: int):
+        nonlocal bloqueos, completados
+        try:
+            inicio = time.perf_counter()
+            trabajo_id = await crear(user_id, directorio, datos)
+            latencias.append(time.perf_counter() - inicio)
+            await procesar(trabajo_id, upstream_s)
+            completados += 1
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            bloqueos += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(ciclo(uid) for uid in user_ids))
+    segundos = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "modo": modo,
+        "ciclos_por_s": completados / segundos,
+        "p50_ms": statistics.median(latencias) * 1000 if latencias else 0,
+        "p99_ms": latencias[int(len(latencias) * 0.99) - 1] * 1000 if latencias else 0,
+        "bloqueos": bloqueos
+    }
+
+
+async def correr(concurrencia: int, rondas: int, upload_kb: int, upstream_ms: int, directorio: str):
+    user_ids = await poblar(concurrencia)
+    datos = os.urandom(upload_kb * 1024)
+    print(f"{concurrencia} solicitudes concurrentes x {rondas} rondas, upload {upload_kb} KB, upstream {upstream_ms} ms\n")
+
+    for modo in ("antes", "despues"):
+        resultados = [
+            await correr_modo(modo, user_ids, directorio, datos, upstream_ms / 1000)
+            for _ in range(rondas)
+        ]
+        print(
+            f"{modo:>8}: {statistics.mean(r['ciclos_por_s'] for r in resultados):8.1f} ciclos/s  |  "
+            f"API p50 {statistics.mean(r['p50_ms'] for r in resultados):7.1f} ms  "
+            f"p99 {statistics.mean(r['p99_ms'] for r in resultados):7.1f} ms  |  "
+            f"{sum(r['bloqueos'] for r in resultados)} 'database is locked'"
+        )
+
+    from app.core.database import close_db
+    await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrencia", type=int, default=50)
+    parser.add_argument("--rondas", type=int, default=3)
+    parser.add_argument("--upload-kb", type=int, default=512)
+    parser.add_argument("--upstream-ms", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Antes de importar app: el motor se crea con esta URL
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        asyncio.run(correr(args.concurrencia, args.rondas, args.upload_kb, args.upstream_ms, tmp))
+
+
+if __name__ == "__main__":
+    main()
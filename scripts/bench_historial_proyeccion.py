@@ -0,0 +1,160 @@
+"""
+Benchmark: lectura del historial con entidades ORM vs columnas proyectadas
+
+Crea una base SQLite temporal con un usuario y N generaciones con textos
+largos (prompt, descripción, copies) y recorre todo su historial página por
+página con el cursor de app.services.paginacion, de dos formas:
+
+- "entidades": select(Generation) (la ruta anterior: todas las columnas,
+  identity map y estado ORM por fila)
+- "proyeccion": select(*COLUMNAS_HISTORIAL) (la ruta actual)
+
+Para cada modo reporta filas/s y el pico de memoria asignada (tracemalloc)
+al leer cada página y construir las GeneracionResponse.
+
+Uso:
+    python scripts/bench_historial_proyeccion.py --filas 20000 --por-pagina 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEXTO_LARGO = 2000  # caracteres de prompt/descripción por fila
+
+
+def texto(n: int) -> str:
+    return "".join(random.choices(string.ascii_letters + " ", k=n))
+
+
+async def poblar(filas: int):
+    from app.core.database import async_session_maker, init_db
+    from app.models import User, Generation
+
+    await init_db()
+    async with async_session_maker() as db:
+        usuario = User(email="bench@viralpost.local", nombre="Bench", creditos=0)
+        db.add(usuario)
+        await db.flush()
+
+        lote = []
+        for i in range(filas):
+            lote.append(Generation(
+                user_id=usuario.id,
+                nombre_producto=f"Producto {i}",
+                descripcion_producto=texto(TEXTO_LARGO),
+                marca="Marca",
+                estilo="neon_noir",
+                imagen_producto_path=f"/tmp/uploads/{i}.jpg",
+                imagen_generada_path=f"/tmp/generated/{i}_0a1b2c3d.png",
+                prompt_generado=texto(TEXTO_LARGO),
+                copy_facebook=texto(300),
+                hashtags_facebook=["#viral", "#producto"],
+                copy_instagram=texto(300),
+                hashtags_instagram=["#viral", "#insta"],
+                estado="completada"
+            ))
+            if len(lote) == 1000:
+                db.add_all(lote)
+                await db.flush()
+                lote = []
+        db.add_all(lote)
+        await db.commit()
+        return usuario.id
+
+
+async def recorrer(modo: str, user_id: int, por_pagina: int) -> dict:
+    from pathlib import Path
+
+    from sqlalchemy import select
+
+    from app.api.generation import COLUMNAS_HISTORIAL
+    from app.api.schemas import GeneracionResponse
+    from app.core.database import async_session_maker
+    from app.models import Generation
+    from app.services.paginacion import paginar, recortar_pagina
+
+    base = select(Generation) if modo == "entidades" else select(*COLUMNAS_HISTORIAL)
+    base = base.where(Generation.user_id == user_id)
+
+    filas = 0
+    cursor = None
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    while True:
+        # Una sesión por página, como cada request
+        async with async_session_maker() as db:
+            result = await db.execute(paginar(base, Generation, cursor, por_pagina))
+            pagina = result.scalars().all() if modo == "entidades" else result.all()
+            pagina, cursor = recortar_pagina(pagina, por_pagina)
+            respuestas = [
+                GeneracionResponse(
+                    id=g.id,
+                    estado=g.estado,
+                    imagen_url=f"/viralpost/imagenes/{Path(g.imagen_generada_path).name}" if g.imagen_generada_path else None,
+                    copy_facebook=g.copy_facebook,
+                    hashtags_facebook=g.hashtags_facebook,
+                    copy_instagram=g.copy_instagram,
+                    hashtags_instagram=g.hashtags_instagram,
+                    estilo=g.estilo,
+                    created_at=g.created_at,
+                    completed_at=g.completed_at
+                )
+                for g in pagina
+            ]
+            filas += len(respuestas)
+        if cursor is None:
+            break
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "modo": modo,
+        "filas": filas,
+        "filas_por_s": filas / segundos,
+        "pico_kb": pico / 1024,
+        "kb_por_fila": pico / 1024 / min(filas, por_pagina)
+    }
+
+
+async def correr(filas: int, por_pagina: int):
+    user_id = await poblar(filas)
+    print(f"{filas} generaciones, páginas de {por_pagina}\n")
+
+    resultados = []
+    for modo in ("entidades", "proyeccion", "entidades", "proyeccion"):
+        resultados.append(await recorrer(modo, user_id, por_pagina))
+
+    # Se reporta la segunda pasada de cada modo (caché de SQLite ya caliente)
+    for r in resultados[2:]:
+        print(
+            f"{r['modo']:>11}: {r['filas_por_s']:10.0f} filas/s  |  "
+            f"pico {r['pico_kb']:8.1f} KB  |  {r['kb_por_fila']:5.2f} KB por fila de la página"
+        )
+
+    from app.core.database import close_db
+    await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=20000)
+    parser.add_argument("--por-pagina", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Antes de importar app: el motor se crea con esta URL
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        asyncio.run(correr(args.filas, args.por_pagina))
+
+
+if __name__ == "__main__":
+    main()
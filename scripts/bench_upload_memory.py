@@ -0,0 +1,125 @@
+"""
+Benchmark: RSS máximo por generación concurrente en la ruta de upload
+
+Compara la ruta anterior (upload completo en memoria -> base64 str ->
+decodificar para guardar -> json.dumps para OpenAI y Gemini) contra la
+actual (upload copiado a disco por bloques y base64 codificado en streaming
+al enviar cada petición).
+
+Cada modo corre en un subproceso limpio para medir su pico de memoria.
+
+Uso:
+    python scripts/bench_upload_memory.py --concurrencia 20 --mb 8
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BLOQUE = 1024 * 1024
+
+
+def rss_max_mb() -> float:
+    """RSS máximo del proceso actual (Linux reporta KB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def consumir(cuerpo) -> int:
+    """Simula el envío de la petición (httpx leyendo el cuerpo)"""
+    total = 0
+    if isinstance(cuerpo, bytes):
+        return len(cuerpo)
+    async for bloque in cuerpo:
+        total += len(bloque)
+    return total
+
+
+async def generacion_antes(origen: str, destino: str, espera: asyncio.Event):
+    with open(origen, "rb") as f:
+        imagen_bytes = f.read()                                   # UploadFile.read()
+    imagen_b64 = base64.b64encode(imagen_bytes).decode("ascii")   # copia base64 (str)
+    with open(destino, "wb") as f:
+        f.write(base64.b64decode(imagen_b64))                     # guardar_imagen decodifica de vuelta
+
+    openai = json.dumps({"url": f"data:image/jpeg;base64,{imagen_b64}"}).encode()
+    await consumir(openai)
+    gemini = json.dumps({"inline_data": {"data": imagen_b64}}).encode()
+    await consumir(gemini)
+
+    await espera.wait()  # El request mantiene todo vivo hasta terminar
+
+
+async def generacion_despues(origen: str, destino: str, espera: asyncio.Event):
+    from app.services.json_stream import cuerpo_json_base64, marcador
+
+    with open(origen, "rb") as entrada, open(destino, "wb") as salida:
+        while bloque := entrada.read(BLOQUE):                     # guardar_upload por bloques
+            salida.write(bloque)
+
+    with open(destino, "rb") as f:
+        imagen = f.read()                                         # worker (peor caso: sin reducir)
+
+    _, openai = cuerpo_json_base64({"url": f"data:image/jpeg;base64,{marcador('imagen')}"}, {"imagen": imagen})
+    await consumir(openai())
+    _, gemini = cuerpo_json_base64({"inline_data": {"data": marcador("imagen")}}, {"imagen": imagen})
+    await consumir(gemini())
+
+    await espera.wait()
+
+
+async def correr(modo: str, concurrencia: int, mb: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        origen = os.path.join(tmp, "upload.jpg")
+        with open(origen, "wb") as f:
+            f.write(os.urandom(mb * 1024 * 1024))
+
+        base = rss_max_mb()
+        espera = asyncio.Event()
+        funcion = generacion_antes if modo == "antes" else generacion_despues
+        tareas = [
+            asyncio.create_task(funcion(origen, os.path.join(tmp, f"{i}.jpg"), espera))
+            for i in range(concurrencia)
+        ]
+        await asyncio.sleep(0.5)
+        espera.set()
+        await asyncio.gather(*tareas)
+
+        pico = rss_max_mb() - base
+        return {
+            "modo": modo,
+            "pico_mb": round(pico, 1),
+            "mb_por_generacion": round(pico / concurrencia, 2)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrencia", type=int, default=20)
+    parser.add_argument("--mb", type=int, default=8, help="Tamaño de la imagen subida")
+    parser.add_argument("--modo", choices=["antes", "despues"])
+    args = parser.parse_args()
+
+    if args.modo:
+        print(json.dumps(asyncio.run(correr(args.modo, args.concurrencia, args.mb))))
+        return
+
+    print(f"Imagen de {args.mb} MB, {args.concurrencia} generaciones concurrentes\n")
+    for modo in ("antes", "despues"):
+        salida = subprocess.run(
+            [sys.executable, __file__, "--modo", modo,
+             "--concurrencia", str(args.concurrencia), "--mb", str(args.mb)],
+            capture_output=True, text=True, check=True
+        )
+        r = json.loads(salida.stdout)
+        print(f"{r['modo']:>8}: pico {r['pico_mb']:8.1f} MB  |  {r['mb_por_generacion']:6.2f} MB por generación")
+
+
+if __name__ == "__main__":
+    main()
@@ -54,12 +54,13 @@ nginx -t
 # 5. Copiar servicio de systemd
 echo -e "${YELLOW}[5/7] Configurando servicio systemd...${NC}"
 cp $PROJECT_DIR/viralpost.service /etc/systemd/system/
+cp $PROJECT_DIR/viralpost-worker.service /etc/systemd/system/
 systemctl daemon-reload
 
 # 6. Iniciar servicios
 echo -e "${YELLOW}[6/7] Iniciando servicios...${NC}"
-systemctl enable viralpost
-systemctl start viralpost
+systemctl enable viralpost viralpost-worker
+systemctl start viralpost viralpost-worker
 systemctl reload nginx
 
 # 7. Verificar estado
@@ -71,6 +72,12 @@ else
     echo "✗ Error al iniciar ViralPost"
     systemctl status viralpost
 fi
+if systemctl is-active --quiet viralpost-worker; then
+    echo -e "${GREEN}✓ Worker de generación está corriendo${NC}"
+else
+    echo "✗ Error al iniciar el worker de generación"
+    systemctl status viralpost-worker
+fi
 
 echo ""
 echo "=========================================="